@@ -29,6 +29,7 @@ __docformat__ = "restructuredtext en"
 # theano code, since this code may want to log some messages.
 import logging
 
+import importlib
 import sys
 
 def has_handlers(logger):
@@ -99,20 +100,52 @@ from theano.misc.safe_asarray import _asarray
 
 from theano.printing import pprint, pp
 
-from theano.scan_module import (scan, map, reduce, foldl, foldr, clone,
-                                scan_checkpoints)
-
 from theano.updates import OrderedUpdates
 
-# scan_module import above initializes tensor and scalar making these imports
-# redundant
-
-# import tensor
-# import scalar
-
-# we don't import by default as we don't want to force having scipy installed.
+import theano.tensor
+
+# Subpackages that are only needed by some graphs are imported the first
+# time one of these attributes is used. This keeps `import theano` fast and
+# avoids registering their optimizations in optdb when they are not used.
+# sparse is not imported by default as we don't want to force having scipy
+# installed.
+_lazy_attributes = {
+    'scan': ('theano.scan_module', 'scan'),
+    'map': ('theano.scan_module', 'map'),
+    'reduce': ('theano.scan_module', 'reduce'),
+    'foldl': ('theano.scan_module', 'foldl'),
+    'foldr': ('theano.scan_module', 'foldr'),
+    'clone': ('theano.scan_module', 'clone'),
+    'scan_checkpoints': ('theano.scan_module', 'scan_checkpoints'),
+    'scan_module': ('theano.scan_module', None),
+    'sparse': ('theano.sparse', None),
+}
+
+
+class _LazyModule(type(sys)):
+    """
+    Module type of `theano` that imports the `_lazy_attributes` on access.
 
-# import sparse
+    """
+    def __getattr__(self, name):
+        if name not in _lazy_attributes:
+            raise AttributeError("module 'theano' has no attribute %r" %
+                                 name)
+        module_name, attr = _lazy_attributes[name]
+        module = importlib.import_module(module_name)
+        value = module if attr is None else getattr(module, attr)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_lazy_attributes))
+
+if sys.version_info >= (3, 5):
+    sys.modules[__name__].__class__ = _LazyModule
+else:
+    # The class of a module can't be changed before Python 3.5.
+    from theano.scan_module import (scan, map, reduce, foldl, foldr, clone,
+                                    scan_checkpoints)
 
 from theano.gradient import Rop, Lop, grad, subgraph_grad
 
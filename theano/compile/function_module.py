@@ -5,8 +5,12 @@ Driver of graph construction, optimization, and linking.
 from __future__ import absolute_import, print_function, division
 
 import copy
+import hashlib
+import os
+import re
+import threading
 from six import string_types, iteritems, iterkeys
-from six.moves import xrange
+from six.moves import xrange, StringIO
 import six.moves.copyreg as copyreg
 import six.moves.cPickle as pickle
 from itertools import chain
@@ -23,7 +27,6 @@ import theano.compile.profiling
 from theano.compile.io import (
     In, SymbolicInput, SymbolicOutput)
 from theano.compile.ops import deep_copy_op, view_op
-from theano.gof.graph import is_same_graph
 from theano.gof.op import ops_with_inner_function
 
 import logging
@@ -31,6 +34,9 @@ _logger = logging.getLogger('theano.compile.function_module')
 
 __docformat__ = "restructuredtext en"
 
+# Increase this when the format of the optimized graph cache changes.
+optimization_cache_version = 1
+
 
 class UnusedInputError(Exception):
     """
@@ -218,6 +224,19 @@ class AliasedMemoryError(Exception):
 DUPLICATE = ['DUPLICATE']
 
 
+class _NoLock(object):
+    """
+    Context manager that does nothing, used in place of a lock.
+
+    """
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
 class Function(object):
     """
     Type of the functions returned by theano.function or
@@ -359,6 +378,21 @@ class Function(object):
 
     """
 
+    output_shapes_fn = None
+    """
+    Function of the inputs that returns the shapes of the outputs, compiled
+    at the first call with ``output_storage``, or False if it can't be.
+
+    """
+
+    profile_lock = _NoLock()
+    """
+    Context manager held while the profile is updated. It is a lock when
+    several functions that share the profile can run at the same time (see
+    `ReentrantFunction`).
+
+    """
+
     def __init__(self, fn, input_storage, output_storage, indices, outputs,
                  defaults, unpack_single, return_none, output_keys, maker):
         self.fn = fn
@@ -744,6 +778,21 @@ class Function(object):
             and processed. To disable the updates, you should use the ``copy``
             method with ``delete_updates=True``.
 
+            Keyword argument ``output_storage`` is a list with one numpy
+            array or None per output of the function, or a dict from keys of
+            the `output_keys` dict to arrays.  The value of each output
+            with an array is written into that array, which is returned in
+            place of a new one.  The arrays must have the dtype and the
+            number of dimensions of the outputs, must be writeable and must
+            not share memory with the inputs or with each other, and their
+            shapes are checked before the computation.  With a vm linker
+            whose ``reuse_outputs`` parameter is True (see the Theano flag
+            ``vm.reuse_outputs``), the outputs are computed directly into
+            the arrays when the ops that compute them support it (most
+            tensor ops do, as well as the copy made of the outputs that are
+            views of the inputs); the other outputs are copied into them
+            after the computation.
+
         Returns
         -------
         list
@@ -763,6 +812,7 @@ class Function(object):
         if output_subset is not None and self.output_keys is not None:
             output_subset =\
                 [self.output_keys.index(key) for key in output_subset]
+        output_storage = kwargs.pop('output_storage', None)
 
         # Reinitialize each container's 'provided' counter
         if self.trust_input:
@@ -877,6 +927,33 @@ class Function(object):
                         % getattr(self.inv_finder[c], 'variable',
                                   self.inv_finder[c]))
 
+        if output_storage is not None:
+            try:
+                output_storage = self._check_output_storage(output_storage)
+                self._check_output_shapes(output_storage)
+            except Exception:
+                restore_defaults()
+                raise
+            # Ops reuse the storage of the outputs.  We give them views of
+            # the arrays, as some ops resize the arrays they reuse when the
+            # shape is wrong, which numpy only allows on arrays that own
+            # their data.
+            output_views = [None if buf is None else buf.view()
+                            for buf in output_storage]
+            for o_container, view in zip(self.output_storage, output_views):
+                if view is not None:
+                    o_container.storage[0] = view
+            # The VM empties the storage of the outputs with borrow=False at
+            # the start of each call: keep the views there for this call.
+            seeded_cells = self._seed_output_cells(output_views)
+
+        sampled = True
+        if profile and profile.sampling:
+            # Only time the thunks of the sampled calls.
+            with self.profile_lock:
+                sampled = profile.sample_call()
+            self.fn.time_thunks = sampled and profile.flag_time_thunks
+
         # Do the actual work
         t0_fn = time.time()
         try:
@@ -885,31 +962,27 @@ class Function(object):
                 self.fn(output_subset=output_subset)
         except Exception:
             restore_defaults()
-            if hasattr(self.fn, 'position_of_error'):
-                # this is a new vm-provided function or c linker
-                # they need this because the exception manipulation
-                # done by raise_with_op is not implemented in C.
-                thunk = None
-                if hasattr(self.fn, 'thunks'):
-                    thunk = self.fn.thunks[self.fn.position_of_error]
-                gof.link.raise_with_op(
-                    node=self.fn.nodes[self.fn.position_of_error],
-                    thunk=thunk,
-                    storage_map=getattr(self.fn, 'storage_map', None))
-            else:
-                # old-style linkers raise their own exceptions
-                raise
+            if output_storage is not None:
+                self._fill_output_storage(None, output_storage,
+                                          output_views, seeded_cells)
+            self._raise_fn_error()
 
         dt_fn = time.time() - t0_fn
         self.maker.mode.fn_time += dt_fn
-        if profile:
-            profile.vm_call_time += dt_fn
 
         # Retrieve the values that were computed
         if outputs is None:
             outputs = [x.data for x in self.output_storage]
         assert len(outputs) == len(self.output_storage)
 
+        if output_storage is not None:
+            try:
+                self._fill_output_storage(outputs, output_storage,
+                                          output_views, seeded_cells)
+            except Exception:
+                restore_defaults()
+                raise
+
         # Remove internal references to required inputs.
         # These cannot be re-used anyway.
         for c in self.input_storage:
@@ -948,13 +1021,16 @@ class Function(object):
         theano.compile.profiling.total_fct_exec_time += dt_call
         self.maker.mode.call_time += dt_call
         if profile:
-            profile.fct_callcount += 1
-            profile.fct_call_time += dt_call
-            if hasattr(self.fn, 'update_profile'):
-                self.fn.update_profile(profile)
-            if profile.ignore_first_call:
-                profile.reset()
-                profile.ignore_first_call = False
+            with self.profile_lock:
+                profile.vm_call_time += dt_fn
+                profile.fct_callcount += 1
+                profile.fct_call_time += dt_call
+                if sampled and hasattr(self.fn, 'update_profile'):
+                    # The profile reads the thunk timings when needed.
+                    profile.add_function(self)
+                if profile.ignore_first_call:
+                    profile.reset()
+                    profile.ignore_first_call = False
         if self.return_none:
             return None
         elif self.unpack_single and len(outputs) == 1 and\
@@ -977,6 +1053,348 @@ class Function(object):
             else:
                 return [outputs[i] for i in output_subset]
 
+    def _raise_fn_error(self):
+        """
+        Re-raise the exception raised by self.fn, with information on the
+        node that failed when the linker provides it.
+
+        """
+        if hasattr(self.fn, 'position_of_error'):
+            # this is a new vm-provided function or c linker
+            # they need this because the exception manipulation
+            # done by raise_with_op is not implemented in C.
+            thunk = None
+            if hasattr(self.fn, 'thunks'):
+                thunk = self.fn.thunks[self.fn.position_of_error]
+            gof.link.raise_with_op(
+                node=self.fn.nodes[self.fn.position_of_error],
+                thunk=thunk,
+                storage_map=getattr(self.fn, 'storage_map', None))
+        else:
+            # old-style linkers raise their own exceptions
+            raise
+
+    def _check_output_storage(self, output_storage):
+        """
+        Check the ``output_storage`` argument of `__call__` and return it as
+        a list with one array or None per output of self.fn.
+
+        """
+        n_outputs = len(self.maker.outputs)
+        if isinstance(output_storage, dict):
+            if self.output_keys is None:
+                raise TypeError("output_storage can only be a dict for "
+                                "functions with output keys")
+            output_storage = [output_storage.get(key)
+                              for key in self.output_keys]
+        output_storage = list(output_storage)
+        if len(output_storage) != n_outputs:
+            raise TypeError("output_storage must have one element per output "
+                            "of the function (%d), got %d" %
+                            (n_outputs, len(output_storage)))
+        inputs = [c.storage[0] for c in self.input_storage
+                  if isinstance(c.storage[0], np.ndarray)]
+        bufs = []
+        for i, (buf, variable) in enumerate(zip(output_storage,
+                                                self.maker.fgraph.outputs)):
+            if buf is None:
+                continue
+            if (not isinstance(buf, np.ndarray) or
+                    not hasattr(variable.type, 'broadcastable')):
+                raise TypeError("output_storage is only supported for numpy "
+                                "arrays, got %s for output %d of type %s" %
+                                (type(buf), i, variable.type))
+            if (buf.dtype != variable.type.dtype or
+                    buf.ndim != variable.type.ndim):
+                raise TypeError(
+                    "output_storage for output %d has dtype %s and %d "
+                    "dimensions, but the output has type %s" %
+                    (i, buf.dtype, buf.ndim, variable.type))
+            if any(b and d != 1 for b, d in
+                   zip(variable.type.broadcastable, buf.shape)):
+                raise ValueError(
+                    "output_storage for output %d has shape %s, but the "
+                    "output has broadcastable pattern %s" %
+                    (i, buf.shape, variable.type.broadcastable))
+            if not buf.flags.writeable:
+                raise ValueError("output_storage for output %d is not "
+                                 "writeable" % i)
+            if any(s == 0 and d > 1 for s, d in zip(buf.strides, buf.shape)):
+                raise ValueError("output_storage for output %d has strides "
+                                 "%s: its elements overlap in memory" %
+                                 (i, buf.strides))
+            if any(np.may_share_memory(buf, other)
+                   for other in inputs + bufs):
+                raise ValueError("output_storage for output %d shares "
+                                 "memory with an input or another output" %
+                                 i)
+            bufs.append(buf)
+        return output_storage + [None] * (len(self.output_storage) -
+                                          n_outputs)
+
+    def _check_output_shapes(self, output_storage):
+        """
+        Check that the arrays of ``output_storage`` have the shapes of the
+        outputs that self.fn will compute from the current inputs, so that
+        a wrong array is rejected before the call applies the updates.
+
+        The shapes are computed by `output_shapes_fn`, compiled with the
+        mode of this function, whose optimizations usually compute them from
+        the shapes of the inputs only.  When it can't be compiled or fails
+        on the inputs, the shapes are only checked after the call.
+
+        """
+        # Only the outputs with a tensor type can have an array.
+        indices = [i for i, o in enumerate(self.maker.outputs)
+                   if hasattr(o.variable.type, 'broadcastable')]
+        if self.output_shapes_fn is None:
+            in_vars = [i.variable for i in self.maker.expanded_inputs]
+            dummies = [v.type() for v in in_vars]
+            shapes = theano.clone(
+                [self.maker.outputs[i].variable.shape for i in indices],
+                replace=dict(zip(in_vars, dummies)))
+            try:
+                self.output_shapes_fn = orig_function(
+                    [In(d) for d in dummies], shapes, mode=self.maker.mode,
+                    profile=False, on_unused_input='ignore')
+            except Exception as e:
+                _logger.debug('Could not compile the shapes of the outputs '
+                              'of %s: %s', self.name, e)
+                self.output_shapes_fn = False
+        if not self.output_shapes_fn:
+            return
+        try:
+            shapes = self.output_shapes_fn(*[c.storage[0]
+                                             for c in self.input_storage])
+        except Exception:
+            return
+        for i, shape in zip(indices, shapes):
+            buf = output_storage[i]
+            if buf is not None and buf.shape != tuple(shape):
+                raise ValueError(
+                    "output_storage for output %d has shape %s, but the "
+                    "output has shape %s" % (i, buf.shape, tuple(shape)))
+
+    def _seed_output_cells(self, output_views):
+        """
+        Remove from the cells that self.fn clears at the start of each call
+        the storage of the outputs with a view in `output_views`, and return
+        them so that `_fill_output_storage` can put them back.
+
+        """
+        pre_call_clear = getattr(self.fn, 'pre_call_clear', None)
+        if pre_call_clear is None:
+            return None
+        seeded = set(id(o_container.storage) for o_container, view
+                     in zip(self.output_storage, output_views)
+                     if view is not None)
+        cells = [cell for cell in pre_call_clear if id(cell) in seeded]
+        if cells:
+            pre_call_clear[:] = [cell for cell in pre_call_clear
+                                 if id(cell) not in seeded]
+        return (pre_call_clear, cells)
+
+    def _fill_output_storage(self, outputs, output_storage, output_views,
+                             seeded_cells=None):
+        """
+        Copy into the arrays of ``output_storage`` the outputs of the call
+        that were not computed directly in them, and replace the outputs by
+        the arrays.
+
+        `output_views` are the views of the arrays put in the storage of the
+        function before the call.  They are removed from it, so that the
+        next calls don't write into the arrays, and the cells returned by
+        `_seed_output_cells` in `seeded_cells` are cleared again at the
+        start of the next calls.  `outputs` is None if the call failed.
+
+        """
+        for o_container, view in zip(self.output_storage, output_views):
+            if view is not None and o_container.storage[0] is view:
+                o_container.storage[0] = None
+        if seeded_cells is not None:
+            pre_call_clear, cells = seeded_cells
+            pre_call_clear.extend(cells)
+        if outputs is None:
+            return
+        for i, (buf, view) in enumerate(zip(output_storage, output_views)):
+            if buf is None or outputs[i] is None:
+                continue
+            if outputs[i].shape != buf.shape:
+                raise ValueError(
+                    "output_storage for output %d has shape %s, but the "
+                    "output has shape %s" % (i, buf.shape, outputs[i].shape))
+            if outputs[i] is not view:
+                np.copyto(buf, outputs[i])
+            outputs[i] = buf
+
+    def map(self, args, stack=False):
+        """
+        Call the function once for each tuple of arguments in `args`.
+
+        This is much faster than calling the function in a Python loop for
+        small graphs: the inputs are only filtered, the outputs gathered and
+        the updates applied, without the keyword arguments handling, the
+        checks on each input container and the profiling bookkeeping of
+        `__call__`.
+
+        Parameters
+        ----------
+        args : iterable
+            Tuples of positional arguments, one per call.  Inputs with a
+            default value may be left out at the end of a tuple.
+        stack : bool
+            If True, stack the values of each output over all the calls
+            along a new first axis with ``numpy.stack``, instead of returning
+            the list of the results of each call.
+
+        Returns
+        -------
+        list or the same structure as a call
+            The list of what each call returned, or, if `stack` is True,
+            what a call returns with each output replaced by the stacked
+            values of that output.
+
+        Notes
+        -----
+        Inputs that share memory are not copied, as with ``trust_input``.
+        If an output is returned with ``borrow=True``, each call may
+        overwrite the value returned by the previous ones unless `stack` is
+        True.
+
+        """
+        profile = self.profile
+        t0 = time.time()
+        fn = self.fn
+        input_storage = self.input_storage
+        output_storage = self.output_storage
+        trust_input = self.trust_input
+        n_explicit = 0
+        min_args = 0
+        for c in input_storage:
+            if c.implicit:
+                break
+            n_explicit += 1
+            if c.required:
+                min_args = n_explicit
+        filters = [(c.storage, c.type.filter, c.strict, c.allow_downcast)
+                   for c in input_storage[:n_explicit]]
+        refeed = [(i, value) for i, (required, refeed, value) in
+                  enumerate(self.defaults) if refeed and i < n_explicit]
+        need_update_inputs = getattr(fn, 'need_update_inputs', True)
+        updated_storage = [storage for input, storage in
+                           zip(self.maker.expanded_inputs, input_storage)
+                           if input.update is not None]
+        n_updates = len(updated_storage)
+        if need_update_inputs:
+            n_outputs = len(output_storage) - n_updates
+        else:
+            n_outputs = self.n_returned_outputs
+        if getattr(fn, 'allow_gc', False):
+            clear_storage = [o_container.storage for o_container, o_variable
+                             in zip(output_storage, self.maker.fgraph.outputs)
+                             if o_variable.owner is not None]
+        else:
+            clear_storage = []
+
+        sampling = profile and profile.sampling
+        sampled = not sampling
+
+        def restore_defaults():
+            for i, value in refeed:
+                if isinstance(value, gof.Container):
+                    value = value.storage[0]
+                self[i] = value
+
+        all_outputs = []
+        n_calls = 0
+        t_fn = 0
+        try:
+            for arg_tuple in args:
+                n_args = len(arg_tuple)
+                if n_args > n_explicit:
+                    raise TypeError(
+                        "Too many parameter passed to theano function")
+                if n_args < min_args:
+                    missing = [i for i in xrange(n_args, min_args)
+                               if input_storage[i].required][0]
+                    raise TypeError("Missing required input: %s" %
+                                    self.maker.inputs[missing].variable)
+                for (storage, filter, strict, allow_downcast), arg in zip(
+                        filters, arg_tuple):
+                    if trust_input or arg is None:
+                        storage[0] = arg
+                    else:
+                        storage[0] = filter(arg, strict=strict,
+                                            allow_downcast=allow_downcast)
+
+                if sampling:
+                    # Each call is sampled like a call to __call__.
+                    with self.profile_lock:
+                        sampled_call = profile.sample_call()
+                    fn.time_thunks = sampled_call and profile.flag_time_thunks
+                    sampled = sampled or sampled_call
+
+                t0_fn = time.time()
+                try:
+                    outputs = fn()
+                except Exception:
+                    self._raise_fn_error()
+                t_fn += time.time() - t0_fn
+
+                if outputs is None:
+                    outputs = [x.data for x in output_storage]
+                if need_update_inputs:
+                    for storage, value in zip(updated_storage,
+                                              outputs[n_outputs:]):
+                        storage.data = value
+                all_outputs.append(outputs[:n_outputs])
+                for storage in clear_storage:
+                    storage[0] = None
+                restore_defaults()
+                n_calls += 1
+        except Exception:
+            # Leave the function as a failed __call__ does.
+            restore_defaults()
+            for c in input_storage:
+                if c.required:
+                    c.storage[0] = None
+            raise
+
+        for c in input_storage:
+            if c.required:
+                c.storage[0] = None
+
+        self.maker.mode.fn_time += t_fn
+        dt_call = time.time() - t0
+        theano.compile.profiling.total_fct_exec_time += dt_call
+        self.maker.mode.call_time += dt_call
+        if profile:
+            with self.profile_lock:
+                profile.vm_call_time += t_fn
+                profile.fct_callcount += n_calls
+                profile.fct_call_time += dt_call
+                if sampled and hasattr(fn, 'update_profile'):
+                    profile.add_function(self)
+
+        if stack:
+            if not all_outputs:
+                raise ValueError("Function.map needs at least one tuple of "
+                                 "arguments to stack the outputs")
+            all_outputs = [[np.stack([outputs[i] for outputs in all_outputs])
+                            for i in xrange(n_outputs)]]
+        if self.return_none:
+            rval = [None] * len(all_outputs)
+        elif self.unpack_single and n_outputs == 1:
+            rval = [outputs[0] for outputs in all_outputs]
+        elif self.output_keys is not None:
+            rval = [dict(izip(self.output_keys, outputs))
+                    for outputs in all_outputs]
+        else:
+            rval = all_outputs
+        if stack:
+            return rval[0]
+        return rval
+
     value = property(
         lambda self: self._value,
         None,  # this property itself is not settable
@@ -1003,10 +1421,136 @@ class Function(object):
 
     def get_shared(self):
         """
-        Return the shared variable read or updated by by this function.
+        Return the shared variable read or updated by this function.
         """
         return [i.variable for i in self.maker.inputs if i.implicit]
 
+    def reentrant(self):
+        """
+        Return a ReentrantFunction that can be called from several threads
+        at the same time.
+
+        The returned function keeps a pool of copies of this function, made
+        on demand from the same maker, optimized graph, compiled C modules
+        and shared variables. Each thread that calls it concurrently uses
+        its own copy.
+
+        """
+        return ReentrantFunction(self)
+
+
+class ReentrantFunction(object):
+    """
+    Thread-safe wrapper around a `Function`.
+
+    Thunks are bound to the storage cells they read and write, so one
+    compiled Function cannot run two calls at the same time.  A
+    ReentrantFunction keeps a lazily grown pool of copies of the function
+    instead, called contexts.  A context is a Function made by
+    ``maker.create`` from the same optimized graph.  The linker does not
+    compile or load the C code again: it binds the C thunks of the first
+    link to a new storage map and compute map, so a context only has its
+    own storage, thunk wrappers and VM.  It shares the storage of the
+    shared variables and the default values of the original function.
+    Contexts are created the first time more calls than there are free
+    contexts run at the same time, and are reused afterwards, so at most
+    as many contexts as the peak number of concurrent calls exist.
+
+    The calls only run at the same time in the code that releases the GIL,
+    see `theano.gof.vm.Parallel`.  The contexts share the profile of the
+    function, which they update under a common lock.
+
+    Outputs returned with ``borrow=True`` may be overwritten by the next
+    call that uses the same context, as with a plain Function.  Updates of
+    shared variables done by concurrent calls are not serialized: each
+    call reads and writes the shared containers while it runs.
+
+    Parameters
+    ----------
+    function : Function
+        The function to call.  It becomes the first context of the pool and
+        should not be called directly while the ReentrantFunction is used.
+
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.maker = function.maker
+        self.name = function.name
+        self.profile = function.profile
+        self.contexts = [function]
+        self._free_contexts = [function]
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+        function.profile_lock = self._profile_lock
+
+    def _new_context(self):
+        function = self.function
+        input_storage = []
+        for input, container, (required, refeed, default) in zip(
+                self.maker.inputs, function.input_storage,
+                function.defaults):
+            if input.shared:
+                input_storage.append(container)
+                continue
+            value = container.value
+            if refeed:
+                # The container may hold the value given for this input by
+                # a call running in another thread.
+                value = default
+                if isinstance(value, gof.Container):
+                    value = value.storage[0]
+            if input.mutable:
+                value = copy.copy(value)
+            input_storage.append(value)
+        context = self.maker.create(input_storage, trustme=True)
+        context.name = function.name
+        context.trust_input = function.trust_input
+        context.profile_lock = self._profile_lock
+        return context
+
+    def _acquire(self):
+        with self._lock:
+            if self._free_contexts:
+                return self._free_contexts.pop()
+            # The linker is not thread-safe, so contexts are also created
+            # while holding the lock.
+            context = self._new_context()
+            self.contexts.append(context)
+            return context
+
+    def _release(self, context):
+        with self._lock:
+            self._free_contexts.append(context)
+
+    def __call__(self, *args, **kwargs):
+        """
+        Call the function in a free execution context.
+
+        See `Function.__call__` for the parameters.
+
+        """
+        context = self._acquire()
+        try:
+            return context(*args, **kwargs)
+        finally:
+            self._release(context)
+
+    def free(self):
+        """
+        Call `Function.free` on all the contexts that are not running.
+
+        """
+        with self._lock:
+            for context in self._free_contexts:
+                context.free()
+
+    def get_shared(self):
+        """
+        Return the shared variable read or updated by this function.
+        """
+        return self.function.get_shared()
+
 
 # pickling/deepcopy support for Function
 def _pickle_Function(f):
@@ -1222,172 +1766,176 @@ class FunctionMaker(object):
             raise TypeError("Unknown output type: %s (%s)", type(output),
                             output)
 
-    def optimize_graph_with_cache(self, optimizer, inputs, outputs):
-        # This function is not finished
-        from theano.gof.compilelock import get_lock, release_lock
-        import os.path
-
-        graph_db_file = os.path.join(theano.config.compiledir,
-                                     'optimized_graphs.pkl')
-
-        # the inputs, outputs, and size of the graph to be optimized
-        inputs_new = [inp.variable for inp in inputs]
-        outputs_new = [out.variable for out in outputs]
-        size_new = len(self.fgraph.apply_nodes)
-        get_lock()
-        # Beginning of cache optimizations.
-        # Could be refactored in different functions.
-
-        def load_graph_db():
-            if os.path.isfile(graph_db_file):
-                print('graph_db already exists')
+    def optimization_cache_key(self, optimizer, inputs):
+        """
+        Return the key of `self.fgraph` in the cache of
+        `optimize_graph_with_cache`, and the hash of that key.
+
+        The key describes the structure of the graph (ops, types, constants
+        and how they are connected, but not the variable names), the
+        optimizations that `optimizer` will apply, the Theano config and
+        which inputs are mutable.
+
+        Like the keys of the ModuleCache, two keys must be compared with
+        `==`, as the pickle of some ops changes from one process to
+        another. The hash only uses the string representation of the ops,
+        so it can be used in the name of the file.
+
+        """
+        fgraph = self.fgraph
+        h = hashlib.sha256()
+
+        def update(s):
+            # The ids and addresses change at each run.
+            h.update(re.sub(r'0x[0-9a-f]+|\d{9,}', '', s).encode())
+
+        # The summary of the optimizer lists all the optimizations it
+        # applies, in order.
+        summary = StringIO()
+        optimizer.print_summary(summary)
+        update(summary.getvalue())
+        update(theano.configparser.get_config_md5(in_c_key_only=False))
+        key = [optimization_cache_version, theano.__version__,
+               tuple(inp.mutable for inp in inputs),
+               tuple(var.type for var in fgraph.inputs)]
+        update(str(key))
+        # Number the variables in the order in which a depth first
+        # traversal from the outputs computes them, so that two graphs
+        # built in different orders get the same key.
+        ids = dict((var, i) for i, var in enumerate(fgraph.inputs))
+        stack = [(var, False) for var in reversed(fgraph.outputs)]
+        while stack:
+            var, inputs_done = stack.pop()
+            if var in ids:
+                continue
+            if var.owner is None:
+                key.append(var.signature())
+                update('%s %s' % (var.type, var.data))
+                ids[var] = len(ids)
+            elif inputs_done:
+                node = var.owner
+                entry = (node.op, tuple(ids[i] for i in node.inputs),
+                         tuple(out.type for out in node.outputs))
+                key.append(entry)
+                update('%s %s %s %s' % ((type(node.op), ) + entry))
+                for out in node.outputs:
+                    ids[out] = len(ids)
             else:
-                # create graph_db
-                with open(graph_db_file, 'wb') as f:
-                    print('create new graph_db in %s' % graph_db_file)
-            # load the graph_db dictionary
+                stack.append((var, True))
+                stack.extend((i, False) for i in reversed(var.owner.inputs)
+                             if i not in ids)
+        key.append(tuple(ids[var] for var in fgraph.outputs))
+        update(str(key[-1]))
+        return tuple(key), h.hexdigest()
+
+    def optimize_graph_with_cache(self, optimizer, inputs, outputs):
+        """
+        Optimize `self.fgraph` in place, or if the same graph was already
+        optimized with the same optimizer and config, replace its outputs
+        by the optimized graph saved in the compiledir.
+
+        Each optimized graph is saved with its key in its own file, named by
+        the hash of the key (see `optimization_cache_key`).
+
+        Returns
+        -------
+        The profile of the optimizer, or None if the graph was found in the
+        cache.
+
+        """
+        fgraph = self.fgraph
+        key, key_hash = self.optimization_cache_key(optimizer, inputs)
+        cache_dir = os.path.join(theano.config.compiledir, 'optimized_graphs')
+        filename = os.path.join(cache_dir, key_hash + '.pkl')
+
+        if os.path.exists(filename):
             try:
-                with open(graph_db_file, 'rb') as f:
-                    # Temporary hack to allow
-                    # theano.scan_module.tests.test_scan.T_Scan to
-                    # finish. Should be changed in definitive version.
-                    tmp = theano.config.unpickle_function
-                    theano.config.unpickle_function = False
-                    graph_db = pickle.load(f)
-                print('graph_db loaded and it is not empty')
-            except EOFError as e:
-                # the file has nothing in it
-                print(e)
-                print('graph_db loaded and it is empty')
-                graph_db = {}
-            finally:
-                theano.config.unpickle_function = tmp
-
-            return graph_db
-
-        def find_same_graph_in_db(graph_db):
-            # If found_graph_in_db is None, then need to optimize.
-            # Otherwise, return the graph found.
-            found_graph_in_db = None
-            # The sole purpose of this loop is to set 'need_optimize' by
-            # going through graph_db, looking for graph that has the same
-            # computation performed.
-            for graph_old, graph_optimized in iteritems(graph_db):
-                inputs_old = graph_old.inputs
-                outputs_old = graph_old.outputs
-                size_old = len(graph_old.apply_nodes)
-                # Some heuristics to check is the same graphs have
-                # already been optimized before.
-                if len(inputs_new) != len(inputs_old):
-                    # If the inputs are of different size,
-                    # two graphs are for sure different
-                    print('need to optimize, because input size is different')
-                    continue
-                elif len(outputs_new) != len(outputs_old):
-                    # If the inputs are of different size,
-                    # two graphs are for sure different
-                    print('need to optimize, because output size is different')
-                    continue
-                elif not all(input_new.type == input_old.type
-                             for input_new, input_old in
-                             zip(inputs_new, inputs_old)):
-                    print('need to optimize, because inputs are of different '
-                          'types')
-                    continue
-                elif not all(output_new.type == output_old.type
-                             for output_new, output_old in
-                             zip(outputs_new, outputs_old)):
-                    print('need to optimize, because outputs are of different '
-                          'types')
-                    continue
-                elif not size_old == size_new:
-                    print('need to optimize, because numbers of nodes in graph'
-                          ' are different')
-                    continue
-                else:
-                    flags = []
-                    for i, (output_new, output_old) in enumerate(
-                            zip(outputs_new, outputs_old)):
-                        print('loop through outputs node for both graphs')
-                        graph_old.variables = set(gof.graph.variables(
-                            graph_old.inputs, graph_old.outputs))
-
-                        # using clone allowed to avoid a lot of errors
-                        # deep copy seemed to had.
-                        f2 = graph_old.clone(check_integrity=False)
-                        t1 = output_new
-                        t2 = f2.outputs[i]
-
-                        # Used to remove "already used by another graph error
-                        def removeAllFgraph(remove):
-                            if hasattr(remove, 'fgraph'):
-                                del remove.fgraph
-                            if hasattr(remove, 'owner'):
-                                if remove.owner is None:
-                                    pass
-                                else:
-                                    if hasattr(remove.owner, 'fgraph'):
-                                        del remove.owner.fgraph
-                                    if hasattr(remove.owner, 'inputs'):
-                                        remove.owner.inputs = [removeAllFgraph(
-                                            i) for i in remove.owner.inputs]
-                                        for o in remove.owner.outputs:
-                                            if hasattr(o, 'fgraph'):
-                                                del o.fgraph
-                            return remove
-
-                        t2 = removeAllFgraph(t2)
-
-                        givens = dict(izip(gof.graph.inputs([t1]),
-                                           gof.graph.inputs([t2])))
-
-                        temp = dict(izip(gof.graph.inputs([t1]),
-                                         gof.graph.inputs([t2])))
-
-                        # hack to remove inconstent entry in givens
-                        # seems to work that but source of inconsistency
-                        # could be worth investigating.
-                        for key, value in iteritems(temp):
-                            if key.type != value.type:
-                                del givens[key]
-
-                        flag = is_same_graph(t1, t2, givens=givens)
-
-                        flags.append(flag)
-
-                    is_same = all(flags)
-                    if is_same:
-                        # found the match
-                        print('found a match, no need to optimize')
-                        found_graph_in_db = graph_optimized
-                        break
-            return found_graph_in_db
-
-        graph_db = load_graph_db()
-        print('loaded graph_db from %s, size=%d' % (graph_db_file,
-                                                    len(graph_db)))
-        found_graph = find_same_graph_in_db(graph_db)
-        if found_graph:
-            self.fgraph = found_graph
-            optimizer_profile = None
-        else:
-            # this is a brand new graph, optimize it, save it to graph_db
-            print('graph not found in graph_db, optimizing the graph')
-            self.fgraph.variables = set(gof.graph.variables(
-                self.fgraph.inputs, self.fgraph.outputs))
-            # check_integrity parameters was added to ignore
-            # "excess cached variables" errors. Works that way
-            # but once again the error couldbe worth
-            # investigating.
-            before_opt = self.fgraph.clone(check_integrity=False)
-            optimizer_profile = optimizer(self.fgraph)
-            graph_db.update({before_opt: self.fgraph})
-            with open(graph_db_file, 'wb') as f:
-                pickle.dump(graph_db, f, -1)
-            print('new graph saved into graph_db')
-        release_lock()
+                with open(filename, 'rb') as f:
+                    saved_key, opt_inputs, opt_outputs = pickle.load(f)
+                same_key = saved_key == key
+            except Exception as e:
+                _logger.warning('Could not load the optimized graph %s: %s',
+                                filename, e)
+            else:
+                if same_key and self.replace_by_optimized_graph(opt_inputs,
+                                                                opt_outputs):
+                    _logger.debug('Optimized graph loaded from %s', filename)
+                    return None
+
+        optimizer_profile = optimizer(fgraph)
+
+        # Save a copy of the optimized graph whose inputs are plain
+        # variables, so that the values of the shared variables are not
+        # pickled with it.
+        memo = dict((var, var.type()) for var in fgraph.inputs)
+        gof.graph.clone_get_equiv(fgraph.inputs, fgraph.outputs, memo=memo)
+        to_save = (key, [memo[var] for var in fgraph.inputs],
+                   [memo[var] for var in fgraph.outputs])
+        tmp_filename = '%s.%s.tmp' % (filename, os.getpid())
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            with open(tmp_filename, 'wb') as f:
+                pickle.dump(to_save, f, -1)
+            # Rename is atomic, so no lock is needed when other processes
+            # save or load the same graph.
+            os.rename(tmp_filename, filename)
+        except Exception as e:
+            # Some ops can't be pickled.
+            _logger.debug('Could not save the optimized graph in %s: %s',
+                          filename, e)
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
         return optimizer_profile
 
+    def replace_by_optimized_graph(self, opt_inputs, opt_outputs):
+        """
+        Replace the outputs of `self.fgraph` by `opt_outputs`, an optimized
+        version of it whose inputs are `opt_inputs`.
+
+        Returns False, without modifying `self.fgraph`, if it can't be done.
+
+        """
+        fgraph = self.fgraph
+        if (len(opt_inputs) != len(fgraph.inputs) or
+                len(opt_outputs) != len(fgraph.outputs) or
+                any(a.type != b.type for a, b in
+                    chain(izip(opt_inputs, fgraph.inputs),
+                          izip(opt_outputs, fgraph.outputs)))):
+            return False
+        memo = dict(izip(opt_inputs, fgraph.inputs))
+        gof.graph.clone_get_equiv(opt_inputs, opt_outputs,
+                                  copy_inputs_and_orphans=False, memo=memo)
+        replacements = []
+        replaced = {}
+        for old, new in izip(fgraph.outputs, opt_outputs):
+            new = memo[new]
+            if old in replaced:
+                if replaced[old] is not new:
+                    # The same output would be replaced by two variables.
+                    return False
+                continue
+            replaced[old] = new
+            if old is not new:
+                replacements.append((old, new))
+        # The optimizer would have added a DestroyHandler before inserting
+        # inplace ops. It is needed to order them after the other clients
+        # of the variables they destroy.
+        if (not hasattr(fgraph, 'destroyers') and
+                any(getattr(node.op, 'destroy_map', None) for node in
+                    gof.graph.io_toposort(fgraph.inputs,
+                                          [r[1] for r in replacements]))):
+            fgraph.attach_feature(gof.DestroyHandler())
+        if not hasattr(fgraph, 'replace_all_validate'):
+            fgraph.attach_feature(gof.toolbox.ReplaceValidate())
+        try:
+            fgraph.replace_all_validate(replacements,
+                                        reason='optimize_graph_with_cache')
+        except gof.InconsistencyError as e:
+            _logger.warning("Can't use the cached optimized graph: %s", e)
+            return False
+        return True
+
     def __init__(self, inputs, outputs,
                  mode=None, accept_inplace=False, function_builder=Function,
                  profile=None, on_unused_input=None, fgraph=None,
@@ -1480,9 +2028,16 @@ class FunctionMaker(object):
                 end_optimizer = time.time()
                 opt_time = end_optimizer - start_optimizer
                 _logger.debug('Optimizing took %f seconds', opt_time)
+                theano.compile.profiling.collect_optimizer_profile(
+                    optimizer, optimizer_profile)
 
                 # Add deep copy to respect the memory interface
                 insert_deepcopy(fgraph, inputs, outputs + additional_outputs)
+                # The order of execution changes the memory peak. The order
+                # of io_toposort is usually better than the one repaired
+                # during the optimization, so start the linker from it.
+                if hasattr(fgraph, 'incremental_toposort'):
+                    fgraph.incremental_toposort.reset()
             finally:
                 theano.config.compute_test_value = compute_test_value_orig
                 theano.config.traceback.limit = limit_orig
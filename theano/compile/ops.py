@@ -159,7 +159,12 @@ class DeepCopyOp(gof.Op):
         return gof.Apply(self, [x], [x.type()])
 
     def perform(self, node, args, outs):
-        if hasattr(args[0], 'copy'):
+        z = outs[0][0]
+        if (isinstance(args[0], np.ndarray) and isinstance(z, np.ndarray) and
+                z.shape == args[0].shape and z.dtype == args[0].dtype):
+            # Reuse the output storage, like the C code of TensorType.
+            np.copyto(z, args[0])
+        elif hasattr(args[0], 'copy'):
             # when args[0] is a an ndarray of 0 dimensions,
             # this return a numpy.dtype and not an ndarray
             # So when the args have a copy attribute we use it
@@ -11,11 +11,14 @@ from __future__ import absolute_import, print_function, division
 
 import atexit
 import copy
+import json
 import logging
 import operator
 import os
+import random
 import sys
 import time
+import weakref
 from collections import defaultdict
 from six import iteritems
 import warnings
@@ -75,23 +78,28 @@ def _atexit_print_fn():
                 print('Skipping empty Profile')
         if len(to_sum) > 1:
             # Make a global profile
-            cum = copy.copy(to_sum[0])
+            # The apply times and call counts of the sampled profiles are
+            # scaled before being merged.
+            cum = copy.copy(to_sum[0].scaled())
+            cum.sample_every = 1
+            cum.sample_fraction = 1.0
             msg = ("Sum of all(%d) printed profiles at exit excluding Scan op"
                    " profile." % len(to_sum))
             cum.message = msg
             for ps in to_sum[1:]:
                 for attr in ["compile_time", "fct_call_time", "fct_callcount",
-                             "vm_call_time", "optimizer_time", "linker_time",
+                             "sampled_callcount", "vm_call_time", "optimizer_time", "linker_time",
                              "validate_time", "import_time",
                              "linker_node_make_thunks"]:
                     setattr(cum, attr, getattr(cum, attr) + getattr(ps, attr))
 
                 # merge dictonary
+                scaled = ps.scaled()
                 for attr in ["apply_time", "apply_callcount",
                              "apply_cimpl", "variable_shape", "variable_strides",
                              "linker_make_thunk_time"]:
                     cum_attr = getattr(cum, attr)
-                    for key, val in iteritems(getattr(ps, attr)):
+                    for key, val in iteritems(getattr(scaled, attr)):
                         assert key not in cum_attr
                         cum_attr[key] = val
 
@@ -155,6 +163,141 @@ def register_profiler_printer(fct):
     return fct
 
 
+_optimizer_profile_collectors = []
+_optimizer_json_collector = None
+
+
+def merge_optimizer_profile_dicts(prof1, prof2):
+    """
+    Sum two optimizer profiles in the format of `Optimizer.profile_to_dict`.
+
+    The numbers are summed, except the ones whose key starts with 'max_'.
+    The stages of the SeqOptimizers are matched by class and name, and the
+    optimizers of the other optimizers by name.
+
+    """
+    if prof1 is None:
+        return prof2
+    if prof2 is None:
+        return prof1
+    rval = dict(prof1)
+    for k, v2 in iteritems(prof2):
+        v1 = rval.get(k)
+        if v1 is None:
+            rval[k] = v2
+        elif k == 'stages':
+            stages = list(v1)
+            matched = set()
+            for stage in v2:
+                for i, s in enumerate(stages):
+                    if (i not in matched and s['class'] == stage['class'] and
+                            s['name'] == stage['name']):
+                        stages[i] = merge_optimizer_profile_dicts(s, stage)
+                        matched.add(i)
+                        break
+                else:
+                    stages.append(stage)
+            rval[k] = stages
+        elif isinstance(v1, dict):
+            rval[k] = merge_optimizer_profile_dicts(v1, v2)
+        elif isinstance(v1, (int, float)) and v2 is not None:
+            if k.startswith('max_'):
+                rval[k] = max(v1, v2)
+            else:
+                rval[k] = v1 + v2
+    return rval
+
+
+class OptimizerProfileCollector(object):
+    """
+    Sum the optimizer profiles of the Theano functions compiled while it is
+    active, in the JSON format of `Optimizer.profile_to_dict`.
+
+    Examples
+    --------
+    >>> with OptimizerProfileCollector() as collector:
+    ...     f = theano.function([x], y)
+    ...     g = theano.function([x], z)
+    >>> collector.dump('optimizer_profile.json')
+
+    The flag profiling.optimizer_json does the same for all the functions
+    of a process. theano/misc/optimizer_profile_diff.py compares two such
+    files.
+
+    """
+
+    def __init__(self):
+        self.profile = None
+        self.nb_functions = 0
+
+    def __enter__(self):
+        _optimizer_profile_collectors.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _optimizer_profile_collectors.remove(self)
+
+    def add(self, prof):
+        """
+        Add `prof`, a profile returned by `Optimizer.profile_to_dict`.
+
+        """
+        self.nb_functions += 1
+        self.profile = merge_optimizer_profile_dicts(self.profile, prof)
+
+    def to_dict(self):
+        return {'nb_functions': self.nb_functions,
+                'profile': self.profile}
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+
+
+def collect_optimizer_profile(optimizer, prof):
+    """
+    Give the profile `prof` that `optimizer` returned when it optimized the
+    graph of a function to the active OptimizerProfileCollectors.
+
+    """
+    global _optimizer_json_collector
+    if config.profiling.optimizer_json and _optimizer_json_collector is None:
+        _optimizer_json_collector = OptimizerProfileCollector()
+        _optimizer_profile_collectors.append(_optimizer_json_collector)
+        atexit.register(_optimizer_json_collector.dump,
+                        config.profiling.optimizer_json)
+    if prof is None or not _optimizer_profile_collectors:
+        # No optimization was done, for example when the optimized graph
+        # was found in the cache.
+        return
+    d = optimizer.profile_to_dict(prof)
+    if d is not None:
+        for collector in _optimizer_profile_collectors:
+            collector.add(d)
+
+
+class _VMTimings(object):
+    """
+    Descriptor of the ProfileStats attributes that VM.update_profile fills.
+
+    Reading one of them first reads the timings kept by the VMs of the
+    functions given to ProfileStats.add_function.
+
+    """
+    def __init__(self, name, default=None):
+        self.key = '_' + name
+        self.default = default
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self.default
+        obj.read_vms()
+        return obj.__dict__.get(self.key, self.default)
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.key] = value
+
+
 class ProfileStats(object):
 
     """
@@ -166,6 +309,12 @@ class ProfileStats(object):
     atexit_print : bool
         True means that this object will be printed to stderr (using .summary())
         at the end of the program.
+    sample_every : int
+        Only profile the thunks of one call out of that many. If None, use
+        the Theano flag profiling.sample_every.
+    sample_fraction : float
+        Only profile the thunks of a random fraction of the calls. If None,
+        use the Theano flag profiling.sample_fraction.
     **kwargs : misc initializers
         These should (but need not) match the names of the class vars declared
         in this class.
@@ -173,9 +322,13 @@ class ProfileStats(object):
     """
     def reset(self):
         """ Ignore previous function call"""
+        # Read the timings the VMs kept, to drop them with the others.
+        self.read_vms()
         # self.compile_time = 0.
         self.fct_call_time = 0.
         self.fct_callcount = 0
+        self.sampled_callcount = 0
+        self.n_sample_checks = 0
         self.vm_call_time = 0.
         self.apply_time = {}
         self.apply_callcount = {}
@@ -201,19 +354,41 @@ class ProfileStats(object):
     # Number of calls to Function.__call__
     #
 
+    sample_every = 1
+    sample_fraction = 1.0
+    # Only the thunks of one call out of sample_every, and of a random
+    # sample_fraction of those, are profiled. The apply times and call
+    # counts are those of the profiled calls: the summary multiplies them
+    # by sample_scale to estimate those of all the calls.
+    #
+
+    sampled_callcount = 0
+    # Number of calls whose thunks were profiled
+    #
+
+    n_sample_checks = 0
+    # Number of calls to sample_call()
+    #
+
     vm_call_time = 0.0
     # Total time spent in Function.fn.__call__
     #
 
-    apply_time = None
+    vms = {}
+    # id of a function -> (weak reference to it, its VM), see add_function
+    #
+
+    _reading_vms = False
+
+    apply_time = _VMTimings('apply_time')
     # dict from node -> float runtime
     #
 
-    apply_callcount = None
+    apply_callcount = _VMTimings('apply_callcount')
     # dict from node -> number of executions
     #
 
-    apply_cimpl = None
+    apply_cimpl = _VMTimings('apply_cimpl')
     # dict from node -> bool (1 if c, 0 if py)
     #
 
@@ -221,14 +396,20 @@ class ProfileStats(object):
     # pretty string to print in summary, to identify this output
     #
 
-    variable_shape = {}
+    variable_shape = _VMTimings('variable_shape', {})
     # Variable -> shapes
     #
 
-    variable_strides = {}
+    variable_strides = _VMTimings('variable_strides', {})
     # Variable -> strides
     #
 
+    node_executed_order = _VMTimings('node_executed_order')
+    node_cleared_order = _VMTimings('node_cleared_order')
+    dependencies = _VMTimings('dependencies')
+    # Filled by the VM of memory profiling
+    #
+
     optimizer_time = 0.0
     # time spent optimizing graph (FunctionMaker.__init__)
 
@@ -260,7 +441,8 @@ class ProfileStats(object):
     # param is called flag_time_thunks because most other attributes with time
     # in the name are times *of* something, rather than configuration flags.
     def __init__(self, atexit_print=True, flag_time_thunks=None,
-                 gpu_checks=True, **kwargs):
+                 gpu_checks=True, sample_every=None, sample_fraction=None,
+                 **kwargs):
         if (gpu_checks and
                 ((hasattr(theano, 'sandbox') and
                   hasattr(theano.sandbox, 'cuda') and
@@ -289,6 +471,7 @@ class ProfileStats(object):
                 " This cause bad profiling result in the new gpu"
                 " back-end, as sometimes we compile at the first call.")
 
+        self.vms = {}
         self.apply_callcount = {}
         self.output_size = {}
         self.apply_time = {}
@@ -299,6 +482,15 @@ class ProfileStats(object):
             self.flag_time_thunks = config.profiling.time_thunks
         else:
             self.flag_time_thunks = flag_time_thunks
+        if sample_every is None:
+            sample_every = config.profiling.sample_every
+        self.sample_every = sample_every
+        if sample_fraction is None:
+            sample_fraction = config.profiling.sample_fraction
+        self.sample_fraction = sample_fraction
+        # Private, so that the sampling neither uses nor changes the state
+        # of the user's global generator.
+        self.rng = random.Random()
         self.__dict__.update(kwargs)
         if atexit_print:
             global _atexit_print_list
@@ -309,6 +501,97 @@ class ProfileStats(object):
                 _atexit_registered = True
         self.ignore_first_call = theano.config.profiling.ignore_first_call
 
+    @property
+    def sampling(self):
+        """
+        True if only some of the calls are profiled.
+
+        """
+        return self.sample_every > 1 or self.sample_fraction < 1
+
+    @property
+    def sample_scale(self):
+        """
+        The number of calls that each profiled call stands for.
+
+        """
+        if not self.sampling or not self.sampled_callcount:
+            return 1
+        return self.fct_callcount / float(self.sampled_callcount)
+
+    def scaled(self):
+        """
+        Return this profile, or a copy of it whose apply times and call
+        counts are multiplied by sample_scale when only some calls were
+        profiled.
+
+        """
+        scale = self.sample_scale
+        if scale == 1:
+            return self
+        rval = copy.copy(self)
+        rval.apply_time = dict((node, t * scale)
+                               for node, t in iteritems(self.apply_time))
+        rval.apply_callcount = dict(
+            (node, int(round(c * scale)))
+            for node, c in iteritems(self.apply_callcount))
+        return rval
+
+    def add_function(self, function):
+        """
+        Read the thunk timings of the VM of `function` when the apply times
+        and counts of this profile are read, instead of after each call.
+
+        They are also read when `function` is deleted.
+
+        """
+        key = id(function)
+        if key in self.vms:
+            return
+        vm = function.fn
+
+        def read(ref):
+            if self.vms.pop(key, None) is not None:
+                vm.update_profile(self)
+        self.vms[key] = (weakref.ref(function, read), vm)
+
+    def __getstate__(self):
+        # Copies and pickles don't read the VMs: their timings are read now.
+        self.read_vms()
+        state = self.__dict__.copy()
+        state['vms'] = {}
+        return state
+
+    def read_vms(self):
+        """
+        Add the thunk timings that the VMs of the functions given to
+        add_function kept since they were last read.
+
+        """
+        if self._reading_vms or not self.vms:
+            return
+        # update_profile reads the attributes that call this method.
+        self._reading_vms = True
+        try:
+            for ref, vm in list(self.vms.values()):
+                vm.update_profile(self)
+        finally:
+            self._reading_vms = False
+
+    def sample_call(self):
+        """
+        Return True if the thunks of the next call must be profiled.
+
+        """
+        self.n_sample_checks += 1
+        if (self.n_sample_checks - 1) % self.sample_every:
+            return False
+        if (self.sample_fraction < 1 and
+                self.rng.random() >= self.sample_fraction):
+            return False
+        self.sampled_callcount += 1
+        return True
+
     def class_time(self):
         """
         dict op -> total time on thunks
@@ -721,6 +1004,10 @@ class ProfileStats(object):
         print('  Message: %s' % self.message, file=file)
         print('  Time in %i calls to Function.__call__: %es' % (
             self.fct_callcount, self.fct_call_time), file=file)
+        if self.sampling:
+            print('  Thunks profiled in %i calls, their times and counts '
+                  'are multiplied by %.4g' % (
+                      self.sampled_callcount, self.sample_scale), file=file)
         if self.fct_call_time > 0:
             print('  Time in Function.fn.__call__: %es (%.3f%%)' % (
                 self.vm_call_time,
@@ -1311,28 +1598,28 @@ class ProfileStats(object):
 
     def summary(self, file=sys.stderr, n_ops_to_print=20,
                 n_apply_to_print=20):
-        self.summary_function(file)
-        self.summary_globals(file)
-        local_time = sum(self.apply_time.values())
+        p = self.scaled()
+        p.summary_function(file)
+        p.summary_globals(file)
+        local_time = sum(p.apply_time.values())
         if local_time > 0:
-            self.summary_class(file, n_ops_to_print)
-            self.summary_ops(file, n_ops_to_print)
-            self.summary_nodes(file, n_apply_to_print)
-        elif self.fct_callcount > 0:
+            p.summary_class(file, n_ops_to_print)
+            p.summary_ops(file, n_ops_to_print)
+            p.summary_nodes(file, n_apply_to_print)
+        elif p.fct_callcount > 0:
             print("  No execution time accumulated "
                   "(hint: try config profiling.time_thunks=1)", file=file)
         if config.profiling.debugprint:
-            fcts = set([n.fgraph for n in self.apply_time.keys()])
+            fcts = set([n.fgraph for n in p.apply_time.keys()])
             theano.printing.debugprint(fcts, print_type=True)
-        if self.variable_shape or self.variable_strides:
-            self.summary_memory(file, n_apply_to_print)
-        if self.optimizer_profile:
+        if p.variable_shape or p.variable_strides:
+            p.summary_memory(file, n_apply_to_print)
+        if p.optimizer_profile:
             print("Optimizer Profile", file=file)
             print("-----------------", file=file)
-            self.optimizer_profile[0].print_profile(file,
-                                                    self.optimizer_profile[1])
-        self.print_extra(file)
-        self.print_tips(file)
+            p.optimizer_profile[0].print_profile(file, p.optimizer_profile[1])
+        p.print_extra(file)
+        p.print_tips(file)
 
     def print_tips(self, file):
         print("""Here are tips to potentially make your code run faster
@@ -1491,6 +1778,9 @@ class ScanProfileStats(ProfileStats):
     call_time = 0.0
 
     def __init__(self, atexit_print=True, name=None, **kwargs):
+        # Scan profiles every call of its inner function.
+        kwargs.setdefault('sample_every', 1)
+        kwargs.setdefault('sample_fraction', 1.0)
         super(ScanProfileStats, self).__init__(atexit_print, **kwargs)
         self.name = name
 
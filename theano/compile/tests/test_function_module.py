@@ -2,6 +2,7 @@ from __future__ import absolute_import, print_function, division
 import copy
 import six.moves.cPickle as pickle
 import numpy as np
+import threading
 import unittest
 
 
@@ -591,6 +592,198 @@ class T_function(unittest.TestCase):
         except TypeError:
             assert(func(first=1) == x)
 
+    def test_output_storage(self):
+        x = T.dvector('x')
+        y = T.dvector('y')
+        a = np.arange(3.)
+        ring = np.zeros((4, 3))
+        s = np.zeros(())
+        for borrow in [False, True]:
+            f = function([x, y], [Out(x * 2 + y, borrow=borrow),
+                                  Out(T.dot(x, y), borrow=borrow)])
+            for k in range(4):
+                row = ring[k]
+                r0, r1 = f(a, np.ones(3) * k, output_storage=[row, s])
+                assert r0 is row and r1 is s
+                assert np.allclose(row, a * 2 + k)
+                assert np.allclose(s, a.sum() * k)
+                # The arrays are not reused by the next calls.
+                assert f.output_storage[0].storage[0] is None
+            # Strided views and partial output_storage
+            grid = np.zeros((3, 2))
+            col = grid[:, 1]
+            r0, r1 = f(a, a, output_storage=[col, None])
+            assert r0 is col and r1 is not s
+            assert np.allclose(grid[:, 1], a * 3)
+            assert np.allclose(grid[:, 0], 0)
+
+            # Invalid arrays
+            for bad in [np.zeros(3, dtype='float32'), np.zeros((3, 1)),
+                        [0., 0., 0.]]:
+                self.assertRaises(TypeError, f, a, a,
+                                  output_storage=[bad, None])
+            self.assertRaises(TypeError, f, a, a, output_storage=[col])
+            readonly = np.zeros(3)
+            readonly.flags.writeable = False
+            self.assertRaises(ValueError, f, a, a,
+                              output_storage=[readonly, None])
+            self.assertRaises(ValueError, f, a, a,
+                              output_storage=[a, None])
+            b = np.zeros(4)
+            self.assertRaises(ValueError, f, a, a, output_storage=[b, None])
+            assert b.shape == (4,)
+            assert np.allclose(f(a, a)[0], a * 3)
+
+            # The outputs returned by the previous calls are not overwritten.
+            r = f(a, a)[0]
+            f(a, a * 2, output_storage=[ring[0], None])
+            if not borrow:
+                assert np.allclose(r, a * 3)
+
+        # With reuse_outputs, the outputs, and the copies of the inputs
+        # returned as outputs, are computed directly into the arrays by the
+        # C code.  Otherwise they are copied into them.
+        for reuse in [False, True]:
+            computed = {}
+
+            def callback(node, thunk, storage_map, compute_map):
+                for v in node.outputs:
+                    if isinstance(storage_map[v][0], np.ndarray):
+                        computed[v] = storage_map[v][0].ctypes.data
+            mode = theano.compile.Mode(
+                linker=gof.vm.VM_Linker(callback=callback,
+                                        reuse_outputs=reuse),
+                optimizer=theano.compile.get_default_mode().optimizer)
+            f = function([x], [x * 2, x], mode=mode)
+            n_cleared = len(f.fn.pre_call_clear)
+            rows = [ring[0], ring[1]]
+            r0, r1 = f(a, output_storage=rows)
+            assert r0 is rows[0] and r1 is rows[1]
+            assert np.allclose(ring[:2], [a * 2, a])
+            if theano.config.cxx:
+                assert ([computed[o] == row.ctypes.data for o, row
+                         in zip(f.maker.fgraph.outputs, rows)] ==
+                        [reuse, reuse])
+            assert len(f.fn.pre_call_clear) == n_cleared
+            f(a * 2)
+            assert np.allclose(ring[:2], [a * 2, a])
+
+        # The shapes are checked before the call, which doesn't update w.
+        w = theano.shared(0., name='w')
+        f = function([x], x * 2, updates={w: w + 1})
+        self.assertRaises(ValueError, f, a, output_storage=[np.zeros(4)])
+        assert w.get_value() == 0
+        f(a, output_storage=[ring[0]])
+        assert w.get_value() == 1
+
+        f = function([x], {'double': x * 2, 'sum': x.sum()})
+        r = f(a, output_storage={'double': ring[0]})
+        assert np.allclose(ring[0], a * 2)
+        assert np.allclose(r['sum'], 3)
+
+    def test_map(self):
+        x = T.dvector('x')
+        a = T.dscalar('a')
+        w = theano.shared(0., name='w')
+        f = function([x, In(a, value=2.)], [x * a, x.sum()],
+                     updates={w: w + x.sum()})
+        args = [(np.ones(2),), ([2, 2], 3.), (np.ones(2),)]
+        rval = f.map(args)
+        assert len(rval) == 3
+        for (r0, r1), arg in zip(rval, args):
+            arg_a = arg[1] if len(arg) > 1 else 2.
+            assert np.allclose(r0, np.asarray(arg[0]) * arg_a)
+            assert np.allclose(r1, np.sum(arg[0]))
+        assert w.get_value() == 8.
+
+        r0, r1 = f.map(args, stack=True)
+        assert np.allclose(r0, [[2, 2], [6, 6], [2, 2]])
+        assert np.allclose(r1, [2, 4, 2])
+        assert w.get_value() == 16.
+        # The default value is still used by normal calls.
+        assert np.allclose(f(np.ones(2))[0], [2, 2])
+
+        g = function([x], x + 1)
+        assert np.allclose(g.map([([1, 2],), ([3, 4],)], stack=True),
+                           [[2, 3], [4, 5]])
+        self.assertRaises(TypeError, g.map, [()])
+        self.assertRaises(TypeError, g.map, [([1, 2], [1, 2])])
+        assert g.map([]) == []
+        self.assertRaises(ValueError, g.map, [], stack=True)
+
+        # A failed call restores the default values.
+        y = T.dvector('y')
+        h = function([x, y, In(a, value=2.)], ((x + y) * a).sum())
+        self.assertRaises(ValueError, h.map, [([1, 1], [1, 1, 1], 5.)])
+        assert h([1, 1], [1, 1]) == 8.
+
+    def test_reentrant(self):
+        x = T.dvector('x')
+        w = theano.shared(np.ones(3), name='w')
+        a = T.dscalar('a')
+        f = function([x, In(a, value=2.)], T.tanh(x * w) * a)
+        rf = f.reentrant()
+
+        # Two calls running at the same time use different contexts that
+        # share the maker and the shared variables.
+        c1 = rf._acquire()
+        c2 = rf._acquire()
+        assert c1 is f and c2 is not f
+        assert c2.maker is f.maker
+        assert c2.fn.storage_map is not f.fn.storage_map
+        assert c2.container[w].storage is f.container[w].storage
+        if theano.config.cxx:
+            # The C code is bound to the new storage, not linked again.
+            for t1, t2 in zip(f.fn.thunks, c2.fn.thunks):
+                assert t1.rebind is t2.rebind
+                assert t1.cthunk is not t2.cthunk
+                assert t1.outputs[0] is not t2.outputs[0]
+        rf._release(c2)
+        rf._release(c1)
+
+        w.set_value(np.arange(3.))
+        results = {}
+        errors = []
+
+        def work(k):
+            try:
+                for i in range(50):
+                    v = np.arange(3.) + k + i
+                    out = rf(v, a=k)
+                    assert np.allclose(out, np.tanh(v * np.arange(3.)) * k)
+                results[k] = rf(np.ones(3))
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=work, args=(k,)) for k in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors, errors
+        for k in range(4):
+            assert np.allclose(results[k], np.tanh(np.arange(3.)) * 2)
+        assert 2 <= len(rf.contexts) <= 4
+
+    def test_reentrant_profile(self):
+        x = T.dvector('x')
+        profile = theano.compile.ProfileStats(False, gpu_checks=False)
+        f = function([x], T.tanh(x) * 2, profile=profile)
+        rf = f.reentrant()
+
+        def work():
+            for i in range(100):
+                rf(np.ones(3))
+        threads = [threading.Thread(target=work) for k in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # The contexts share the profile, no update is lost.
+        assert all(c.profile is profile for c in rf.contexts)
+        assert profile.fct_callcount == 400
+        assert sum(profile.apply_callcount.values()) == (
+            400 * len(f.maker.fgraph.apply_nodes))
+
 
 class T_picklefunction(unittest.TestCase):
 
@@ -4,6 +4,9 @@ Test of memory profiling
 """
 from __future__ import absolute_import, print_function, division
 
+import gc
+import json
+import random
 import unittest
 
 import numpy as np
@@ -11,7 +14,10 @@ import numpy as np
 import theano
 from six.moves import StringIO
 import theano.tensor as T
+from theano.compile.profiling import (OptimizerProfileCollector,
+                                      merge_optimizer_profile_dicts)
 from theano.ifelse import ifelse
+from theano.misc import optimizer_profile_diff
 
 
 class Test_profiling(unittest.TestCase):
@@ -108,6 +114,127 @@ class Test_profiling(unittest.TestCase):
             theano.config.profile = config1
             theano.config.profile_memory = config2
 
+    def test_sampling(self):
+        x = T.vector('x')
+        if theano.config.mode in ["DebugMode", "DEBUG_MODE"]:
+            m = "FAST_RUN"
+        else:
+            m = None
+        x_val = np.ones(3, dtype=x.dtype)
+
+        p = theano.ProfileStats(False, gpu_checks=False, sample_every=3)
+        f = theano.function([x], T.exp(x) * 2, profile=p, mode=m)
+        for i in range(6):
+            f(x_val)
+        f.map([(x_val,)] * 3)
+        assert p.fct_callcount == 9
+        # Calls 0, 3 and 6 are profiled, 6 being the first call of the map.
+        assert p.sampled_callcount == 3
+        assert all(c == 3 for c in p.apply_callcount.values())
+        assert all(c == 9 for c in p.scaled().apply_callcount.values())
+        buf = StringIO()
+        p.summary(buf)
+        assert ("Thunks profiled in 3 calls, their times and counts are "
+                "multiplied by 3" in buf.getvalue())
+
+        p = theano.ProfileStats(False, gpu_checks=False, sample_fraction=0.5)
+        f = theano.function([x], T.exp(x) * 2, profile=p, mode=m)
+        # The sampling doesn't use the global generator.
+        random.seed(0)
+        expected = random.random()
+        random.seed(0)
+        for i in range(20):
+            f(x_val)
+        assert random.random() == expected
+        assert p.fct_callcount == 20
+        assert all(c == p.sampled_callcount
+                   for c in p.apply_callcount.values())
+        # The counts stay integers.
+        assert all(c == 20 and isinstance(c, int)
+                   for c in p.scaled().apply_callcount.values())
+
+    def test_lazy_read(self):
+        x = T.vector('x')
+        if theano.config.mode in ["DebugMode", "DEBUG_MODE"]:
+            m = "FAST_RUN"
+        else:
+            m = None
+        x_val = np.ones(3, dtype=x.dtype)
+        p = theano.ProfileStats(False, gpu_checks=False)
+        f = theano.function([x], T.exp(x) * 2, profile=p, mode=m)
+        g = theano.function([x], T.exp(x) * 3, profile=p, mode=m)
+        for i in range(3):
+            f(x_val)
+        g(x_val)
+        # The VMs keep the timings until the profile is read.
+        if hasattr(f.fn, 'flush_timers'):
+            f.fn.flush_timers()
+        assert f.fn.call_counts == [3] * len(f.fn.nodes)
+        assert sorted(p.apply_callcount.values()) == (
+            [1] * len(g.fn.nodes) + [3] * len(f.fn.nodes))
+        assert f.fn.call_counts == [0] * len(f.fn.nodes)
+        f(x_val)
+        g(x_val)
+        # The timings of a deleted function are kept.
+        n_g = len(g.fn.nodes)
+        del g
+        gc.collect()
+        assert len(p.vms) == 1
+        assert sorted(p.apply_callcount.values()) == (
+            [2] * n_g + [4] * len(f.fn.nodes))
+
+
+def test_optimizer_profile_collector():
+    x = T.vector('x')
+    with OptimizerProfileCollector() as collector:
+        with OptimizerProfileCollector() as collector1:
+            theano.function([x], T.exp(x) * 2, mode='FAST_RUN')
+        theano.function([x], T.log(T.exp(x)) * 1, mode='FAST_RUN')
+    assert (collector1.nb_functions, collector.nb_functions) == (1, 2)
+    prof = collector.profile
+    assert prof['class'] == 'SeqOptimizer'
+    assert prof['time'] > collector1.profile['time']
+    # It can be saved in JSON.
+    assert json.loads(json.dumps(collector.to_dict()))['nb_functions'] == 2
+    stages = dict((s['name'], s) for s in prof['stages'])
+    canonicalize = stages['canonicalize']['profile']
+    assert canonicalize['class'] == 'EquilibriumOptimizer'
+    assert canonicalize['optimizers']['local_mul_canonizer']['applied'] > 0
+
+    # The second profile has one more function.
+    rows = optimizer_profile_diff.diff(collector1.to_dict(),
+                                       collector.to_dict(), 'attempts')
+    path, old, new = [r for r in rows
+                      if r[0] == 'canonicalize/local_mul_canonizer'][0]
+    assert new['attempts'] > old['attempts']
+
+
+def test_merge_optimizer_profile_dicts():
+    prof1 = {'class': 'SeqOptimizer', 'name': 'opt', 'time': 1.,
+             'stages': [{'class': 'A', 'name': 'a', 'time': 1.,
+                         'profile': None},
+                        {'class': 'B', 'name': 'b', 'time': 2.,
+                         'profile': {'max_nodes': 3, 'optimizers': {
+                             'lopt': {'kind': 'local', 'applied': 1}}}}]}
+    prof2 = {'class': 'SeqOptimizer', 'name': 'opt', 'time': 2.,
+             'stages': [{'class': 'B', 'name': 'b', 'time': 1.,
+                         'profile': {'max_nodes': 2, 'optimizers': {
+                             'lopt': {'kind': 'local', 'applied': 2},
+                             'lopt2': {'kind': 'local', 'applied': 1}}}},
+                        {'class': 'C', 'name': 'c', 'time': 1.,
+                         'profile': None}]}
+    merged = merge_optimizer_profile_dicts(prof1, prof2)
+    assert merged == {
+        'class': 'SeqOptimizer', 'name': 'opt', 'time': 3.,
+        'stages': [{'class': 'A', 'name': 'a', 'time': 1., 'profile': None},
+                   {'class': 'B', 'name': 'b', 'time': 3.,
+                    'profile': {'max_nodes': 3, 'optimizers': {
+                        'lopt': {'kind': 'local', 'applied': 3},
+                        'lopt2': {'kind': 'local', 'applied': 1}}}},
+                   {'class': 'C', 'name': 'c', 'time': 1., 'profile': None}]}
+    # The arguments are not modified.
+    assert prof1['stages'][1]['profile']['optimizers']['lopt']['applied'] == 1
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -953,11 +953,10 @@ AddConfigVar(
 
 AddConfigVar(
     'cache_optimizations',
-    "WARNING: work in progress, does not work yet. "
-    "Specify if the optimization cache should be used. This cache will "
-    "any optimized graph and its optimization. Actually slow downs a lot "
-    "the first optimization, and could possibly still contains some bugs. "
-    "Use at your own risks.",
+    "Specify if the optimization cache should be used. Each optimized "
+    "graph is saved in the compiledir, and is reused instead of optimizing "
+    "the graph again when the same graph is compiled with the same mode "
+    "and config.",
     BoolParam(False),
     in_c_key=False)
 
@@ -1134,6 +1133,34 @@ AddConfigVar('profiling.ignore_first_call',
              BoolParam(False),
              in_c_key=False)
 
+AddConfigVar('profiling.sample_every',
+             """
+             Only profile the thunks of one call out of that many. The
+             summary scales the apply times and call counts of the
+             profiled calls to estimate those of all the calls.
+             """,
+             IntParam(1, lambda i: i > 0),
+             in_c_key=False)
+
+AddConfigVar('profiling.sample_fraction',
+             """
+             Only profile the thunks of a random fraction of the calls. The
+             summary scales the apply times and call counts of the
+             profiled calls to estimate those of all the calls.
+             """,
+             FloatParam(1.0, lambda f: 0 < f <= 1),
+             in_c_key=False)
+
+AddConfigVar('profiling.optimizer_json',
+             """
+             If not empty, the optimizer profile of all the Theano
+             functions compiled by the process is summed and saved in JSON
+             to this file when the process exits. It does not require
+             config.profile.
+             """,
+             StrParam(''),
+             in_c_key=False)
+
 AddConfigVar('optdb.position_cutoff',
              'Where to stop eariler during optimization. It represent the'
              ' position of the optimizer where to stop.',
@@ -1145,6 +1172,24 @@ AddConfigVar('optdb.max_use_ratio',
              FloatParam(8),
              in_c_key=False)
 
+AddConfigVar('optdb.incremental',
+             'If True, after their first iteration, EquilibriumOptimizers '
+             'only apply their local optimizers to the nodes that changed and '
+             'to their neighbours, instead of all the nodes of the graph. '
+             'It only helps when many iterations each change a small part '
+             'of the graph.',
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('cycle_detection',
+             "How the DestroyHandler checks that the inplace operations do "
+             "not make a cycle in the graph. 'incremental' keeps a "
+             "topological order of the graph up to date and only checks the "
+             "dependencies it does not respect. 'regular' checks the whole "
+             "graph each time.",
+             EnumStr('incremental', 'regular'),
+             in_c_key=False)
+
 AddConfigVar('gcc.cxxflags',
              "Extra compiler flags for gcc",
              StrParam(""),
@@ -1186,8 +1231,62 @@ AddConfigVar('cmodule.age_thresh_use',
              IntParam(60 * 60 * 24 * 24, allow_override=False),
              in_c_key=False)
 
+AddConfigVar('cmodule.use_index',
+             "If True, keep an index of the modules of the compilation "
+             "directory, and only load the key.pkl file of a module when it "
+             "is needed instead of loading all of them at the first "
+             "compilation of each process.",
+             BoolParam(False, allow_override=False),
+             in_c_key=False)
+
+AddConfigVar('cmodule.compile_workers',
+             "Number of C modules that the VM linker may compile at the "
+             "same time. When bigger than 1, all the modules missing from "
+             "the cache are collected first and compiled by that many "
+             "concurrent compiler processes before the thunks are built.",
+             IntParam(1, lambda i: i > 0),
+             in_c_key=False)
+
+AddConfigVar('cmodule.cache_detection',
+             "If True, the flags of the compiler and of the BLAS library "
+             "detected by Theano are saved in the compiledir, and reused "
+             "by the next processes with the same compiler, CPU and "
+             "environment instead of being detected again.",
+             BoolParam(True),
+             in_c_key=False)
+
+AddConfigVar('cmodule.precompiled_headers',
+             "If True, the headers included by most C modules (Python.h, "
+             "the numpy headers, ...) are compiled once per compiledir and "
+             "set of compiler flags into a precompiled header, that the "
+             "compiler then reuses instead of parsing these headers for "
+             "each module.",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('cmodule.object_cache',
+             "If True, the shared libraries built by the C compiler are "
+             "also stored in base_compiledir/object_cache, indexed by a hash "
+             "of the preprocessed source code, the command line and the "
+             "compiler version. Compiling the same code again, even in "
+             "another compiledir, copies the stored library instead of "
+             "running the compiler.",
+             BoolParam(False),
+             in_c_key=False)
+
 
 def default_blas_ldflags():
+    from theano.gof.cmodule import detection_cache
+    flags = detection_cache.get('blas.ldflags')
+    if flags is None:
+        flags = detect_blas_ldflags()
+        # Don't save a failed detection: BLAS may be installed later.
+        if flags:
+            detection_cache.set('blas.ldflags', flags)
+    return flags
+
+
+def detect_blas_ldflags():
     global numpy
     warn_record = []
     try:
@@ -1463,6 +1562,40 @@ AddConfigVar('vm.lazy',
              ConfigParam('None', filter_vm_lazy),
              in_c_key=False)
 
+AddConfigVar('vm.background_compile',
+             "Default of the background_compile parameter of the vm "
+             "linkers. If True, the nodes whose C module is not in the cache "
+             "first run their Python implementation, while their C module "
+             "is compiled in a background thread.",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('vm.memory_plan',
+             "Default of the memory_plan parameter of the vm linkers. If "
+             "True, the Loop and LoopGC VMs place the intermediate results "
+             "in one buffer planned from their live intervals and from the "
+             "shapes seen on the first call.",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('vm.parallel_workers',
+             "Default of the parallel_workers parameter of the vm linkers. "
+             "If larger than 1, the thunks of independent nodes are run "
+             "concurrently by the Parallel VM on that many threads. They "
+             "only run at the same time in the code that releases the GIL, "
+             "see the docstring of theano.gof.vm.Parallel.",
+             IntParam(1, lambda i: i > 0),
+             in_c_key=False)
+
+AddConfigVar('vm.reuse_outputs',
+             "Default of the reuse_outputs parameter of the vm linkers. If "
+             "True, the thunks may compute the outputs of the graph into the "
+             "arrays given to Function.__call__ in output_storage, instead "
+             "of having them copied there. It changes the C code of the "
+             "nodes that compute the outputs.",
+             BoolParam(False),
+             in_c_key=False)
+
 AddConfigVar(
     'warn.identify_1pexp_bug',
     'Warn if Theano versions prior to 7987b51 (2011-12-18) could have '
@@ -1569,6 +1702,15 @@ period for running processes.""",
                       allow_override=False),
              in_c_key=False)
 
+AddConfigVar('compile.per_module_lock',
+             """If True, compiling or updating a module of the compilation
+directory only locks that module (plus the whole directory for a short time
+when cleaning it up), so that processes compiling different modules do not
+wait for each other. If False, the whole compilation directory is locked
+during each compilation.""",
+             BoolParam(False),
+             in_c_key=False)
+
 
 try:
     p_out = output_subprocess_Popen([config.cxx, '-dumpversion'])
@@ -183,15 +183,17 @@ def _config_print(thing, buf, print_doc=True):
         print("", file=buf)
 
 
-def get_config_md5():
+def get_config_md5(in_c_key_only=True):
     """
     Return a string md5 of the current config options. It should be such that
     we can safely assume that two different config setups will lead to two
     different strings.
 
-    We only take into account config options for which `in_c_key` is True.
+    If `in_c_key_only` is True, we only take into account config options for
+    which `in_c_key` is True.
     """
-    all_opts = sorted([c for c in _config_var_list if c.in_c_key],
+    all_opts = sorted([c for c in _config_var_list
+                       if c.in_c_key or not in_c_key_only],
                       key=lambda cv: cv.fullname)
     return theano.gof.utils.hash_from_code('\n'.join(
         ['%s = %s' % (cv.fullname, cv.__get__(True, None)) for cv in all_opts]))
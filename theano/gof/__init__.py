@@ -53,7 +53,7 @@ from theano.gof.link import \
     Container, Linker, LocalLinker, PerformLinker, WrapLinker, WrapLinkerMany
 
 from theano.gof.op import \
-    Op, OpenMPOp, PureOp, COp, ops_with_inner_function
+    Op, OpenMPOp, PureOp, COp, ops_with_inner_function, hash_consing
 
 from theano.gof.opt import (
     Optimizer,
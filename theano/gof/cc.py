@@ -545,6 +545,8 @@ class CLinker(link.Linker):
 
     def __init__(self, schedule=None):
         self.fgraph = None
+        # The module compiled or loaded by the first cthunk_factory call.
+        self.module = None
         if schedule:
             self.schedule = schedule
 
@@ -562,6 +564,7 @@ class CLinker(link.Linker):
         self.fgraph = fgraph
         self.fetch_variables()
         self.no_recycling = no_recycling
+        self.module = None
         return self
 
     def fetch_variables(self):
@@ -1470,13 +1473,36 @@ class CLinker(link.Linker):
         """
         if location is None:
             location = cmodule.dlimport_workdir(config.compiledir)
+        # We want to compute the code without the lock
+        self.get_src_code()
+        get_lock()
+        try:
+            module = self.build_cmodule(location)
+        finally:
+            release_lock()
+        return module
+
+    def build_cmodule(self, location, py_module=True):
+        """
+        Compile the source code for this linker in `location`.
+
+        Unlike `compile_cmodule`, this does not take the compilation lock:
+        the caller must hold it. This is what allows `ModuleCache` to run
+        several compilations at the same time.
+
+        Parameters
+        ----------
+        location
+            The directory where the source and the shared library are written.
+        py_module
+            If False, the library is not imported and None is returned.
+
+        """
         mod = self.get_dynamic_module()
         c_compiler = self.c_compiler()
         libs = self.libraries()
         preargs = self.compile_args()
-        # We want to compute the code without the lock
         src_code = mod.code()
-        get_lock()
         try:
             _logger.debug("LOCATION %s", str(location))
             module = c_compiler.compile_str(
@@ -1486,12 +1512,11 @@ class CLinker(link.Linker):
                 include_dirs=self.header_dirs(),
                 lib_dirs=self.lib_dirs(),
                 libs=libs,
-                preargs=preargs)
+                preargs=preargs,
+                py_module=py_module)
         except Exception as e:
             e.args += (str(self.fgraph),)
             raise
-        finally:
-            release_lock()
         return module
 
     def get_dynamic_module(self):
@@ -1570,20 +1595,27 @@ class CLinker(link.Linker):
         when executed, will fetch its inputs from in_storage, put its
         outputs in out_storage and if an error occurs will put the
         type, value and traceback of the exception in error_storage.
+
+        The module is only looked up at the first call: the next ones
+        instantiate it with other storage.
         """
-        try:
-            key = self.cmodule_key()
-        except KeyError:
-            key = None
-        if key is None:
-            # If we can't get a key, then forget the cache mechanism.
-            module = self.compile_cmodule()
-        else:
-            # Set compute_map as None as clinker do not support lazy evaluation
-            for node in self.node_order:
-                node.op.prepare_node(node, storage_map, None, 'c')
-            module = get_module_cache().module_from_key(
-                key=key, lnk=self, keep_lock=keep_lock)
+        module = getattr(self, 'module', None)
+        if module is None:
+            try:
+                key = self.cmodule_key()
+            except KeyError:
+                key = None
+            if key is None:
+                # If we can't get a key, then forget the cache mechanism.
+                module = self.compile_cmodule()
+            else:
+                # Set compute_map as None as clinker do not support lazy
+                # evaluation
+                for node in self.node_order:
+                    node.op.prepare_node(node, storage_map, None, 'c')
+                module = get_module_cache().module_from_key(
+                    key=key, lnk=self, keep_lock=keep_lock)
+            self.module = module
 
         vars = self.inputs + self.outputs + self.orphans
         # List of indices that should be ignored when passing the arguments
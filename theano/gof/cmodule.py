@@ -19,12 +19,13 @@ import time
 import platform
 import distutils.sysconfig
 import warnings
+from multiprocessing.pool import ThreadPool
 
 import numpy.distutils
 
 import theano
-from theano.compat import PY3, decode, decode_iter
-from six import b, BytesIO, StringIO, string_types, iteritems
+from theano.compat import OrderedDict, PY3, decode, decode_iter
+from six import b, BytesIO, StringIO, string_types, iteritems, itervalues
 from six.moves import xrange
 from theano.gof.utils import flatten
 from theano.configparser import config
@@ -34,7 +35,8 @@ from theano.misc.windows import (subprocess_Popen,
 
 # we will abuse the lockfile mechanism when reading and writing the registry
 from theano.gof import compilelock
-from theano.configdefaults import gcc_version_str, local_bitwidth
+from theano.configdefaults import (compiledir_format_dict, gcc_version_str,
+                                   local_bitwidth)
 
 importlib = None
 try:
@@ -49,6 +51,11 @@ METH_NOARGS = "METH_NOARGS"
 # global variable that represent the total time spent in importing module.
 import_time = 0
 
+# Number of shared libraries found in (hits) and added to (misses) the object
+# cache, see the cmodule.object_cache flag.
+object_cache_hits = 0
+object_cache_misses = 0
+
 
 class MissingGXX(Exception):
     """
@@ -559,6 +566,140 @@ class KeyData(object):
                     pass
 
 
+class ModuleIndex(object):
+    """
+    Append-only index of the versioned modules of a compilation directory.
+
+    It is a text file whose first line is `header`, followed by one
+    "<module hash> <module directory>" line per module. It allows
+    ModuleCache to find the directory of a module from its hash without
+    unpickling the key.pkl file of every module.
+
+    Lines are never removed by `add`, so the directory of an entry may have
+    been deleted since. Only `rewrite` replaces the whole file. Both take
+    the lock of the index, so that no entry appended by another process
+    is lost when the file is rewritten.
+
+    Parameters
+    ----------
+    path
+        Path of the index file.
+
+    """
+
+    header = 'theano module index 1'
+
+    def __init__(self, path):
+        self.path = path
+        # Name of the module lock (see compilelock.module_lock_ctx) that
+        # protects the file.
+        self.lock_name = 'index_' + hash_from_code(os.path.abspath(path))
+        self.dir_from_hash = {}
+        # Number of bytes of the file already read, and inode of that file
+        # (to notice when another process rewrote it).
+        self.offset = 0
+        self.inode = None
+
+    def update(self):
+        """
+        Read the entries appended to the file since the last call.
+
+        Returns
+        -------
+        bool
+            False if the file is missing or corrupted. It should then be
+            rebuilt with `rewrite`.
+
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self.inode:
+                    self.dir_from_hash = {}
+                    self.offset = 0
+                    self.inode = inode
+                f.seek(self.offset)
+                data = f.read()
+        except IOError:
+            return False
+        # Only consider complete lines: an entry may be being written.
+        end = data.rfind(b('\n')) + 1
+        lines = decode(data[:end]).split('\n')[:-1]
+        if self.offset == 0:
+            if not lines or lines[0] != self.header:
+                return False
+            lines = lines[1:]
+        for line in lines:
+            fields = line.split(' ')
+            if len(fields) != 2 or not fields[1].startswith('tmp'):
+                self.inode = None
+                return False
+            self.dir_from_hash[fields[0]] = fields[1]
+        self.offset += end
+        return True
+
+    def lock(self):
+        """
+        Return a context manager that holds the lock of the file.
+
+        """
+        return compilelock.module_lock_ctx([self.lock_name])
+
+    def add(self, module_hash, module_dir):
+        """
+        Append an entry to the file.
+
+        """
+        with self.lock():
+            with open(self.path, 'a') as f:
+                f.write('%s %s\n' % (module_hash, module_dir))
+
+    def rewrite(self, dir_from_hash):
+        """
+        Replace the file by one containing only the given entries.
+
+        """
+        with self.lock():
+            self._rewrite(dir_from_hash)
+
+    def remove_missing(self, dirname):
+        """
+        Drop the entries whose module directory in `dirname` was deleted.
+
+        Returns
+        -------
+        bool
+            False if the file is missing or corrupted. It should then be
+            rebuilt with `rewrite`.
+
+        """
+        with self.lock():
+            # Read the entries appended since the last call under the lock,
+            # so that none of them is dropped by the rewrite.
+            if not self.update():
+                return False
+            self._rewrite(dict(
+                (module_hash, module_dir)
+                for module_hash, module_dir in iteritems(self.dir_from_hash)
+                if os.path.isdir(os.path.join(dirname, module_dir))))
+        return True
+
+    def _rewrite(self, dir_from_hash):
+        content = '\n'.join([self.header] +
+                            ['%s %s' % item
+                             for item in sorted(iteritems(dir_from_hash))])
+        content = b(content + '\n')
+        tmp_path = '%s.%s.tmp' % (self.path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        if sys.platform == 'win32' and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp_path, self.path)
+        self.dir_from_hash = dict(dir_from_hash)
+        self.offset = len(content)
+        self.inode = os.stat(self.path).st_ino
+
+
 class ModuleCache(object):
     """
     Interface to the cache of dynamically compiled modules on disk.
@@ -619,6 +760,13 @@ class ModuleCache(object):
     do_refresh : bool
         If True, then the ``refresh`` method will be called
         in the constructor.
+    use_index : bool
+        If True, the versioned modules are listed in a `ModuleIndex` and the
+        key.pkl file of a module is only loaded when its module hash is
+        looked up, instead of loading all of them in the constructor. Note
+        that a key is then always looked up by the hash of its module, so
+        the source code has to be generated first. Defaults to the
+        cmodule.use_index flag.
 
     """
 
@@ -659,19 +807,34 @@ class ModuleCache(object):
 
     """
 
-    def __init__(self, dirname, check_for_broken_eq=True, do_refresh=True):
+    def __init__(self, dirname, check_for_broken_eq=True, do_refresh=True,
+                 use_index=None):
         self.dirname = dirname
         self.module_from_name = dict(self.module_from_name)
         self.entry_from_key = dict(self.entry_from_key)
         self.module_hash_to_key_data = dict(self.module_hash_to_key_data)
         self.similar_keys = dict(self.similar_keys)
         self.stats = [0, 0, 0]
+        # Modules may be compiled by another thread of this process (see the
+        # background_compile parameter of VM_Linker). The compilation lock
+        # only protects from other processes, so the threads also take the
+        # lock that serializes them in compilelock: a single lock can't be
+        # taken in different orders.
+        self.thread_lock = compilelock.thread_lock
         self.check_for_broken_eq = check_for_broken_eq
         self.loaded_key_pkl = set()
         self.time_spent_in_check_key = 0
+        if use_index is None:
+            use_index = config.cmodule.use_index
+        self.index = None
+        if use_index:
+            self.index = ModuleIndex(os.path.join(dirname, 'module_index'))
 
         if do_refresh:
-            self.refresh()
+            if self.index is None:
+                self.refresh()
+            elif not self.index.update():
+                self.rebuild_index()
 
     age_thresh_use = config.cmodule.age_thresh_use  # default 24 days
     """
@@ -696,7 +859,7 @@ class ModuleCache(object):
         return self.module_from_name[name]
 
     def refresh(self, age_thresh_use=None, delete_if_problem=False,
-                cleanup=True):
+                cleanup=True, subdirs=None, load_keys=True):
         """
         Update cache data by walking the cache directory structure.
 
@@ -716,6 +879,13 @@ class ModuleCache(object):
             - Duplicated modules, regardless of their age.
         cleanup : bool
             Do a cleanup of the cache removing expired and broken modules.
+        subdirs : list
+            Only look at these subdirectories of the cache directory. In
+            that case, loaded entries that have been removed from the
+            filesystem are not looked for.
+        load_keys : bool
+            If False, the key.pkl files are not loaded. This is enough to
+            find the modules that are too old.
 
         Returns
         -------
@@ -743,11 +913,13 @@ class ModuleCache(object):
         time_now = time.time()
         # Go through directories in alphabetical order to ensure consistent
         # behavior.
-        subdirs = sorted(os.listdir(self.dirname))
+        full_walk = subdirs is None
+        if full_walk:
+            subdirs = sorted(os.listdir(self.dirname))
         files, root = None, None  # To make sure the "del" below works
         for subdirs_elem in subdirs:
-            # Never clean/remove lock_dir
-            if subdirs_elem == 'lock_dir':
+            # Never clean/remove lock_dir and module_locks
+            if subdirs_elem in ('lock_dir', 'module_locks'):
                 continue
             root = os.path.join(self.dirname, subdirs_elem)
             key_pkl = os.path.join(root, 'key.pkl')
@@ -757,8 +929,13 @@ class ModuleCache(object):
                 continue
             files = os.listdir(root)
             if not files:
-                rmtree_empty(root, ignore_nocleanup=True,
-                             msg="empty dir")
+                # Another process may have just created this directory to
+                # compile a module there, possibly without holding the
+                # lock of the whole compilation directory.
+                if (time_now - os.stat(root)[stat.ST_MTIME] >
+                        config.compile.timeout):
+                    rmtree_empty(root, ignore_nocleanup=True,
+                                 msg="empty dir")
                 continue
             if 'delete.me' in files:
                 rmtree(root, ignore_nocleanup=True,
@@ -779,6 +956,8 @@ class ModuleCache(object):
                            msg="missing module file", level=logging.INFO)
                     continue
                 if (time_now - last_access_time(entry)) < age_thresh_use:
+                    if not load_keys:
+                        continue
                     _logger.debug('refresh adding %s', key_pkl)
 
                     def unpickle_failure():
@@ -935,7 +1114,10 @@ class ModuleCache(object):
         del root, files, subdirs
 
         # Remove entries that are not in the filesystem.
-        items_copy = list(self.module_hash_to_key_data.items())
+        if full_walk:
+            items_copy = list(self.module_hash_to_key_data.items())
+        else:
+            items_copy = []
         for module_hash, key_data in items_copy:
             entry = key_data.get_entry()
             try:
@@ -991,6 +1173,37 @@ class ModuleCache(object):
 
         return too_old_to_use
 
+    def rebuild_index(self):
+        """
+        Rebuild the index from the key.pkl files of all the modules.
+
+        """
+        with compilelock.lock_ctx(), self.index.lock():
+            self.refresh()
+            dir_from_hash = {}
+            for module_hash, key_data in iteritems(
+                    self.module_hash_to_key_data):
+                # Unversioned modules have no key.pkl file.
+                if os.path.exists(key_data.key_pkl):
+                    dir_from_hash[module_hash] = os.path.basename(
+                        os.path.dirname(key_data.key_pkl))
+            self.index.rewrite(dir_from_hash)
+
+    def _load_from_index(self, module_hash):
+        """
+        Load the module `module_hash` from the index if it is there.
+
+        """
+        if module_hash not in self.index.dir_from_hash:
+            # Maybe another process added it since.
+            if not self.index.update():
+                _logger.warning('The index of the module cache %s is '
+                                'corrupted, rebuilding it', self.index.path)
+                self.rebuild_index()
+        module_dir = self.index.dir_from_hash.get(module_hash)
+        if module_dir is not None:
+            self.refresh(subdirs=[module_dir], cleanup=False)
+
     def _get_from_key(self, key, key_data=None):
         """
         Returns a module if the passed-in key is found in the cache
@@ -1017,10 +1230,18 @@ class ModuleCache(object):
         return self._get_module(name)
 
     def _get_from_hash(self, module_hash, key, keep_lock=False):
+        if (self.index is not None and
+                module_hash not in self.module_hash_to_key_data):
+            self._load_from_index(module_hash)
+            # The key may be one of the keys of the loaded module.
+            module = self._get_from_key(key)
+            if module is not None:
+                return module
         if module_hash in self.module_hash_to_key_data:
             key_data = self.module_hash_to_key_data[module_hash]
             module = self._get_from_key(None, key_data)
-            with compilelock.lock_ctx(keep_lock=keep_lock):
+            with compilelock.module_lock_ctx([module_hash],
+                                             keep_lock=keep_lock):
                 try:
                     key_data.add_key(key, save_pkl=bool(key[0]))
                     key_broken = False
@@ -1086,6 +1307,8 @@ class ModuleCache(object):
             if not key_broken and self.check_for_broken_eq:
                 self.check_key(key, key_pkl)
             self.loaded_key_pkl.add(key_pkl)
+            if self.index is not None:
+                self.index.add(module_hash, os.path.basename(location))
         elif config.cmodule.warn_no_version:
             key_flat = flatten(key)
             ops = [k for k in key_flat if isinstance(k, theano.Op)]
@@ -1114,6 +1337,24 @@ class ModuleCache(object):
             If True, the compilation lock will not be released if taken.
 
         """
+        with self.thread_lock:
+            return self._module_from_key(key, lnk, keep_lock)
+
+    def cached_module(self, key, lnk):
+        """
+        Return the module of `key` if it is in the cache, None otherwise.
+
+        Unlike `module_from_key`, the module is never compiled.
+
+        """
+        with self.thread_lock:
+            module = self._get_from_key(key)
+            if module is None:
+                module = self._get_from_hash(
+                    get_module_hash(lnk.get_src_code(), key), key)
+            return module
+
+    def _module_from_key(self, key, lnk, keep_lock):
         # Is the module in the cache?
         module = self._get_from_key(key)
         if module is not None:
@@ -1126,7 +1367,7 @@ class ModuleCache(object):
         if module is not None:
             return module
 
-        with compilelock.lock_ctx(keep_lock=keep_lock):
+        with compilelock.module_lock_ctx([module_hash], keep_lock=keep_lock):
             # 1) Maybe somebody else compiled it for us while we
             #    where waiting for the lock. Try to load it again.
             # 2) If other repo that import Theano have Theano ops defined,
@@ -1141,7 +1382,10 @@ class ModuleCache(object):
             #    compilation to skip them, but not for future
             #    compilations. So reloading the cache here
             #    compilation fixes this problem. (we could do that only once)
-            self.refresh(cleanup=False)
+            # With an index, _get_from_hash reads the new entries of the index
+            # instead.
+            if self.index is None:
+                self.refresh(cleanup=False)
 
             module = self._get_from_key(key)
             if module is not None:
@@ -1156,7 +1400,13 @@ class ModuleCache(object):
             nocleanup = False
             try:
                 location = dlimport_workdir(self.dirname)
-                module = lnk.compile_cmodule(location)
+                if (config.compile.per_module_lock and not keep_lock and
+                        hasattr(lnk, 'build_cmodule')):
+                    # We hold the lock of this module only, and we do not
+                    # want compile_cmodule to lock the whole directory.
+                    module = lnk.build_cmodule(location)
+                else:
+                    module = lnk.compile_cmodule(location)
                 name = module.__file__
                 assert name.startswith(location)
                 assert name not in self.module_from_name
@@ -1184,6 +1434,123 @@ class ModuleCache(object):
         self.stats[2] += 1
         return module
 
+    def modules_from_keys(self, key_lnk_pairs, n_workers=None):
+        """
+        Return the modules of many keys, compiling the missing ones in
+        parallel.
+
+        All the cache misses are collected first. While the compilation lock
+        is held, they are compiled by up to `n_workers` concurrent compiler
+        processes, then loaded and added to the cache in the order of
+        `key_lnk_pairs`.
+
+        Parameters
+        ----------
+        key_lnk_pairs
+            A list of (key, lnk) pairs, as passed to `module_from_key`. `lnk`
+            must also define `build_cmodule(location, py_module)`, that
+            compiles the module without taking the compilation lock.
+            Only the missing modules are locked when the
+            compile.per_module_lock flag is True.
+        n_workers
+            The maximum number of modules compiled at the same time.
+            Defaults to config.cmodule.compile_workers.
+
+        Returns
+        -------
+        list
+            The module of each pair. It is None when the compilation failed,
+            so that the error can be raised again by `module_from_key`.
+
+        """
+        with self.thread_lock:
+            return self._modules_from_keys(key_lnk_pairs, n_workers)
+
+    def _modules_from_keys(self, key_lnk_pairs, n_workers):
+        if n_workers is None:
+            n_workers = config.cmodule.compile_workers
+        modules = [None] * len(key_lnk_pairs)
+
+        def find_missing():
+            # Return an OrderedDict mapping the module hash of each missing
+            # module to the indices of the pairs that need it.
+            missing = OrderedDict()
+            for i, (key, lnk) in enumerate(key_lnk_pairs):
+                if modules[i] is not None:
+                    continue
+                modules[i] = self._get_from_key(key)
+                if modules[i] is not None:
+                    continue
+                module_hash = get_module_hash(lnk.get_src_code(), key)
+                modules[i] = self._get_from_hash(module_hash, key)
+                if modules[i] is None:
+                    missing.setdefault(module_hash, []).append(i)
+            return missing
+
+        missing = find_missing()
+        if not missing:
+            return modules
+
+        with compilelock.module_lock_ctx(missing):
+            # Somebody else may have compiled some of them while we were
+            # waiting for the lock.
+            if self.index is None:
+                self.refresh(cleanup=False)
+            missing = find_missing()
+            jobs = [(idxs[0], dlimport_workdir(self.dirname))
+                    for idxs in itervalues(missing)]
+
+            def build(job):
+                i, location = job
+                try:
+                    key_lnk_pairs[i][1].build_cmodule(location,
+                                                      py_module=False)
+                except Exception as e:
+                    return e
+                return None
+
+            n_workers = min(n_workers, len(jobs))
+            _logger.debug('Compiling %i modules with %i workers',
+                          len(jobs), n_workers)
+            if n_workers > 1:
+                pool = ThreadPool(n_workers)
+                try:
+                    errors = pool.map(build, jobs)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                errors = [build(job) for job in jobs]
+
+            for (module_hash, idxs), (i, location), error in zip(
+                    iteritems(missing), jobs, errors):
+                key = key_lnk_pairs[i][0]
+                try:
+                    if error is not None:
+                        raise error
+                    # touch the __init__ file
+                    open(os.path.join(location, "__init__.py"), 'w').close()
+                    module = dlimport(module_name_from_dir(location))
+                except Exception as e:
+                    # The error will be raised again, with more context,
+                    # when the caller retries this key with module_from_key.
+                    _logger.debug('Parallel compilation failed for %s: %s',
+                                  location, e)
+                    _rmtree(location, ignore_if_missing=True,
+                            msg='exception during compilation')
+                    continue
+                self.module_from_name[module.__file__] = module
+                key_data = self._add_to_cache(module, key, module_hash)
+                self.module_hash_to_key_data[module_hash] = key_data
+                self.stats[2] += 1
+                for j in idxs:
+                    other_key = key_lnk_pairs[j][0]
+                    modules[j] = self._get_from_key(other_key)
+                    if modules[j] is None:
+                        modules[j] = self._get_from_hash(module_hash,
+                                                         other_key)
+        return modules
+
     def check_key(self, key, key_pkl):
         """
         Perform checks to detect broken __eq__ / __hash__ implementations.
@@ -1291,8 +1658,10 @@ class ModuleCache(object):
         too_old_to_use = self.refresh(
             age_thresh_use=age_thresh_use,
             delete_if_problem=delete_if_problem,
-            # The clean up is done at init, no need to trigger it again
-            cleanup=False)
+            # The clean up is done at init, no need to trigger it again,
+            # except when the index replaced the refresh at init.
+            cleanup=self.index is not None,
+            load_keys=self.index is None)
         if not too_old_to_use:
             return
         with compilelock.lock_ctx():
@@ -1311,6 +1680,11 @@ class ModuleCache(object):
                 _rmtree(parent, msg='old cache directory', level=logging.INFO,
                         ignore_nocleanup=True)
 
+            if self.index is not None:
+                # Drop the entries of the deleted modules.
+                if not self.index.remove_missing(self.dirname):
+                    self.rebuild_index()
+
     def clear(self, unversioned_min_age=None, clear_base_files=False,
               delete_if_problem=False):
         """
@@ -1340,8 +1714,9 @@ class ModuleCache(object):
 
     def clear_base_files(self):
         """
-        Remove base directories 'cuda_ndarray', 'cutils_ext', 'lazylinker_ext'
-        and 'scan_perform' if present.
+        Remove base directories 'cuda_ndarray', 'cutils_ext', 'lazylinker_ext',
+        'scan_perform', 'pch' and 'optimized_graphs' if present, and the saved
+        detection results (see DetectionCache).
 
         Note that we do not delete them outright because it may not work on
         some systems due to these modules being currently in use. Instead we
@@ -1350,8 +1725,11 @@ class ModuleCache(object):
 
         """
         with compilelock.lock_ctx():
+            for name in os.listdir(self.dirname):
+                if name.startswith('detection_'):
+                    os.remove(os.path.join(self.dirname, name))
             for base_dir in ('cuda_ndarray', 'cutils_ext', 'lazylinker_ext',
-                             'scan_perform'):
+                             'scan_perform', 'pch', 'optimized_graphs'):
                 to_delete = os.path.join(self.dirname, base_dir + '.delete.me')
                 if os.path.isdir(to_delete):
                     try:
@@ -1728,6 +2106,109 @@ def gcc_llvm():
 gcc_llvm.is_llvm = None
 
 
+def cpu_flags():
+    """
+    Return a description of the CPU, including the instruction sets it
+    supports when the platform tells them.
+
+    """
+    if cpu_flags.data is None:
+        if os.path.exists('/proc/cpuinfo'):
+            info = {}
+            with open('/proc/cpuinfo') as f:
+                for line in f:
+                    name, _, value = line.partition(':')
+                    info.setdefault(name.strip(), value.strip())
+            cpu_flags.data = [info.get('model name'), info.get('flags'),
+                              info.get('Features')]
+        else:
+            cpu_flags.data = [platform.machine(), platform.processor()]
+    return cpu_flags.data
+cpu_flags.data = None
+
+
+class DetectionCache(object):
+    """
+    Results of the detection of the compiler and BLAS flags.
+
+    The detection runs the compiler many times. Its results are saved in
+    the compiledir to be reused by the next processes. They are keyed by
+    the compiler and its version, the CPU, the Python and numpy
+    installations and the environment variables that tell the compiler
+    where to find headers and libraries. "theano-cache clear" removes them.
+    Only the successful detections are saved: a library or a compiler
+    feature installed after a failure is detected by the next processes.
+
+    See the cmodule.cache_detection flag.
+
+    Parameters
+    ----------
+    dirname : str
+        The directory of the saved results. Defaults to config.compiledir.
+
+    """
+
+    env_vars = ['PATH', 'CPATH', 'CPLUS_INCLUDE_PATH', 'LIBRARY_PATH',
+                'LD_LIBRARY_PATH', 'DYLD_LIBRARY_PATH', 'MKLROOT']
+
+    def __init__(self, dirname=None):
+        self.dirname = dirname
+        self.path = None
+        self.values = {}
+
+    def key(self):
+        return hash_from_code(repr([
+            theano.config.cxx, gcc_version_str, config.gcc.cxxflags,
+            sys.prefix, numpy.__file__, cpu_flags(),
+            [(var, os.environ.get(var)) for var in self.env_vars]]))
+
+    def load(self):
+        path = os.path.join(self.dirname or config.compiledir,
+                            'detection_%s.pkl' % self.key())
+        if path != self.path:
+            self.path = path
+            self.values = {}
+            try:
+                with open(path, 'rb') as f:
+                    self.values = pickle.load(f)
+            except (IOError, EOFError, pickle.UnpicklingError):
+                pass
+
+    def get(self, name):
+        """
+        Return the saved value of `name`, or None.
+
+        """
+        if not config.cmodule.cache_detection:
+            return None
+        self.load()
+        return self.values.get(name)
+
+    def set(self, name, value):
+        """
+        Save the value of `name` for the next processes.
+
+        """
+        if not config.cmodule.cache_detection:
+            return
+        self.load()
+        self.values[name] = value
+        # Write a temporary file and rename it, so that other processes
+        # never read a partial file.
+        tmp_path = '%s.%s.tmp' % (self.path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(self.values, f, protocol=pickle.HIGHEST_PROTOCOL)
+            if sys.platform == 'win32' and os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            _logger.debug('Could not save %s: %s', self.path, e)
+
+
+detection_cache = DetectionCache()
+
+
 class Compiler(object):
     """
     Meta compiler that offer some generic function.
@@ -1762,6 +2243,13 @@ class Compiler(object):
             args = cls.compile_args()
         else:
             args = []
+        cache_name = None
+        if compiler == theano.config.cxx:
+            cache_name = 'try_compile_tmp_' + hash_from_code(
+                repr((src_code, args, flags, try_run, output)))
+            res = detection_cache.get(cache_name)
+            if res is not None:
+                return res
         compilation_ok = True
         run_ok = False
         out, err = None, None
@@ -1803,13 +2291,17 @@ class Compiler(object):
             compilation_ok = False
 
         if not try_run and not output:
-            return compilation_ok
+            res = compilation_ok
         elif not try_run and output:
-            return (compilation_ok, out, err)
+            res = (compilation_ok, out, err)
         elif not output:
-            return (compilation_ok, run_ok)
+            res = (compilation_ok, run_ok)
         else:
-            return (compilation_ok, run_ok, out, err)
+            res = (compilation_ok, run_ok, out, err)
+        if cache_name is not None and compilation_ok and (run_ok or
+                                                          not try_run):
+            detection_cache.set(cache_name, res)
+        return res
 
     @classmethod
     def _try_flags(cls, flag_list, preambule="", body="",
@@ -1915,6 +2407,12 @@ class GCC_compiler(Compiler):
             )
             detect_march = False
 
+        if detect_march:
+            cached_flags = detection_cache.get('march_flags')
+            if cached_flags is not None:
+                GCC_compiler.march_flags = list(cached_flags)
+                detect_march = False
+
         if detect_march:
             GCC_compiler.march_flags = []
 
@@ -2132,6 +2630,9 @@ class GCC_compiler(Compiler):
                 if not march_success:
                     GCC_compiler.march_flags = []
 
+            if GCC_compiler.march_flags:
+                detection_cache.set('march_flags', GCC_compiler.march_flags)
+
         # Add the detected -march=native equivalent flags
         if march_flags and GCC_compiler.march_flags:
             cxxflags.extend(GCC_compiler.march_flags)
@@ -2278,6 +2779,15 @@ class GCC_compiler(Compiler):
             # improved loading times on most platforms (win32 is
             # different, as usual).
             cmd.append('-fvisibility=hidden')
+        if (config.cmodule.precompiled_headers and src_code.startswith(
+                ''.join('#include %s\n' % inc for inc in pch_includes))):
+            # The precompiled header must be built with the same compiler
+            # flags. The linker flags do not matter.
+            pch = precompiled_header(
+                [a for a in cmd if a != get_gcc_shared_library_arg() and
+                 not a.startswith(('-L', '-l', '-Wl,'))])
+            if pch is not None:
+                cmd.extend(['-include', pch])
         cmd.extend(['-o', lib_filename])
         cmd.append(cppfilename)
         cmd.extend(['-l%s' % l for l in libs])
@@ -2290,15 +2800,43 @@ class GCC_compiler(Compiler):
                    "command line below:"), file=sys.stderr)
             print(' '.join(cmd), file=sys.stderr)
 
-        try:
-            p_out = output_subprocess_Popen(cmd)
-            compile_stderr = decode(p_out[1])
-        except Exception:
-            # An exception can occur e.g. if `g++` is not found.
-            print_command_line_error()
-            raise
+        global object_cache_hits, object_cache_misses
+        cache_path = None
+        if config.cmodule.object_cache:
+            cache_path = object_cache_path(cmd, cppfilename, lib_filename)
+        if cache_path is not None and os.path.exists(cache_path):
+            _logger.debug('Copying %s from the object cache', cache_path)
+            shutil.copyfile(cache_path, lib_filename)
+            object_cache_hits += 1
+            status = 0
+            compile_stderr = ''
+        else:
+            try:
+                p_out = output_subprocess_Popen(cmd)
+                compile_stderr = decode(p_out[1])
+            except Exception:
+                # An exception can occur e.g. if `g++` is not found.
+                print_command_line_error()
+                raise
 
-        status = p_out[2]
+            status = p_out[2]
+            if cache_path is not None and not status:
+                # Copy under a temporary name then rename, so that other
+                # processes never see a partial file.
+                cache_dir = os.path.dirname(cache_path)
+                if not os.path.isdir(cache_dir):
+                    try:
+                        os.makedirs(cache_dir)
+                    except OSError:
+                        # Another process created it.
+                        assert os.path.isdir(cache_dir)
+                tmp_path = '%s.%s.tmp' % (cache_path, os.getpid())
+                shutil.copyfile(lib_filename, tmp_path)
+                if sys.platform == 'win32' and os.path.exists(cache_path):
+                    os.remove(tmp_path)
+                else:
+                    os.rename(tmp_path, cache_path)
+                object_cache_misses += 1
 
         if status:
             tf = tempfile.NamedTemporaryFile(
@@ -2347,5 +2885,95 @@ class GCC_compiler(Compiler):
             return dlimport(lib_filename)
 
 
+# The first headers included by most of the modules generated by CLinker.
+pch_includes = ['<Python.h>', '<iostream>', '"theano_mod_helper.h"',
+                '<math.h>', '<numpy/arrayobject.h>', '<numpy/arrayscalars.h>']
+
+
+def precompiled_header(cmd):
+    """
+    Return the path of a header to pass to `-include` to use a precompiled
+    version of the `pch_includes` headers, building it if needed.
+
+    Parameters
+    ----------
+    cmd
+        The compiler command line, without the output and source files and
+        the linker arguments. The precompiled header is only valid for this
+        set of arguments.
+
+    Returns
+    -------
+    str or None
+        None if the precompiled header could not be built.
+
+    """
+    content = ''.join('#include %s\n' % inc
+                      for inc in pch_includes + ['<vector>', '<algorithm>'])
+    h = hash_from_code('\n'.join([gcc_version_str] + cmd + [content]))
+    if h in precompiled_header.failed:
+        return None
+    pch_dir = os.path.join(config.compiledir, 'pch', h)
+    header = os.path.join(pch_dir, 'theano_pch.h')
+    gch = header + '.gch'
+    if os.path.exists(gch):
+        return header
+    # Other processes may build it at the same time: write temporary files
+    # and rename them.
+    if not os.path.isdir(pch_dir):
+        try:
+            os.makedirs(pch_dir)
+        except OSError:
+            assert os.path.isdir(pch_dir)
+    tmp_suffix = '.%s.tmp' % os.getpid()
+    if not os.path.exists(header):
+        with open(header + tmp_suffix, 'w') as f:
+            f.write(content)
+        os.rename(header + tmp_suffix, header)
+    _logger.debug('Building precompiled header %s', gch)
+    p_out = output_subprocess_Popen(
+        cmd + ['-x', 'c++-header', '-o', gch + tmp_suffix, header])
+    if p_out[2]:
+        _logger.warning('Could not build the precompiled header %s: %s',
+                        gch, decode(p_out[1]))
+        precompiled_header.failed.add(h)
+        return None
+    os.rename(gch + tmp_suffix, gch)
+    return header
+precompiled_header.failed = set()
+
+
+def object_cache_path(cmd, cppfilename, lib_filename):
+    """
+    Return the path of the shared library built by `cmd` in the object cache.
+
+    The library is identified by the hash of the preprocessed source code,
+    of the command line (without the paths of the module directory) and of
+    the compiler version. Return None if the source could not be
+    preprocessed.
+
+    """
+    # The source is preprocessed from its directory, so that __FILE__ does
+    # not depend on it.
+    location = os.path.dirname(cppfilename)
+    pre_cmd = [os.path.basename(a) if a == cppfilename else a
+               for a in cmd if a not in ('-o', lib_filename)] + ['-E', '-P']
+    try:
+        p_out = output_subprocess_Popen(pre_cmd, cwd=location)
+    except OSError:
+        return None
+    if p_out[2]:
+        return None
+    to_hash = [theano.config.cxx, gcc_version_str,
+               compiledir_format_dict['short_platform'],
+               os.path.basename(lib_filename)]
+    to_hash += [a.replace(location, '<location>').replace(
+                config.compiledir, '<compiledir>')
+                for a in cmd if a not in ('-o', lib_filename, cppfilename)]
+    h = hash_from_code('\n'.join(to_hash) + '\n' + decode(p_out[0]))
+    return os.path.join(config.base_compiledir, 'object_cache', h[-2:],
+                        '%s.%s' % (h, get_lib_extension()))
+
+
 def icc_module_compile_str(*args):
     raise NotImplementedError()
@@ -2,12 +2,14 @@ from __future__ import absolute_import, print_function, division
 import six.moves.cPickle as pickle
 import logging
 import os
+import platform
 import shutil
+import tarfile
 
 import numpy as np
 
 import theano
-from six import string_types, iteritems
+from six import BytesIO, string_types, iteritems
 from theano.configparser import config
 from theano.gof.utils import flatten
 
@@ -189,6 +191,174 @@ def compiledir_purge():
     shutil.rmtree(config.compiledir)
 
 
+def _bundle_platform():
+    """
+    Return what a compiled module depends on, besides the compiler and its
+    arguments (that are part of the keys of the module).
+
+    """
+    from theano.configdefaults import compiledir_format_dict
+    return dict(short_platform=compiledir_format_dict['short_platform'],
+                processor=compiledir_format_dict['processor'],
+                python_bitwidth=compiledir_format_dict['python_bitwidth'],
+                python_version=platform.python_version_tuple()[:2])
+
+
+def _arch_flags(compile_args):
+    """
+    Return the set of the arguments of the compiler in `compile_args` that
+    select the target processor: the -m flags, like the -march flags, and
+    the values of the --param options (the keys of the modules have sorted
+    arguments, so the values are the arguments that don't start with -).
+
+    """
+    return set(arg for arg in compile_args
+               if arg.startswith('-m') or not arg.startswith('-'))
+
+
+def _compatible_key(key):
+    """
+    Return True if the module of this key can be used by this installation.
+
+    The compiler version and the numpy ABI must be the same, and the module
+    must not target processor features that the -march flags of this
+    installation don't enable. The other arguments of the compiler don't
+    matter: Ops can remove default ones with c_no_compile_args.
+
+    """
+    from theano.gof.cmodule import GCC_compiler
+    c_link_key = key[1]
+    compile_args = c_link_key[1]
+    strings = [k for k in c_link_key if isinstance(k, string_types)]
+    npy_abi = 'NPY_ABI_VERSION=0x%X' % np.core.multiarray._get_ndarray_c_version()
+    return (('c_compiler_str=' + GCC_compiler.version_str()) in strings and
+            npy_abi in strings and
+            _arch_flags(compile_args).issubset(
+                _arch_flags(GCC_compiler.compile_args())))
+
+
+def _safe_member_name(name):
+    """
+    Return True if the archive member `name`, relative to the directory of
+    its module, stays inside the directory where it is extracted.
+
+    """
+    if not name or os.path.isabs(name):
+        return False
+    parts = os.path.normpath(name).split(os.sep)
+    return parts[0] not in (os.curdir, os.pardir)
+
+
+def export_compiledir(filename):
+    """
+    Save the versioned modules of the compiledir in the archive `filename`.
+
+    The archive can be installed in another compiledir with
+    `import_compiledir`.
+
+    Returns
+    -------
+    int
+        The number of exported modules.
+
+    """
+    from theano.gof import compilelock
+    from theano.gof.cc import get_module_cache
+    cache = get_module_cache()
+    modules = []
+    with compilelock.lock_ctx():
+        cache.refresh(cleanup=False)
+        with tarfile.open(filename, 'w:gz') as tar:
+            for module_hash, key_data in sorted(
+                    iteritems(cache.module_hash_to_key_data)):
+                # Unversioned modules have no key.pkl file.
+                if not os.path.exists(key_data.key_pkl):
+                    continue
+                dir = os.path.dirname(key_data.key_pkl)
+                tar.add(dir, arcname=os.path.basename(dir))
+                modules.append((os.path.basename(dir), module_hash))
+            manifest = pickle.dumps(dict(platform=_bundle_platform(),
+                                         modules=modules),
+                                    protocol=pickle.HIGHEST_PROTOCOL)
+            info = tarfile.TarInfo('manifest.pkl')
+            info.size = len(manifest)
+            tar.addfile(info, BytesIO(manifest))
+    return len(modules)
+
+
+def import_compiledir(filename):
+    """
+    Install in the compiledir the modules of an archive made by
+    `export_compiledir`.
+
+    Modules that the compiledir already has, or that were compiled with
+    another compiler, for other processor features or for another platform
+    are skipped, as are the modules whose files would be written outside of
+    their directory.  Only import archives from trusted sources: the keys
+    of the modules are pickled.
+
+    Returns
+    -------
+    int
+        The number of installed modules.
+
+    """
+    from theano.gof import compilelock
+    from theano.gof.cc import get_module_cache
+    from theano.gof.cmodule import dlimport_workdir, module_name_from_dir
+    cache = get_module_cache()
+    n_installed = 0
+    with tarfile.open(filename, 'r:*') as tar:
+        manifest = pickle.load(tar.extractfile('manifest.pkl'))
+        if manifest['platform'] != _bundle_platform():
+            _logger.warning(
+                "Skipping all the modules of %s as they were compiled for "
+                "another platform: %s", filename, manifest['platform'])
+            return 0
+        members = {}
+        for member in tar.getmembers():
+            dir = member.name.split('/')[0]
+            # Links are not extracted, as they could point anywhere.
+            if dir != member.name and (member.isfile() or member.isdir()):
+                members.setdefault(dir, []).append(member)
+        with compilelock.lock_ctx():
+            cache.refresh(cleanup=False)
+            for dir, module_hash in manifest['modules']:
+                if (module_hash in cache.module_hash_to_key_data or
+                        (cache.index is not None and
+                         module_hash in cache.index.dir_from_hash)):
+                    continue
+                key_data = pickle.load(tar.extractfile(dir + '/key.pkl'))
+                if not all(_compatible_key(key) for key in key_data.keys):
+                    _logger.info("Skipping incompatible module %s",
+                                 module_hash)
+                    continue
+                names = [(member, member.name[len(dir) + 1:])
+                         for member in members.get(dir, [])]
+                if not all(_safe_member_name(name) for member, name in names):
+                    _logger.warning("Skipping module %s of %s: its files "
+                                    "would be written outside of its "
+                                    "directory", module_hash, filename)
+                    continue
+                location = dlimport_workdir(config.compiledir)
+                for member, name in names:
+                    if member.isdir():
+                        os.makedirs(os.path.join(location, name))
+                    elif name != 'key.pkl':
+                        with open(os.path.join(location, name), 'wb') as f:
+                            shutil.copyfileobj(tar.extractfile(member), f)
+                # Make the key data point to its new location. Writing
+                # key.pkl last ensures that the module is complete when
+                # other processes see it.
+                key_data.key_pkl = os.path.join(location, 'key.pkl')
+                key_data.entry = module_name_from_dir(location)
+                key_data.save_pkl()
+                if cache.index is not None:
+                    cache.index.add(module_hash, os.path.basename(location))
+                n_installed += 1
+    return n_installed
+
+
 def basecompiledir_ls():
     """
     Print list of files in the "theano.config.base_compiledir"
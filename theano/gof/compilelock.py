@@ -5,6 +5,7 @@ from __future__ import absolute_import, print_function, division
 import atexit
 import os
 import socket  # only used for gethostname()
+import threading
 import time
 import logging
 
@@ -24,6 +25,12 @@ if _logger.level == logging.NOTSET:
 
 hostname = socket.gethostname()
 
+# The locks below only exclude the other processes, and their counters
+# are shared by the threads of this process. A thread holds this lock
+# while it holds any of them, so that the other threads wait for it. The
+# ModuleCache uses it as its own thread lock.
+thread_lock = threading.RLock()
+
 
 def force_unlock():
     """
@@ -62,6 +69,15 @@ def _get_lock(lock_dir=None, **kw):
     """
     if lock_dir is None:
         lock_dir = os.path.join(config.compiledir, 'lock_dir')
+    thread_lock.acquire()
+    try:
+        _get_lock_state(lock_dir, **kw)
+    except Exception:
+        thread_lock.release()
+        raise
+
+
+def _get_lock_state(lock_dir, **kw):
     if not hasattr(get_lock, 'n_lock'):
         # Initialization.
         get_lock.n_lock = 0
@@ -80,30 +96,7 @@ def _get_lock(lock_dir=None, **kw):
             get_lock.unlocker = Unlocker(get_lock.lock_dir)
 
     if get_lock.lock_is_enabled:
-        # Only really try to acquire the lock if we do not have it already.
-        if get_lock.n_lock == 0:
-            lock(get_lock.lock_dir, **kw)
-            atexit.register(Unlocker.unlock, get_lock.unlocker)
-            # Store time at which the lock was set.
-            get_lock.start_time = time.time()
-        else:
-            # Check whether we need to 'refresh' the lock. We do this
-            # every 'config.compile.timeout / 2' seconds to ensure
-            # no one else tries to override our lock after their
-            # 'config.compile.timeout' timeout period.
-            if get_lock.start_time is None:
-                # This should not happen. So if this happen, clean up
-                # the lock state and raise an error.
-                while get_lock.n_lock > 0:
-                    release_lock()
-                raise Exception("For some unknow reason, the lock was already "
-                                "taken, but no start time was registered.")
-            now = time.time()
-            if now - get_lock.start_time > config.compile.timeout / 2:
-                lockpath = os.path.join(get_lock.lock_dir, 'lock')
-                _logger.info('Refreshing lock %s', str(lockpath))
-                refresh_lock(lockpath)
-                get_lock.start_time = now
+        _acquire(get_lock, **kw)
     get_lock.n_lock += 1
 
 
@@ -115,12 +108,167 @@ def release_lock():
     Release lock on compilation directory.
 
     """
-    get_lock.n_lock -= 1
-    assert get_lock.n_lock >= 0
+    try:
+        _release(get_lock, get_lock.lock_is_enabled)
+    finally:
+        thread_lock.release()
+
+
+def _acquire(state, **kw):
+    """
+    Take or refresh the lock described by `state`.
+
+    `state` is `get_lock` itself or a `_LockState`: it has the attributes
+    `lock_dir`, `n_lock`, `start_time` and `unlocker`. The caller increments
+    `state.n_lock`.
+
+    """
+    # Only really try to acquire the lock if we do not have it already.
+    if state.n_lock == 0:
+        lock(state.lock_dir, **kw)
+        # Store time at which the lock was set.
+        state.start_time = time.time()
+    else:
+        # Check whether we need to 'refresh' the lock. We do this
+        # every 'config.compile.timeout / 2' seconds to ensure
+        # no one else tries to override our lock after their
+        # 'config.compile.timeout' timeout period.
+        if state.start_time is None:
+            # This should not happen. So if this happen, clean up
+            # the lock state and raise an error.
+            while state.n_lock > 0:
+                _release(state, True)
+            raise Exception("For some unknow reason, the lock was already "
+                            "taken, but no start time was registered.")
+        now = time.time()
+        if now - state.start_time > config.compile.timeout / 2:
+            lockpath = os.path.join(state.lock_dir, 'lock')
+            _logger.info('Refreshing lock %s', str(lockpath))
+            refresh_lock(lockpath)
+            state.start_time = now
+
+
+def _release(state, lock_is_enabled):
+    state.n_lock -= 1
+    assert state.n_lock >= 0
     # Only really release lock once all lock requests have ended.
-    if get_lock.lock_is_enabled and get_lock.n_lock == 0:
-        get_lock.start_time = None
+    if lock_is_enabled and state.n_lock == 0:
+        state.start_time = None
+        state.unlocker.unlock(force=False)
+
+
+class _LockState(object):
+    """
+    Bookkeeping of a module lock, like the attributes of `get_lock` for the
+    lock of the whole compilation directory.
+
+    """
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        self.n_lock = 0
+        self.start_time = None
+        self.unlocker = Unlocker(lock_dir)
+
+# Map a module lock directory to its _LockState, while it is held.
+_module_locks = {}
+
+
+def _unlock_all():
+    """
+    Release the locks still held when the process exits.
+
+    """
+    if getattr(get_lock, 'n_lock', 0) > 0:
         get_lock.unlocker.unlock(force=False)
+    for state in list(_module_locks.values()):
+        state.unlocker.unlock(force=False)
+
+atexit.register(_unlock_all)
+
+
+def module_lock_dir(module_hash):
+    """
+    Return the directory whose creation locks the module `module_hash`.
+
+    """
+    return os.path.join(config.compiledir, 'module_locks', module_hash)
+
+
+def get_module_lock(module_hash, **kw):
+    """
+    Obtain the lock of a single module of the compilation directory.
+
+    This lock only excludes the processes that compile or update the same
+    module, so that different modules can be compiled at the same time. It
+    is reentrant, and is refreshed and overridden when stale exactly like
+    the lock of the whole directory.
+
+    Parameters
+    ----------
+    module_hash : str
+        The module hash, as returned by `cmodule.get_module_hash`.
+    kw
+        Additional arguments to be forwarded to the `lock` function when
+        acquiring the lock.
+
+    """
+    lock_dir = module_lock_dir(module_hash)
+    thread_lock.acquire()
+    try:
+        if lock_dir not in _module_locks:
+            _module_locks[lock_dir] = _LockState(lock_dir)
+        state = _module_locks[lock_dir]
+        if getattr(get_lock, 'lock_is_enabled', True):
+            _acquire(state, **kw)
+    except Exception:
+        if _module_locks[lock_dir].n_lock == 0:
+            del _module_locks[lock_dir]
+        thread_lock.release()
+        raise
+    state.n_lock += 1
+
+
+def release_module_lock(module_hash):
+    """
+    Release the lock taken by `get_module_lock`.
+
+    """
+    lock_dir = module_lock_dir(module_hash)
+    state = _module_locks[lock_dir]
+    try:
+        _release(state, getattr(get_lock, 'lock_is_enabled', True))
+        if state.n_lock == 0:
+            del _module_locks[lock_dir]
+    finally:
+        thread_lock.release()
+
+
+@contextmanager
+def module_lock_ctx(module_hashes, keep_lock=False, **kw):
+    """
+    Lock the modules `module_hashes` of the compilation directory.
+
+    If the `compile.per_module_lock` flag is False, or if `keep_lock` is
+    True, the whole compilation directory is locked instead, as with
+    `lock_ctx`.
+
+    """
+    if keep_lock or not config.compile.per_module_lock:
+        with lock_ctx(keep_lock=keep_lock, **kw):
+            yield
+        return
+    # Always lock in the same order, so that two processes that need
+    # several modules cannot deadlock.
+    taken = []
+    try:
+        for module_hash in sorted(set(module_hashes)):
+            get_module_lock(module_hash, **kw)
+            taken.append(module_hash)
+        yield
+    finally:
+        for module_hash in reversed(taken):
+            release_module_lock(module_hash)
 
 
 def set_lock_status(use_lock):
@@ -238,7 +386,7 @@ def lock(tmp_dir, timeout=notset, min_wait=None, max_wait=None, verbosity=1):
                         msg = "process '%s'" % read_owner.split('_')[0]
                         _logger.warning("Overriding existing lock by dead %s "
                                         "(I am process '%s')", msg, my_pid)
-                    get_lock.unlocker.unlock(force=True)
+                    Unlocker(tmp_dir).unlock(force=True)
                     continue
                 if last_owner == read_owner:
                     if (timeout is not None and
@@ -251,7 +399,7 @@ def lock(tmp_dir, timeout=notset, min_wait=None, max_wait=None, verbosity=1):
                                 msg = "process '%s'" % read_owner.split('_')[0]
                             _logger.warning("Overriding existing lock by %s "
                                             "(I am process '%s')", msg, my_pid)
-                        get_lock.unlocker.unlock(force=True)
+                        Unlocker(tmp_dir).unlock(force=True)
                         continue
                 else:
                     last_owner = read_owner
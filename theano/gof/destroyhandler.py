@@ -905,7 +905,16 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         if self.destroyers:
             ords = self.orderings(fgraph)
 
-            if _contains_cycle(fgraph, ords):
+            if (theano.config.cycle_detection == 'incremental' and
+                    hasattr(fgraph, 'incremental_toposort')):
+                # Only the orderings that the order kept by the
+                # IncrementalToposort feature does not respect yet, i.e.
+                # the ones added since the last validation, are checked.
+                if not fgraph.incremental_toposort.add_orderings(fgraph,
+                                                                 ords):
+                    raise InconsistencyError(
+                        "Dependency graph contains cycles")
+            elif _contains_cycle(fgraph, ords):
                 raise InconsistencyError("Dependency graph contains cycles")
         else:
             # James's Conjecture:
@@ -160,6 +160,7 @@ class FunctionGraph(utils.object2):
         for f in features:
             self.attach_feature(f)
         self.attach_feature(toolbox.ReplaceValidate())
+        self.attach_feature(toolbox.IncrementalToposort())
 
         for input in self.inputs:
             if input.owner is not None:
@@ -613,6 +614,9 @@ class FunctionGraph(utils.object2):
         this FunctionGraph as sole argument. It should return a dictionary of
         `{node: predecessors}` where predecessors is a list of nodes that
         should be computed before the key node.
+
+        The order is kept by the IncrementalToposort feature between the
+        calls, and only repaired where the graph changed.
         """
         if len(self.apply_nodes) < 2:
             # optimization
@@ -620,13 +624,10 @@ class FunctionGraph(utils.object2):
             # This special case happens a lot because the OpWiseCLinker
             # produces 1-element graphs.
             return list(self.apply_nodes)
-        fg = self
-
         ords = self.orderings()
-
-        order = graph.io_toposort(fg.inputs, fg.outputs, ords)
-
-        return order
+        if hasattr(self, 'incremental_toposort'):
+            return self.incremental_toposort.toposort(self, ords)
+        return graph.io_toposort(self.inputs, self.outputs, ords)
 
     def orderings(self):
         """
@@ -43,6 +43,27 @@ class Node(utils.object2):
         """
         raise NotImplementedError()
 
+    def __getstate__(self):
+        """
+        Return the attributes of the node, the ones stored in its
+        `__slots__` and the ones in its `__dict__`.
+
+        """
+        d = self.__dict__.copy()
+        for cls in type(self).__mro__:
+            for attr in cls.__dict__.get('__slots__', ()):
+                if attr not in d:
+                    try:
+                        d[attr] = cls.__dict__[attr].__get__(self)
+                    except AttributeError:
+                        pass
+        return d
+
+    def __setstate__(self, d):
+        # Also accepts the state of nodes pickled before they had slots.
+        for attr, value in iteritems(d):
+            object.__setattr__(self, attr, value)
+
 
 class Apply(Node):
     """
@@ -90,6 +111,10 @@ class Apply(Node):
 
     """
 
+    # The attributes set by FunctionGraph are also slots, so that most
+    # nodes never need a __dict__.
+    __slots__ = ['op', 'inputs', 'outputs', 'tag', 'fgraph', 'deps']
+
     def __init__(self, op, inputs, outputs):
         self.op = op
         self.inputs = []
@@ -130,10 +155,9 @@ class Apply(Node):
         return NoParams
 
     def __getstate__(self):
-        d = self.__dict__
+        d = super(Apply, self).__getstate__()
         # ufunc don't pickle/unpickle well
         if hasattr(self.tag, 'ufunc'):
-            d = copy(self.__dict__)
             t = d["tag"]
             del t.ufunc
             d["tag"] = t
@@ -232,7 +256,7 @@ class Apply(Node):
         remake_node = False
         new_inputs = inputs[:]
         for i, (curr, new) in enumerate(zip(self.inputs, new_inputs)):
-            if not curr.type == new.type:
+            if curr.type is not new.type and not curr.type == new.type:
                 if strict:
                     # If compatible, casts new into curr.type
                     new_inputs[i] = curr.type.filter_variable(new)
@@ -368,7 +392,8 @@ class Variable(Node):
 
     """
 
-    # __slots__ = ['type', 'owner', 'index', 'name']
+    __slots__ = ['type', 'owner', 'index', 'name', 'auto_name', 'tag',
+                 'fgraph', 'clients']
     __count__ = count(0)
 
     def __init__(self, type, owner=None, index=None, name=None):
@@ -521,7 +546,7 @@ class Variable(Node):
         return rval
 
     def __getstate__(self):
-        d = self.__dict__.copy()
+        d = super(Variable, self).__getstate__()
         d.pop("_fn_cache", None)
         return d
 
@@ -543,7 +568,8 @@ class Constant(Variable):
 
     """
 
-    # __slots__ = ['data']
+    __slots__ = ['data']
+
     def __init__(self, type, data, name=None):
         Variable.__init__(self, type, None, None, name)
         self.data = type.filter(data)
@@ -669,11 +695,19 @@ def ancestors(variable_list, blockers=None):
         search started at the nodes in `variable_list`.
 
     """
-    def expand(r):
-        if r.owner and (not blockers or r not in blockers):
-            return reversed(r.owner.inputs)
-    dfs_variables = stack_search(deque(variable_list), expand, 'dfs')
-    return dfs_variables
+    # The same search as stack_search(deque(variable_list), expand, 'dfs'),
+    # without a function call and a list for each variable.
+    seen = set()
+    rval = []
+    todo = list(variable_list)
+    while todo:
+        r = todo.pop()
+        if r not in seen:
+            seen.add(r)
+            rval.append(r)
+            if r.owner is not None and (not blockers or r not in blockers):
+                todo.extend(reversed(r.owner.inputs))
+    return rval
 
 
 def inputs(variable_list, blockers=None):
@@ -711,16 +745,33 @@ def variables_and_orphans(i, o):
          Output variables.
 
     """
-    def expand(r):
-        if r.owner and r not in i:
-            l = list(r.owner.inputs) + list(r.owner.outputs)
-            l.reverse()
-            return l
-    variables = stack_search(deque(o), expand, 'dfs')
+    i = set(i)
+    variables = _variables(i, o)
     orphans = [r for r in variables if r.owner is None and r not in i]
     return variables, orphans
 
 
+def _variables(i, o):
+    """
+    Return the variables between the set `i` and the list `o`, in the order
+    of a depth-first search started at the end of `o`.
+
+    """
+    seen = set()
+    variables = []
+    todo = list(o)
+    while todo:
+        r = todo.pop()
+        if r not in seen:
+            seen.add(r)
+            variables.append(r)
+            if r.owner is not None and r not in i:
+                # The inputs are visited first, from the left.
+                todo.extend(reversed(r.owner.outputs))
+                todo.extend(reversed(r.owner.inputs))
+    return variables
+
+
 def ops(i, o):
     """
     Set of Ops contained within the subgraph between i and o
@@ -741,13 +792,9 @@ def ops(i, o):
         in i.
 
     """
-    ops = set()
-    variables, orphans = variables_and_orphans(i, o)
-    for r in variables:
-        if r not in i and r not in orphans:
-            if r.owner is not None:
-                ops.add(r.owner)
-    return ops
+    i = set(i)
+    return set(r.owner for r in _variables(i, o)
+               if r.owner is not None and r not in i)
 
 
 def variables(i, o):
@@ -769,7 +816,7 @@ def variables(i, o):
         all intermediary steps from i to o.
 
     """
-    return variables_and_orphans(i, o)[0]
+    return _variables(set(i), o)
 
 
 def orphans(i, o):
@@ -826,8 +873,8 @@ def clone_get_equiv(inputs, outputs, copy_inputs_and_orphans=True, memo=None):
     Return a dictionary that maps from Variable and Apply nodes in the
     original graph to a new node (a clone) in a new graph.
 
-    This function works by recursively cloning inputs... rebuilding a directed
-    graph from the inputs up to eventually building new outputs.
+    The Apply nodes are cloned in the order of `io_toposort`, in the same
+    pass that sorts them, from the inputs up to the outputs.
 
     Parameters
     ----------
@@ -857,20 +904,35 @@ def clone_get_equiv(inputs, outputs, copy_inputs_and_orphans=True, memo=None):
         else:
             memo.setdefault(input, input)
 
-    # go through the inputs -> outputs graph cloning as we go
-    for apply in io_toposort(inputs, outputs):
-        for input in apply.inputs:
-            if input not in memo:
-                if copy_inputs_and_orphans:
-                    cpy = input.clone()
-                    memo[input] = cpy
-                else:
-                    memo[input] = input
-
-        new_apply = apply.clone_with_new_inputs([memo[i] for i in apply.inputs])
-        memo.setdefault(apply, new_apply)
-        for output, new_output in zip(apply.outputs, new_apply.outputs):
-            memo.setdefault(output, new_output)
+    # go through the inputs -> outputs graph cloning as we go, with the
+    # stack algorithm of io_toposort.
+    computed = set(inputs)
+    todo = [o.owner for o in reversed(outputs) if o.owner]
+    while todo:
+        apply = todo.pop()
+        # We suppose that all outputs are always computed
+        if apply.outputs[0] in computed:
+            continue
+        for i in apply.inputs:
+            if i.owner is not None and i not in computed:
+                todo.append(apply)
+                todo.extend(i.owner for i in apply.inputs if i.owner)
+                break
+        else:
+            computed.update(apply.outputs)
+            new_inputs = []
+            for input in apply.inputs:
+                if input not in memo:
+                    if copy_inputs_and_orphans:
+                        memo[input] = input.clone()
+                    else:
+                        memo[input] = input
+                new_inputs.append(memo[input])
+
+            new_apply = apply.clone_with_new_inputs(new_inputs)
+            memo.setdefault(apply, new_apply)
+            for output, new_output in zip(apply.outputs, new_apply.outputs):
+                memo.setdefault(output, new_output)
 
     # finish up by cloning any remaining outputs (it can happen)
     for output in outputs:
@@ -936,24 +998,43 @@ def general_toposort(outputs, deps, debug_print=False,
 
     assert isinstance(outputs, (tuple, list, deque))
 
-    reachable, _clients = stack_search(deque(outputs), compute_deps_cache,
-                                       'dfs', True)
+    # Find the reachable nodes with a depth-first search, like
+    # stack_search(deque(outputs), compute_deps_cache, 'dfs', True), and
+    # count the dependencies of each of them.
+    reachable = []
+    n_deps = {}
+    _clients = {}
+    todo = list(outputs)
+    while todo:
+        node = todo.pop()
+        if node not in n_deps:
+            reachable.append(node)
+            d = compute_deps_cache(node)
+            if d:
+                n_deps[node] = len(d)
+                for r in d:
+                    if r in _clients:
+                        _clients[r].append(node)
+                    else:
+                        _clients[r] = [node]
+                todo.extend(d)
+            else:
+                n_deps[node] = 0
     if clients is not None:
         clients.update(_clients)
-    sources = deque([r for r in reachable if not deps_cache.get(r, None)])
+    sources = deque([r for r in reachable if not n_deps[r]])
 
-    rset = set()
+    # A node is ready when its count of dependencies that are not in rlist
+    # drops to 0.
     rlist = []
     while sources:
         node = sources.popleft()
-        if node not in rset:
-            rlist.append(node)
-            rset.add(node)
-            for client in _clients.get(node, []):
-                d = [a for a in deps_cache[client] if a is not node]
-                deps_cache[client] = d
-                if not d:
-                    sources.append(client)
+        rlist.append(node)
+        for client in _clients.get(node, ()):
+            n = n_deps[client] - 1
+            n_deps[client] = n
+            if not n:
+                sources.append(client)
 
     if len(rlist) != len(reachable):
         if debug_print:
@@ -996,12 +1077,14 @@ def io_toposort(inputs, outputs, orderings=None, clients=None):
             # We suppose that all outputs are always computed
             if cur.outputs[0] in computed:
                 continue
-            if all([i in computed or i.owner is None for i in cur.inputs]):
+            for i in cur.inputs:
+                if i.owner is not None and i not in computed:
+                    todo.append(cur)
+                    todo.extend(i.owner for i in cur.inputs if i.owner)
+                    break
+            else:
                 computed.update(cur.outputs)
                 order.append(cur)
-            else:
-                todo.append(cur)
-                todo.extend(i.owner for i in cur.inputs if i.owner)
         return order
 
     compute_deps = None
@@ -1022,17 +1105,9 @@ def io_toposort(inputs, outputs, orderings=None, clients=None):
                     if obj.owner:
                         rval = [obj.owner]
                 elif isinstance(obj, Apply):
-                    rval = list(obj.inputs)
-                if rval:
-                    if not isinstance(rval, (list, OrderedSet)):
-                        raise TypeError(
-                            "Non-deterministic collections here make"
-                            " toposort non-deterministic.")
-                    deps_cache[obj] = list(rval)
-                else:
-                    deps_cache[obj] = rval
-            else:
-                deps_cache[obj] = rval
+                    # general_toposort does not modify the dependencies.
+                    rval = obj.inputs
+            deps_cache[obj] = rval
             return rval
     else:
 
@@ -1,7 +1,11 @@
 #include <Python.h>
 #include "theano_mod_helper.h"
 #include "structmember.h"
-#include <sys/time.h>
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <time.h>
+#endif
 
 #if PY_VERSION_HEX >= 0x03000000
 #include "numpy/npy_3kcompat.h"
@@ -20,20 +24,27 @@ TODO:
 - Check max supported depth of recursion
 - CLazyLinker should add context information to errors caught during evaluation. Say what node we were on, add the traceback attached to the node.
 - Clear containers of fully-useed intermediate results if allow_gc is 1
-- Add timers for profiling
 - Add support for profiling space used.
 
 
   */
-static double pytime(const struct timeval * tv)
+/**
+  Monotonic clock in nanoseconds, used to time the thunks.
+  */
+static long long ticks_ns(void)
 {
-  struct timeval t;
-  if (!tv)
-    {
-      tv = &t;
-      gettimeofday(&t, NULL);
-    }
-  return (double) tv->tv_sec + (double) tv->tv_usec / 1000000.0;
+#ifdef _WIN32
+  static LARGE_INTEGER freq = {0};
+  LARGE_INTEGER t;
+  if (!freq.QuadPart)
+    QueryPerformanceFrequency(&freq);
+  QueryPerformanceCounter(&t);
+  return (long long)((double)t.QuadPart * 1e9 / (double)freq.QuadPart);
+#else
+  struct timespec t;
+  clock_gettime(CLOCK_MONOTONIC, &t);
+  return (long long)t.tv_sec * 1000000000LL + (long long)t.tv_nsec;
+#endif
 }
 
 /**
@@ -111,6 +122,9 @@ typedef struct {
     void ** thunk_cptr_data;
     PyObject * call_times;
     PyObject * call_counts;
+    // Timings not yet added to call_times and call_counts, see flush_timers
+    long long * thunk_ns;
+    long long * thunk_count;
     int do_timing;
     int need_update_inputs;
     int position_of_error; // -1 for no error, otw the index into `thunks` that failed.
@@ -123,6 +137,8 @@ CLazyLinker_dealloc(PyObject* _self)
   CLazyLinker* self = (CLazyLinker *) _self;
   free(self->thunk_cptr_fn);
   free(self->thunk_cptr_data);
+  free(self->thunk_ns);
+  free(self->thunk_count);
 
   free(self->is_lazy);
 
@@ -218,6 +234,8 @@ CLazyLinker_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
       self->thunk_cptr_fn = NULL;
       self->call_times = NULL;
       self->call_counts = NULL;
+      self->thunk_ns = NULL;
+      self->thunk_count = NULL;
       self->do_timing = 0;
 
       self->need_update_inputs = 0;
@@ -311,6 +329,8 @@ CLazyLinker_init(CLazyLinker *self, PyObject *args, PyObject *kwds)
       {
         self->thunk_cptr_data = (void**)calloc(n_applies, sizeof(void*));
         self->thunk_cptr_fn = (void**)calloc(n_applies, sizeof(void*));
+        self->thunk_ns = (long long*)calloc(n_applies, sizeof(long long));
+        self->thunk_count = (long long*)calloc(n_applies, sizeof(long long));
         self->is_lazy = (int*)calloc(n_applies, sizeof(int));
         self->node_prereqs = (Py_ssize_t**)calloc(n_applies, sizeof(Py_ssize_t*));
         self->node_n_prereqs = (Py_ssize_t*)calloc(n_applies, sizeof(Py_ssize_t));
@@ -319,6 +339,8 @@ CLazyLinker_init(CLazyLinker *self, PyObject *args, PyObject *kwds)
         assert(self->is_lazy);
         assert(self->thunk_cptr_fn);
         assert(self->thunk_cptr_data);
+        assert(self->thunk_ns);
+        assert(self->thunk_count);
 
         for (int i = 0; i < n_applies; ++i)
           {
@@ -485,21 +507,14 @@ static PyObject * pycall(CLazyLinker * self, Py_ssize_t node_idx, int verbose)
   PyObject * rval = NULL;
   if (self->do_timing)
     {
-      double t0 = pytime(NULL);
       if (verbose) fprintf(stderr, "calling via Python (node %i)\n", (int)node_idx);
+      long long t0 = ticks_ns();
       rval = PyObject_CallObject(thunk, NULL);
       if (rval)
         {
-          double t1 = pytime(NULL);
-          double ti = PyFloat_AsDouble(
-                         PyList_GetItem(self->call_times, node_idx));
-          PyList_SetItem(self->call_times, node_idx,
-                         PyFloat_FromDouble(t1 - t0 + ti));
-          PyObject * count = PyList_GetItem(self->call_counts, node_idx);
-          long icount = PyInt_AsLong(count);
-          PyList_SetItem(self->call_counts, node_idx,
-                         PyInt_FromLong(icount + 1));
-      }
+          self->thunk_ns[node_idx] += ticks_ns() - t0;
+          self->thunk_count[node_idx] += 1;
+        }
     }
   else
     {
@@ -519,14 +534,10 @@ static int c_call(CLazyLinker * self, Py_ssize_t node_idx, int verbose)
   int err = 0;
   if (self->do_timing)
     {
-      double t0 = pytime(NULL);
+      long long t0 = ticks_ns();
       err = fn(self->thunk_cptr_data[node_idx]);
-      double t1 = pytime(NULL);
-      double ti = PyFloat_AsDouble(PyList_GetItem(self->call_times, node_idx));
-      PyList_SetItem(self->call_times, node_idx, PyFloat_FromDouble(t1 - t0 + ti));
-      PyObject * count = PyList_GetItem(self->call_counts, node_idx);
-      long icount = PyInt_AsLong(count);
-      PyList_SetItem(self->call_counts, node_idx, PyInt_FromLong(icount+1));
+      self->thunk_ns[node_idx] += ticks_ns() - t0;
+      self->thunk_count[node_idx] += 1;
     }
   else
     {
@@ -951,14 +962,36 @@ CLazyLinker_call(PyObject *_self, PyObject *args, PyObject *kwds)
   return rval;
 }
 
-#if 0
-static PyMethodDef CLazyLinker_methods[] = {
+/**
+  Add the thunk timings accumulated in C since the last call into the
+  call_times and call_counts lists, and reset them.
+  */
+static PyObject *
+CLazyLinker_flush_timers(CLazyLinker *self, PyObject *noargs)
+{
+  for (Py_ssize_t i = 0; i < self->n_applies; ++i)
     {
-      //"name", (PyCFunction)CLazyLinker_accept, METH_VARARGS, "Return the name, combining the first and last name"
-    },
+      if (!self->thunk_count[i])
+        continue;
+      double ti = PyFloat_AsDouble(PyList_GetItem(self->call_times, i));
+      long icount = PyInt_AsLong(PyList_GetItem(self->call_counts, i));
+      if (PyErr_Occurred())
+        return NULL;
+      PyList_SetItem(self->call_times, i,
+                     PyFloat_FromDouble(ti + 1e-9 * self->thunk_ns[i]));
+      PyList_SetItem(self->call_counts, i,
+                     PyInt_FromLong(icount + (long)self->thunk_count[i]));
+      self->thunk_ns[i] = 0;
+      self->thunk_count[i] = 0;
+    }
+  Py_RETURN_NONE;
+}
+
+static PyMethodDef CLazyLinker_methods[] = {
+    {(char*)"flush_timers", (PyCFunction)CLazyLinker_flush_timers, METH_NOARGS,
+     (char*)"Add the pending thunk timings into call_times and call_counts"},
     {NULL}  /* Sentinel */
 };
-#endif
 
 
 static PyObject *
@@ -993,10 +1026,12 @@ static PyMemberDef CLazyLinker_members[] = {
      (char*)"list of nodes"},
     {(char*)"thunks", T_OBJECT_EX, offsetof(CLazyLinker, thunks), 0,
      (char*)"list of thunks in program"},
+    {(char*)"pre_call_clear", T_OBJECT_EX, offsetof(CLazyLinker, pre_call_clear), READONLY,
+     (char*)"list of storage cells cleared at the start of each call"},
     {(char*)"call_counts", T_OBJECT_EX, offsetof(CLazyLinker, call_counts), 0,
-     (char*)"number of calls of each thunk"},
+     (char*)"number of calls of each thunk, up to date after flush_timers()"},
     {(char*)"call_times", T_OBJECT_EX, offsetof(CLazyLinker, call_times), 0,
-     (char*)"total runtime in each thunk"},
+     (char*)"total runtime in each thunk, up to date after flush_timers()"},
     {(char*)"position_of_error", T_INT, offsetof(CLazyLinker, position_of_error), 0,
      (char*)"position of failed thunk"},
     {(char*)"time_thunks", T_INT, offsetof(CLazyLinker, do_timing), 0,
@@ -1039,7 +1074,7 @@ static PyTypeObject lazylinker_ext_CLazyLinkerType = {
     0,                         /* tp_weaklistoffset */
     0,                         /* tp_iter */
     0,                         /* tp_iternext */
-    0,//CLazyLinker_methods,       /* tp_methods */
+    CLazyLinker_methods,       /* tp_methods */
     CLazyLinker_members,       /* tp_members */
     CLazyLinker_getset,        /* tp_getset */
     0,                         /* tp_base */
@@ -1054,7 +1089,7 @@ static PyTypeObject lazylinker_ext_CLazyLinkerType = {
 
 static PyObject * get_version(PyObject *dummy, PyObject *args)
 {
-  PyObject *result = PyFloat_FromDouble(0.211);
+  PyObject *result = PyFloat_FromDouble(0.213);
   return result;
 }
 
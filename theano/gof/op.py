@@ -14,6 +14,7 @@ import os
 import re
 import sys
 import warnings
+from contextlib import contextmanager
 
 import theano
 from theano import config
@@ -488,6 +489,59 @@ class CLinkerOp(CLinkerObject):
                                      self.__class__.__name__)
 
 
+# The table of the applied Ops of the current `hash_consing` context.
+_hash_consing_tables = []
+
+
+@contextmanager
+def hash_consing():
+    """
+    Context in which applying an Op to inputs it was already applied to
+    returns the outputs of the existing Apply node instead of a new node.
+
+    Graph building code, `theano.grad` on big models in particular, makes
+    many duplicate subexpressions. The MergeOptimizer only removes them
+    when the graph is compiled, after they were cloned and checked. This
+    context removes them as the graph is built.
+
+    Inputs are the same if they are the same Variable, or Constants with
+    the same signature. Ops with a destroy_map are never shared. Nested
+    contexts share the same table.
+
+    Examples
+    --------
+    >>> with hash_consing():
+    ...     grads = theano.grad(cost, params)
+
+    """
+    if _hash_consing_tables:
+        table = _hash_consing_tables[-1]
+    else:
+        table = {}
+    _hash_consing_tables.append(table)
+    try:
+        yield
+    finally:
+        _hash_consing_tables.pop()
+
+
+def _hash_consing_key(op, inputs):
+    """
+    Return the key of `op` applied to `inputs` in the table of
+    `hash_consing`, or None if an input is not a Variable.
+
+    """
+    key = [op]
+    for inp in inputs:
+        if isinstance(inp, graph.Constant):
+            key.append(('constant', inp.signature()))
+        elif isinstance(inp, graph.Variable):
+            key.append(inp)
+        else:
+            return None
+    return tuple(key)
+
+
 class PureOp(object):
     """
     An :term:`Op` is a type of operation.
@@ -612,9 +666,13 @@ class PureOp(object):
 
         """
         return_list = kwargs.pop('return_list', False)
-        node = self.make_node(*inputs, **kwargs)
+        if _hash_consing_tables and not kwargs:
+            node, new_node = self._hash_consing_apply(inputs)
+        else:
+            node = self.make_node(*inputs, **kwargs)
+            new_node = True
 
-        if config.compute_test_value != 'off':
+        if new_node and config.compute_test_value != 'off':
             run_perform = True
 
             # build test input-values
@@ -696,6 +754,41 @@ class PureOp(object):
             else:
                 return node.outputs
 
+    def _hash_consing_apply(self, inputs):
+        """
+        Return the node of this Op applied to `inputs` in the current
+        `hash_consing` context, making it if there is none yet, and whether
+        it was made.
+
+        """
+        table = _hash_consing_tables[-1]
+        # Nodes that destroy their inputs are never shared.
+        shareable = not getattr(self, 'destroy_map', None)
+        raw_key = None
+        if shareable:
+            try:
+                raw_key = _hash_consing_key(self, inputs)
+                if raw_key in table:
+                    return table[raw_key], False
+            except TypeError:
+                # Unhashable Op or constant.
+                shareable = False
+
+        new_node = self.make_node(*inputs)
+        node = new_node
+        if shareable:
+            # make_node can convert the inputs, the node is also found from
+            # the converted ones.
+            try:
+                key = _hash_consing_key(self, new_node.inputs)
+            except TypeError:
+                key = None
+            if key is not None:
+                node = table.setdefault(key, new_node)
+            if raw_key is not None:
+                table[raw_key] = node
+        return node, node is new_node
+
     def __ne__(self, other):
         return not (self == other)
 
@@ -812,10 +905,10 @@ class Op(utils.object2, PureOp, CLinkerOp):
     def make_c_thunk(self, node, storage_map, compute_map, no_recycling):
         """Like make_thunk, but will only try to make a C thunk.
 
-        """
-        node_input_storage = [storage_map[r] for r in node.inputs]
-        node_output_storage = [storage_map[r] for r in node.outputs]
+        The thunk has a `rebind(storage_map, compute_map)` method that
+        returns a thunk running the same compiled code on other storage.
 
+        """
         # float16 gets special treatment since running
         # unprepared C code will get bad results.
         if not getattr(self, '_f16_ok', False):
@@ -827,28 +920,44 @@ class Op(utils.object2, PureOp, CLinkerOp):
                 print("Disabling C code for %s due to unsupported "
                       "float16" % (self,))
                 raise NotImplementedError("float16")
+        cl = self.make_c_linker(node, no_recycling)
+
+        def bind(storage_map, compute_map):
+            node_input_storage = [storage_map[r] for r in node.inputs]
+            node_output_storage = [storage_map[r] for r in node.outputs]
+
+            _logger.debug('Trying CLinker.make_thunk')
+            # The linker only compiles or loads its module the first time.
+            outputs = cl.make_thunk(input_storage=node_input_storage,
+                                    output_storage=node_output_storage)
+            fill_storage, node_input_filters, node_output_filters = outputs
+
+            def rval():
+                fill_storage()
+                for o in node.outputs:
+                    compute_map[o][0] = True
+
+            rval.cthunk = fill_storage.cthunk
+            rval.inputs = node_input_storage
+            rval.outputs = node_output_storage
+            rval.lazy = False
+            rval.rebind = bind
+            return rval
+        return bind(storage_map, compute_map)
+
+    def make_c_linker(self, node, no_recycling):
+        """
+        Return the CLinker that make_c_thunk uses to compile `node`.
+
+        The linker works on a copy of `node` in its own FunctionGraph.
+
+        """
         e = FunctionGraph(node.inputs, node.outputs)
         e_no_recycling = [new_o
                           for (new_o, old_o) in zip(e.outputs, node.outputs)
                           if old_o in no_recycling]
-        cl = theano.gof.cc.CLinker().accept(e,
-                                            no_recycling=e_no_recycling)
-
-        _logger.debug('Trying CLinker.make_thunk')
-        outputs = cl.make_thunk(input_storage=node_input_storage,
-                                output_storage=node_output_storage)
-        fill_storage, node_input_filters, node_output_filters = outputs
-
-        def rval():
-            fill_storage()
-            for o in node.outputs:
-                compute_map[o][0] = True
-
-        rval.cthunk = fill_storage.cthunk
-        rval.inputs = node_input_storage
-        rval.outputs = node_output_storage
-        rval.lazy = False
-        return rval
+        return theano.gof.cc.CLinker().accept(e,
+                                              no_recycling=e_no_recycling)
 
     def make_py_thunk(self, node, storage_map, compute_map, no_recycling,
                       debug=False):
@@ -121,6 +121,26 @@ class Optimizer(object):
                 "The function print_profile must be overrided if the"
                 " optimizer return profiling information.")
 
+    @staticmethod
+    def profile_to_dict(prof):
+        """
+        Return the profile `prof` returned by apply() as a dict of numbers,
+        strings, lists and dicts, that can be saved in JSON.
+
+        Returns None if the optimizer has no such profile.
+
+        """
+        return None
+
+
+def _optimizer_name(opt):
+    """
+    Return the name of `opt` used in the profiles.
+
+    """
+    return str(getattr(opt, 'name', None) or
+               getattr(opt, '__name__', None) or opt)
+
 
 class FromFunctionOptimizer(Optimizer):
     """
@@ -347,6 +367,38 @@ class SeqOptimizer(Optimizer, list):
                                       level=level + 1)
         print(file=stream)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        (opts, prof, validate_time, callback_time,
+         nb_node_before, nb_node_after, sub_profs, sub_validate_time,
+         nb_nodes, callbacks_time) = prof
+        stages = []
+        for i, (opt, t, sub_prof) in enumerate(zip(opts, prof, sub_profs)):
+            stage = {'name': _optimizer_name(opt),
+                     'class': opt.__class__.__name__,
+                     'time': t,
+                     'nodes_before': nb_nodes[i][0],
+                     'nodes_after': nb_nodes[i][1],
+                     'profile': None}
+            if sub_validate_time:
+                stage['validate_time'] = (sub_validate_time[i + 1] -
+                                          sub_validate_time[i])
+            if sub_prof:
+                try:
+                    stage['profile'] = opt.profile_to_dict(sub_prof)
+                except NotImplementedError:
+                    pass
+            stages.append(stage)
+        return {'class': 'SeqOptimizer',
+                'name': (getattr(opts, 'name', None) or
+                         getattr(opts, '__name__', None)),
+                'time': sum(prof),
+                'nodes_before': nb_node_before,
+                'nodes_after': nb_node_after,
+                'validate_time': validate_time,
+                'callback_time': callback_time,
+                'stages': stages}
+
     @staticmethod
     def merge_profile(prof1, prof2):
         """
@@ -948,6 +1000,18 @@ class MergeOptimizer(Optimizer):
                     # just print i.
                     print(blanc, "      ", i[0], ',', i[1], file=stream)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        (nb_fail, replace_time, validate_time,
+         callback_time, callbacks_time, nb_merged, nb_constant) = prof
+        return {'class': 'MergeOptimizer',
+                'time': replace_time,
+                'validate_time': validate_time,
+                'callback_time': callback_time,
+                'merged': nb_merged,
+                'constants_merged': nb_constant,
+                'failed': nb_fail}
+
     @staticmethod
     def merge_profile(prof1, prof2):
         def merge_none_number(v1, v2):
@@ -2085,11 +2149,16 @@ class TopoOptimizer(NavigatorOptimizer):
         q = deque(graph.io_toposort(fgraph.inputs, start_from))
         io_t = time.time() - t0
 
+        # The number of nodes imported and pruned.
+        nb_changed = [0, 0]
+
         def importer(node):
+            nb_changed[0] += 1
             if node is not current_node:
                 q.append(node)
 
         def pruner(node):
+            nb_changed[1] += 1
             if node is not current_node:
                 try:
                     q.remove(node)
@@ -2098,6 +2167,7 @@ class TopoOptimizer(NavigatorOptimizer):
         u = self.attach_updater(fgraph, importer, pruner,
                                 name=getattr(self, 'name', None))
         nb = 0
+        nb_tried = 0
         try:
             t0 = time.time()
             while q:
@@ -2106,6 +2176,7 @@ class TopoOptimizer(NavigatorOptimizer):
                 else:
                     node = q.popleft()
                 current_node = node
+                nb_tried += 1
                 nb += self.process_node(fgraph, node)
             loop_t = time.time() - t0
         finally:
@@ -2114,7 +2185,8 @@ class TopoOptimizer(NavigatorOptimizer):
         callback_time = fgraph.execute_callbacks_time - callback_before
         nb_nodes_end = len(fgraph.apply_nodes)
         return (self, nb, nb_nodes_start, nb_nodes_end,
-                io_t, loop_t, callback_time, self.local_opt)
+                io_t, loop_t, callback_time, self.local_opt,
+                nb_tried, nb_changed[0], nb_changed[1])
 
     @staticmethod
     def print_profile(stream, prof, level=0):
@@ -2125,7 +2197,8 @@ class TopoOptimizer(NavigatorOptimizer):
             return
 
         (opt, nb, nb_nodes_start, nb_nodes_end,
-         io_t, loop_t, callback_time, lopt) = prof
+         io_t, loop_t, callback_time, lopt,
+         nb_tried, nb_imported, nb_pruned) = prof
 
         print(blanc, "TopoOptimizer ",
               getattr(opt, "name", getattr(opt, "__name__", "")), file=stream)
@@ -2144,6 +2217,28 @@ class TopoOptimizer(NavigatorOptimizer):
                                             lopt.profile),
                                    level=level + 1)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        if prof is None:
+            return None
+        (opt, nb, nb_nodes_start, nb_nodes_end,
+         io_t, loop_t, callback_time, lopt,
+         nb_tried, nb_imported, nb_pruned) = prof
+        return {'class': 'TopoOptimizer',
+                'name': _optimizer_name(opt),
+                'time': io_t + loop_t,
+                'nodes_before': nb_nodes_start,
+                'nodes_after': nb_nodes_end,
+                'io_toposort_time': io_t,
+                'callback_time': callback_time,
+                'optimizers': {
+                    _optimizer_name(lopt): {'kind': 'local',
+                                            'time': loop_t,
+                                            'attempts': nb_tried,
+                                            'applied': nb,
+                                            'nodes_created': nb_imported,
+                                            'nodes_removed': nb_pruned}}}
+
     def __str__(self):
         return getattr(self, '__name__',
                        '<TopoOptimizer instance>')
@@ -2248,11 +2343,15 @@ class ChangeTracker:
     def __init__(self):
         self.changed = False
         self.nb_imported = 0
+        self.nb_pruned = 0
 
     def on_import(self, fgraph, node, reason):
         self.nb_imported += 1
         self.changed = True
 
+    def on_prune(self, fgraph, node, reason):
+        self.nb_pruned += 1
+
     def on_change_input(self, fgraph, node, i, r, new_r, reason):
         self.changed = True
 
@@ -2266,6 +2365,62 @@ class ChangeTracker:
         del fgraph.change_tracker
 
 
+class DirtyNodesTracker:
+    """
+    Feature that records the nodes whose neighbourhood in the graph has
+    changed: the nodes that were imported or whose inputs changed, and the
+    owners of variables that lost or gained a client.
+
+    Used by the incremental mode of EquilibriumOptimizer.
+
+    """
+    def __init__(self):
+        self.nodes = OrderedSet()
+
+    def on_import(self, fgraph, node, reason):
+        self.nodes.add(node)
+
+    def on_prune(self, fgraph, node, reason):
+        for r in node.inputs:
+            if r.owner is not None:
+                self.nodes.add(r.owner)
+
+    def on_change_input(self, fgraph, node, i, r, new_r, reason):
+        if node != 'output':
+            self.nodes.add(node)
+        for var in (r, new_r):
+            if var.owner is not None:
+                self.nodes.add(var.owner)
+
+    def pop_neighbourhood(self, fgraph):
+        """
+        Return the recorded nodes that are still in `fgraph`, with the
+        owners of their inputs and the clients of their outputs, as local
+        optimizers look at them. Then forget the recorded nodes.
+
+        """
+        nodes = OrderedSet()
+        for node in self.nodes:
+            if node not in fgraph.apply_nodes:
+                continue
+            for r in node.inputs:
+                if r.owner is not None:
+                    nodes.add(r.owner)
+            nodes.add(node)
+            for r in node.outputs:
+                for client, _ in r.clients:
+                    if client != 'output':
+                        nodes.add(client)
+        self.nodes = OrderedSet()
+        return nodes
+
+    def on_attach(self, fgraph):
+        fgraph.dirty_nodes_tracker = self
+
+    def on_detach(self, fgraph):
+        del fgraph.dirty_nodes_tracker
+
+
 def merge_dict(d1, d2):
     """
     merge 2 dicts by adding the values.
@@ -2301,6 +2456,16 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         They must not traverse the graph as they are called very frequently.
         The MergeOptimizer is one example of optimization that respect this.
         They are applied after all global optimizer, then when one local optimizer is applied, then after all final optimizer.
+    incremental
+        If True, only the first iteration applies the local optimizers to all
+        the nodes. The next ones only apply them to the nodes that changed
+        since the previous iteration and to their neighbours, and don't run
+        the global and final optimizers. When more than a quarter of the
+        graph changed, a full iteration is done instead. As some optimizers
+        look further than the neighbours of a node, a full iteration is
+        done before stopping, so that the result is the same as without
+        this option. It only helps when many iterations each change a small
+        part of the graph.
 
     """
 
@@ -2311,7 +2476,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                  tracks_on_change_inputs=False,
                  max_use_ratio=None,
                  final_optimizers=None,
-                 cleanup_optimizers=None):
+                 cleanup_optimizers=None,
+                 incremental=False):
         super(EquilibriumOptimizer, self).__init__(
             None,
             ignore_newtrees=ignore_newtrees,
@@ -2322,6 +2488,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         self.final_optimizers = []
         self.cleanup_optimizers = []
         self.tracks_on_change_inputs = tracks_on_change_inputs
+        self.incremental = incremental
 
         for opt in optimizers:
             if isinstance(opt, LocalOptimizer):
@@ -2365,6 +2532,9 @@ class EquilibriumOptimizer(NavigatorOptimizer):
     def apply(self, fgraph, start_from=None):
         change_tracker = ChangeTracker()
         fgraph.attach_feature(change_tracker)
+        if self.incremental:
+            dirty_nodes = DirtyNodesTracker()
+            fgraph.attach_feature(dirty_nodes)
         if start_from is None:
             start_from = fgraph.outputs
         else:
@@ -2372,6 +2542,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 assert node in fgraph.outputs
 
         changed = True
+        full_sweep = True
         max_use_abort = False
         opt_name = None
         global_process_count = {}
@@ -2386,6 +2557,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         io_toposort_timing = []
         nb_nodes = []
         node_created = {}
+        node_removed = {}
+        attempt_count = {}
         global_sub_profs = []
         final_sub_profs = []
         cleanup_sub_profs = []
@@ -2396,15 +2569,19 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             global_process_count.setdefault(opt, 0)
             time_opts.setdefault(opt, 0)
             node_created.setdefault(opt, 0)
+            node_removed.setdefault(opt, 0)
+            attempt_count.setdefault(opt, 0)
 
         def apply_cleanup(profs_dict):
             changed = False
             for copt in self.cleanup_optimizers:
                 change_tracker.reset()
                 nb = change_tracker.nb_imported
+                nb_pruned = change_tracker.nb_pruned
                 t_opt = time.time()
                 sub_prof = copt.apply(fgraph)
                 time_opts[copt] += time.time() - t_opt
+                attempt_count[copt] += 1
                 profs_dict[copt].append(sub_prof)
                 if change_tracker.changed:
                     process_count.setdefault(copt, 0)
@@ -2412,6 +2589,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                     global_process_count[copt] += 1
                     changed = True
                     node_created[copt] += change_tracker.nb_imported - nb
+                    node_removed[copt] += (change_tracker.nb_pruned -
+                                           nb_pruned)
             return changed
 
         while changed and not max_use_abort:
@@ -2422,14 +2601,29 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             for copt in self.cleanup_optimizers:
                 iter_cleanup_sub_profs[copt] = []
 
+            # When a large part of the graph changed, visiting the
+            # neighbourhood of the changes costs as much as a full sweep.
+            if (not full_sweep and
+                    len(dirty_nodes.nodes) * 4 > len(fgraph.apply_nodes)):
+                full_sweep = True
+            # The incremental iterations only apply the local optimizers:
+            # the global and final ones traverse the whole graph.
+            if full_sweep:
+                global_optimizers = self.global_optimizers
+                final_optimizers = self.final_optimizers
+            else:
+                global_optimizers = final_optimizers = []
+
             # apply global optimizers
             sub_profs = []
-            for gopt in self.global_optimizers:
+            for gopt in global_optimizers:
                 change_tracker.reset()
                 nb = change_tracker.nb_imported
+                nb_pruned = change_tracker.nb_pruned
                 t_opt = time.time()
                 sub_prof = gopt.apply(fgraph)
                 time_opts[gopt] += time.time() - t_opt
+                attempt_count[gopt] += 1
                 sub_profs.append(sub_prof)
                 if change_tracker.changed:
                     process_count.setdefault(gopt, 0)
@@ -2437,6 +2631,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                     global_process_count[gopt] += 1
                     changed = True
                     node_created[gopt] += change_tracker.nb_imported - nb
+                    node_removed[gopt] += (change_tracker.nb_pruned -
+                                           nb_pruned)
                     if global_process_count[gopt] > max_use:
                         max_use_abort = True
                         opt_name = (getattr(gopt, "name", None) or
@@ -2451,7 +2647,12 @@ class EquilibriumOptimizer(NavigatorOptimizer):
 
             # apply local optimizer
             topo_t0 = time.time()
-            q = deque(graph.io_toposort(fgraph.inputs, start_from))
+            if full_sweep:
+                q = deque(graph.io_toposort(fgraph.inputs, start_from))
+                if self.incremental:
+                    dirty_nodes.pop_neighbourhood(fgraph)
+            else:
+                q = deque(dirty_nodes.pop_neighbourhood(fgraph))
             io_toposort_timing.append(time.time() - topo_t0)
 
             nb_nodes.append(len(q))
@@ -2480,9 +2681,11 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                                  self.local_optimizers_map.get(type(node.op), []) +
                                  self.local_optimizers_map.get(node.op, [])):
                         nb = change_tracker.nb_imported
+                        nb_pruned = change_tracker.nb_pruned
                         t_opt = time.time()
                         lopt_change = self.process_node(fgraph, node, lopt)
                         time_opts[lopt] += time.time() - t_opt
+                        attempt_count[lopt] += 1
                         if not lopt_change:
                             continue
                         process_count.setdefault(lopt, 0)
@@ -2490,6 +2693,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                         global_process_count[lopt] += 1
                         changed = True
                         node_created[lopt] += change_tracker.nb_imported - nb
+                        node_removed[lopt] += (change_tracker.nb_pruned -
+                                               nb_pruned)
                         changed |= apply_cleanup(iter_cleanup_sub_profs)
                         if global_process_count[lopt] > max_use:
                             max_use_abort = True
@@ -2504,12 +2709,14 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             # Apply final optimizers
             sub_profs = []
             t_before_final_opt = time.time()
-            for gopt in self.final_optimizers:
+            for gopt in final_optimizers:
                 change_tracker.reset()
                 nb = change_tracker.nb_imported
+                nb_pruned = change_tracker.nb_pruned
                 t_opt = time.time()
                 sub_prof = gopt.apply(fgraph)
                 time_opts[gopt] += time.time() - t_opt
+                attempt_count[gopt] += 1
                 sub_profs.append(sub_prof)
                 if change_tracker.changed:
                     process_count.setdefault(gopt, 0)
@@ -2517,6 +2724,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                     global_process_count[gopt] += 1
                     changed = True
                     node_created[gopt] += change_tracker.nb_imported - nb
+                    node_removed[gopt] += (change_tracker.nb_pruned -
+                                           nb_pruned)
                     if global_process_count[gopt] > max_use:
                         max_use_abort = True
                         opt_name = (getattr(gopt, "name", None) or
@@ -2539,6 +2748,14 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             loop_process_count.append(process_count)
             loop_timing.append(float(time.time() - t0))
 
+            if self.incremental:
+                if changed:
+                    full_sweep = False
+                elif not full_sweep:
+                    # Only stop after an iteration over all the nodes.
+                    full_sweep = True
+                    changed = True
+
         end_nb_nodes = len(fgraph.apply_nodes)
 
         if max_use_abort:
@@ -2551,6 +2768,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             else:
                 _logger.error(msg)
         fgraph.remove_feature(change_tracker)
+        if self.incremental:
+            fgraph.remove_feature(dirty_nodes)
         assert len(loop_process_count) == len(loop_timing)
         assert len(loop_process_count) == len(global_opt_timing)
         assert len(loop_process_count) == len(nb_nodes)
@@ -2562,7 +2781,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 (start_nb_nodes, end_nb_nodes, max_nb_nodes),
                 global_opt_timing, nb_nodes, time_opts, io_toposort_timing,
                 node_created, global_sub_profs, final_sub_profs,
-                cleanup_sub_profs)
+                cleanup_sub_profs, attempt_count, node_removed)
 
     def print_summary(self, stream=sys.stdout, level=0, depth=-1):
         name = getattr(self, 'name', None)
@@ -2579,7 +2798,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
          (start_nb_nodes, end_nb_nodes, max_nb_nodes),
          global_opt_timing, nb_nodes, time_opts, io_toposort_timing,
          node_created, global_sub_profs, final_sub_profs,
-         cleanup_sub_profs) = prof
+         cleanup_sub_profs, attempt_count, node_removed) = prof
 
         blanc = ('    ' * level)
         print(blanc, "EquilibriumOptimizer", end=' ', file=stream)
@@ -2678,6 +2897,48 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 except NotImplementedError:
                     print(blanc, "merge not implemented for ", o)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        (opt, loop_timing, loop_process_count,
+         (start_nb_nodes, end_nb_nodes, max_nb_nodes),
+         global_opt_timing, nb_nodes, time_opts, io_toposort_timing,
+         node_created, global_sub_profs, final_sub_profs,
+         cleanup_sub_profs, attempt_count, node_removed) = prof
+
+        process_count = {}
+        for count in loop_process_count:
+            for o, v in iteritems(count):
+                process_count[o] = process_count.get(o, 0) + v
+        optimizers = {}
+        for kind, opts in [('global', opt.global_optimizers),
+                           ('local', opt.get_local_optimizers()),
+                           ('final', opt.final_optimizers),
+                           ('cleanup', opt.cleanup_optimizers)]:
+            for o in opts:
+                stats = {'kind': kind,
+                         'time': time_opts.get(o, 0),
+                         'attempts': attempt_count.get(o, 0),
+                         'applied': process_count.get(o, 0),
+                         'nodes_created': node_created.get(o, 0),
+                         'nodes_removed': node_removed.get(o, 0)}
+                name = _optimizer_name(o)
+                if name in optimizers:
+                    # Different optimizers with the same name.
+                    for k, v in iteritems(stats):
+                        if k != 'kind':
+                            optimizers[name][k] += v
+                else:
+                    optimizers[name] = stats
+        return {'class': 'EquilibriumOptimizer',
+                'name': _optimizer_name(opt),
+                'time': sum(loop_timing),
+                'passes': len(loop_timing),
+                'nodes_before': start_nb_nodes,
+                'nodes_after': end_nb_nodes,
+                'max_nodes': max_nb_nodes,
+                'io_toposort_time': sum(io_toposort_timing),
+                'optimizers': optimizers}
+
     @staticmethod
     def merge_profile(prof1, prof2):
         # (opt, loop_timing, loop_process_count, max_nb_nodes,
@@ -2721,10 +2982,14 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                     process_count[process] = count
 
             def merge(opts, attr, idx):
+                # The incremental iterations have no global and final
+                # optimizer profiles.
+                if not prof1[idx][i] and not prof2[idx][i]:
+                    return []
                 tmp = []
                 for opt in opts:
-                    o1 = getattr(prof1[0], attr)
-                    o2 = getattr(prof2[0], attr)
+                    o1 = getattr(prof1[0], attr) if prof1[idx][i] else []
+                    o2 = getattr(prof2[0], attr) if prof2[idx][i] else []
                     if opt in o1 and opt in o2:
                         p1 = prof1[idx][i][o1.index(opt)]
                         p2 = prof2[idx][i][o2.index(opt)]
@@ -2733,8 +2998,10 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                             m = opt.merge_profile(p1, p2)
                     elif opt in o1:
                         m = prof1[idx][i][o1.index(opt)]
-                    else:
+                    elif opt in o2:
                         m = prof2[idx][i][o2.index(opt)]
+                    else:
+                        m = None
                     tmp.append(m)
                 return tmp
             global_sub_profs.append(merge(global_optimizers, 'global_optimizers', 9))
@@ -2765,6 +3032,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         assert len(loop_timing) == max(len(prof1[1]), len(prof2[1]))
 
         node_created = merge_dict(prof1[8], prof2[8])
+        attempt_count = merge_dict(prof1[12], prof2[12])
+        node_removed = merge_dict(prof1[13], prof2[13])
         return (new_opt,
                 loop_timing,
                 loop_process_count,
@@ -2776,7 +3045,9 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 node_created,
                 global_sub_profs,
                 final_sub_profs,
-                cleanup_sub_profs)
+                cleanup_sub_profs,
+                attempt_count,
+                node_removed)
 
 #################
 #   Utilities   #
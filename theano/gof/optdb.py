@@ -294,7 +294,8 @@ class EquilibriumDB(DB):
             tracks_on_change_inputs=self.tracks_on_change_inputs,
             failure_callback=opt.NavigatorOptimizer.warn_inplace,
             final_optimizers=final_opts,
-            cleanup_optimizers=cleanup_opts)
+            cleanup_optimizers=cleanup_opts,
+            incremental=config.optdb.incremental)
 
 
 class SequenceDB(DB):
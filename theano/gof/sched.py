@@ -1,5 +1,8 @@
 from __future__ import absolute_import, print_function, division
 from collections import defaultdict
+import heapq
+
+import numpy as np
 from six import iteritems
 from theano.gof.graph import list_of_nodes
 from theano.compat import cmp
@@ -274,3 +277,304 @@ def key_to_cmp(key):
     def key_cmp(a, b):
         return cmp(key(a), key(b))
     return key_cmp
+
+
+def var_size_fn(fgraph, shapes=None, unknown_dim=100):
+    """
+    Make a function that estimates the memory size of a variable.
+
+    The size of a tensor is its number of elements times the size of its
+    dtype.  The length of a dimension is taken from `shapes` if the
+    variable is in it, else from the ShapeFeature of `fgraph` when it is a
+    constant, else it is 1 for broadcastable dimensions and `unknown_dim`
+    for the others.  Other types count as 1 byte.
+
+    Parameters
+    ----------
+    fgraph
+        The FunctionGraph of the variables.
+    shapes
+        Optional dict from variable to shape, for instance the
+        ``variable_shape`` recorded by a ProfileStats with profile_memory
+        for a function using the same fgraph.
+    unknown_dim
+        The length assumed for dimensions of unknown length.
+
+    """
+    if shapes is None:
+        shapes = {}
+    shape_of = getattr(getattr(fgraph, 'shape_feature', None),
+                       'shape_of', {})
+
+    def var_size(var):
+        dtype = getattr(var.type, 'dtype', None)
+        broadcastable = getattr(var.type, 'broadcastable', None)
+        if dtype is None or broadcastable is None:
+            return 1
+        shape = shapes.get(var)
+        if shape is None or len(shape) != len(broadcastable):
+            shape = []
+            for i, b in enumerate(broadcastable):
+                dim = None
+                if var in shape_of and shape_of[var] is not None:
+                    dim = getattr(shape_of[var][i], 'data', None)
+                if dim is None:
+                    dim = 1 if b else unknown_dim
+                shape.append(int(dim))
+        size = np.dtype(dtype).itemsize
+        for dim in shape:
+            size *= dim
+        return size
+    return var_size
+
+
+class _MemorySimulation(object):
+    """
+    Simulate the memory used while the nodes of a FunctionGraph are run
+    one by one, with their outputs freed as soon as their last user ran.
+
+    Outputs that are views or destroyed inputs don't allocate memory, and
+    keep the variable they alias alive until their own last user.  The
+    inputs, the constants and the outputs of the graph are never freed,
+    and the memory of the inputs is not counted.
+
+    """
+
+    def __init__(self, fgraph, var_size):
+        self.nodes = fgraph.toposort()
+        self.position = dict((node, i) for i, node in enumerate(self.nodes))
+        ords = fgraph.orderings()
+        roots_of = {}
+        self.created = {}
+        self.reads = {}
+        self.users = defaultdict(set)
+        self.size = {}
+        self.succ = defaultdict(list)
+        self.n_missing = {}
+        for node in self.nodes:
+            dmap = getattr(node.op, 'destroy_map', {})
+            vmap = getattr(node.op, 'view_map', {})
+            reads = set()
+            for i in node.inputs:
+                reads.update(roots_of.get(i, [i]))
+            self.reads[node] = reads
+            for root in reads:
+                self.users[root].add(node)
+            self.created[node] = []
+            for idx_o, out in enumerate(node.outputs):
+                aliased = dmap.get(idx_o, []) + vmap.get(idx_o, [])
+                if aliased:
+                    roots_of[out] = []
+                    for idx_i in aliased:
+                        i = node.inputs[idx_i]
+                        roots_of[out].extend(roots_of.get(i, [i]))
+                else:
+                    self.created[node].append(out)
+                    self.size[out] = var_size(out)
+            preds = set(i.owner for i in node.inputs if i.owner)
+            preds.update(ords.get(node, []))
+            self.n_missing[node] = len(preds)
+            for pred in preds:
+                self.succ[pred].append(node)
+        self.kept = set()
+        for var in fgraph.outputs:
+            self.kept.update(roots_of.get(var, [var]))
+        self.ready = set(node for node in self.nodes
+                         if not self.n_missing[node])
+        self.mem = 0
+        self.peak = 0
+
+    def score(self, node):
+        """
+        Return the change of memory caused by running `node`.
+
+        """
+        score = 0
+        for out in self.created[node]:
+            if self.users[out] or out in self.kept:
+                score += self.size[out]
+        for root in self.reads[node]:
+            if (root in self.size and root not in self.kept and
+                    self.users[root] == set([node])):
+                score -= self.size[root]
+        return score
+
+    def run(self, node):
+        """
+        Run `node` and return what `undo` needs to cancel it.
+
+        """
+        record = (self.mem, self.peak, [], [])
+        read, newly_ready = record[2], record[3]
+        self.ready.remove(node)
+        for out in self.created[node]:
+            self.mem += self.size[out]
+        self.peak = max(self.peak, self.mem)
+        for out in self.created[node]:
+            if not self.users[out] and out not in self.kept:
+                self.mem -= self.size[out]
+        for root in self.reads[node]:
+            users = self.users[root]
+            users.remove(node)
+            read.append(root)
+            if not users and root in self.size and root not in self.kept:
+                self.mem -= self.size[root]
+        for succ in self.succ[node]:
+            self.n_missing[succ] -= 1
+            if not self.n_missing[succ]:
+                self.ready.add(succ)
+                newly_ready.append(succ)
+        return record
+
+    def undo(self, node, record):
+        """
+        Cancel `run(node)`, which returned `record`.
+
+        """
+        self.mem, self.peak, read, newly_ready = record
+        for root in read:
+            self.users[root].add(node)
+        for succ in self.succ[node]:
+            self.n_missing[succ] += 1
+        self.ready.difference_update(newly_ready)
+        self.ready.add(node)
+
+
+def memory_peak(fgraph, order, var_size):
+    """
+    Return the peak memory used by the intermediate results when the nodes
+    of `fgraph` run in `order`, with the sizes given by `var_size`.
+
+    """
+    sim = _MemorySimulation(fgraph, var_size)
+    for node in order:
+        sim.run(node)
+    return sim.peak
+
+
+def _greedy_memory_order(sim):
+    """
+    Run the nodes of `sim`, always choosing the ready node that increases
+    the memory the least, or the first one in toposort order on ties.
+
+    """
+    heap = [(sim.score(node), sim.position[node], node) for node in sim.ready]
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        score, pos, node = heapq.heappop(heap)
+        if node not in sim.ready or score != sim.score(node):
+            # A newer entry of this node is in the heap.
+            continue
+        record = sim.run(node)
+        order.append(node)
+        # The score of the nodes that became the last user of an input of
+        # node decreased.
+        changed = set(record[3])
+        for root in record[2]:
+            if len(sim.users[root]) == 1:
+                changed.update(sim.users[root])
+        for other in changed:
+            if other in sim.ready:
+                heapq.heappush(heap, (sim.score(other), sim.position[other],
+                                      other))
+    return order
+
+
+def min_memory_schedule(fgraph, var_size=None, max_search=1000):
+    """
+    Return an order of the nodes of `fgraph` with a low memory peak.
+
+    The greedy order (the ready node that increases the memory the least
+    first) is improved by a depth first branch and bound search over the
+    orders, as in ProfileStats.summary_memory, that stops after trying
+    `max_search` nodes.  Partial orders whose peak is already above the
+    best known are cut, as are the ones that reach a set of run nodes
+    already reached with a lower peak.
+
+    Parameters
+    ----------
+    fgraph
+        The FunctionGraph to schedule.
+    var_size
+        A function that returns the size of a variable, by default the
+        one of `var_size_fn(fgraph)`.
+    max_search
+        The maximum number of nodes tried by the search, 0 to only keep
+        the greedy order.
+
+    """
+    if var_size is None:
+        var_size = var_size_fn(fgraph)
+    sim = _MemorySimulation(fgraph, var_size)
+    best_order = _greedy_memory_order(sim)
+    best_peak = sim.peak
+    if len(best_order) != len(sim.nodes):
+        raise ValueError("graph contains cycles")
+    if not max_search:
+        return best_order
+
+    sim = _MemorySimulation(fgraph, var_size)
+    n_nodes = len(sim.nodes)
+
+    def children():
+        return iter(sorted(sim.ready, key=lambda node: (sim.score(node),
+                                                        sim.position[node])))
+    seen = {}
+    path = []
+    records = []
+    stack = [children()]
+    n_tried = 0
+    while stack and n_tried < max_search:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            if path:
+                sim.undo(path.pop(), records.pop())
+            continue
+        n_tried += 1
+        records.append(sim.run(node))
+        path.append(node)
+        key = frozenset(path)
+        if sim.peak >= best_peak or seen.get(key, sim.peak + 1) <= sim.peak:
+            sim.undo(path.pop(), records.pop())
+            continue
+        seen[key] = sim.peak
+        if len(path) == n_nodes:
+            best_order = list(path)
+            best_peak = sim.peak
+            sim.undo(path.pop(), records.pop())
+            continue
+        stack.append(children())
+    return best_order
+
+
+def memory_schedule_fn(shapes=None, unknown_dim=100, max_search=1000):
+    """
+    Make a schedule function that orders the nodes to lower the peak
+    memory of the intermediate results.
+
+    Use it as ``VM_Linker(schedule=memory_schedule_fn())``.  It only
+    changes the execution order of the linkers that run the nodes in the
+    scheduled order: the Loop and LoopGC VMs (``use_cloop=False`` without
+    lazy evaluation), the PerformLinker and the OpWiseCLinker.  The CVM
+    and the Stack VM evaluate the graph depth first from the outputs.
+
+    Parameters
+    ----------
+    shapes
+        Optional dict from variable to shape, see `var_size_fn`.
+    unknown_dim
+        See `var_size_fn`.
+    max_search
+        See `min_memory_schedule`.
+
+    """
+    def schedule(fgraph):
+        """
+        Order nodes in a FunctionGraph to lower the memory peak.
+
+        """
+        var_size = var_size_fn(fgraph, shapes, unknown_dim)
+        return min_memory_schedule(fgraph, var_size, max_search)
+    return schedule
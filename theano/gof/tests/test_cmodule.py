@@ -6,10 +6,18 @@ deterministic based on the input type and the op.
 """
 from __future__ import absolute_import, print_function, division
 
+import os
+import shutil
+import tempfile
+
 import numpy as np
+from nose.plugins.skip import SkipTest
 
 import theano
-from theano.gof.cmodule import GCC_compiler
+from theano.configparser import change_flags
+from theano.gof import cmodule
+from theano.gof.cc import get_module_cache
+from theano.gof.cmodule import GCC_compiler, ModuleCache, ModuleIndex
 
 
 class MyOp(theano.compile.ops.DeepCopyOp):
@@ -69,3 +77,179 @@ def test_flag_detection():
     # but was not detected because that path is not usually taken,
     # so we test it here directly.
     GCC_compiler.try_flags(["-lblas"])
+
+
+class AddConstant(theano.Op):
+    """Unversioned op: each constant needs its own C module."""
+    __props__ = ('cst',)
+
+    def __init__(self, cst):
+        self.cst = cst
+
+    def make_node(self, x):
+        x = theano.tensor.as_tensor_variable(x)
+        assert x.type == theano.tensor.dscalar
+        return theano.Apply(self, [x], [x.type()])
+
+    def perform(self, node, inputs, outputs):
+        outputs[0][0] = np.asarray(inputs[0] + self.cst)
+
+    def c_code(self, node, name, inames, onames, sub):
+        x, = inames
+        z, = onames
+        fail = sub['fail']
+        cst = repr(self.cst)
+        return """
+        Py_XDECREF(%(z)s);
+        %(z)s = (PyArrayObject*)PyArray_EMPTY(0, NULL, NPY_FLOAT64, 0);
+        if (!%(z)s)
+            %(fail)s
+        *(double*)PyArray_DATA(%(z)s) = *(double*)PyArray_DATA(%(x)s) + %(cst)s;
+        """ % locals()
+
+
+def test_parallel_compilation():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x = theano.tensor.dscalar()
+    csts = [float(c) for c in np.random.rand(4)]
+    out = x
+    for cst in csts:
+        out = AddConstant(cst)(out)
+    mode = theano.Mode(optimizer=None,
+                       linker=theano.gof.vm.VM_Linker(use_cloop=False))
+    cache = get_module_cache()
+    n_compiled = cache.stats[2]
+    with change_flags(**{'cmodule.compile_workers': 4}):
+        f = theano.function([x], out, mode=mode)
+    assert cache.stats[2] == n_compiled + len(csts)
+    assert all(hasattr(t, 'cthunk') for t in f.fn.thunks)
+    assert np.allclose(f(1.), 1. + sum(csts))
+
+
+def test_module_index():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+
+    def make_linker():
+        x = theano.tensor.dvector()
+        fgraph = theano.gof.FunctionGraph([x], [theano.tensor.exp(x) + 3])
+        return theano.gof.CLinker().accept(fgraph)
+
+    dir = tempfile.mkdtemp()
+    try:
+        cache = ModuleCache(dir, use_index=True)
+        lnk = make_linker()
+        cache.module_from_key(key=lnk.cmodule_key(), lnk=lnk)
+        assert cache.stats[2] == 1
+        index = open(os.path.join(dir, 'module_index')).read()
+        assert len(index.splitlines()) == 2
+
+        # A new cache only loads the key.pkl file of the module it needs.
+        cache2 = ModuleCache(dir, use_index=True)
+        assert not cache2.loaded_key_pkl
+        lnk = make_linker()
+        cache2.module_from_key(key=lnk.cmodule_key(), lnk=lnk)
+        assert cache2.stats[2] == 0
+        assert len(cache2.loaded_key_pkl) == 1
+
+        # A corrupted index is rebuilt from the key.pkl files.
+        with open(os.path.join(dir, 'module_index'), 'w') as f:
+            f.write('garbage')
+        cache3 = ModuleCache(dir, use_index=True)
+        assert open(os.path.join(dir, 'module_index')).read() == index
+        lnk = make_linker()
+        cache3.module_from_key(key=lnk.cmodule_key(), lnk=lnk)
+        assert cache3.stats[2] == 0
+
+        # The entries appended by another process are kept when the
+        # entries of the deleted modules are dropped.
+        module_dir = index.splitlines()[1].split(' ')[1]
+        ModuleIndex(cache3.index.path).add('other_hash', module_dir)
+        ModuleIndex(cache3.index.path).add('deleted_hash', 'tmp_deleted')
+        assert cache3.index.remove_missing(dir)
+        assert cache3.index.dir_from_hash['other_hash'] == module_dir
+        assert 'deleted_hash' not in cache3.index.dir_from_hash
+    finally:
+        shutil.rmtree(dir)
+
+
+def test_object_cache():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    # A random constant makes the code new for the object cache.  The
+    # global generator is seeded by other tests, so it would give the same
+    # constant, already in the cache, at each run.
+    src_code = ('extern "C" int f() { return %d; }\n' %
+                np.random.RandomState().randint(2 ** 30))
+    locations = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+    try:
+        with change_flags(**{'cmodule.object_cache': True}):
+            misses = cmodule.object_cache_misses
+            GCC_compiler.compile_str('test_object_cache', src_code,
+                                     location=locations[0], py_module=False)
+            assert cmodule.object_cache_misses == misses + 1
+            hits = cmodule.object_cache_hits
+            GCC_compiler.compile_str('test_object_cache', src_code,
+                                     location=locations[1], py_module=False)
+            assert cmodule.object_cache_hits == hits + 1
+            assert cmodule.object_cache_misses == misses + 1
+        libs = [open(os.path.join(l, 'test_object_cache.' +
+                                  cmodule.get_lib_extension()), 'rb').read()
+                for l in locations]
+        assert libs[0] == libs[1]
+    finally:
+        for l in locations:
+            shutil.rmtree(l)
+
+
+def test_precompiled_headers():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    src_code = ''.join('#include %s\n' % inc for inc in cmodule.pch_includes)
+    src_code += 'extern "C" int f() { return 1; }\n'
+    location = tempfile.mkdtemp()
+    try:
+        with change_flags(**{'cmodule.precompiled_headers': True}):
+            GCC_compiler.compile_str(
+                'test_pch', src_code, location=location, py_module=False,
+                preargs=GCC_compiler.compile_args())
+        assert os.path.exists(os.path.join(
+            location, 'test_pch.' + cmodule.get_lib_extension()))
+        pch_dir = os.path.join(theano.config.compiledir, 'pch')
+        assert any(os.path.exists(os.path.join(pch_dir, d,
+                                               'theano_pch.h.gch'))
+                   for d in os.listdir(pch_dir))
+    finally:
+        shutil.rmtree(location)
+
+
+def test_detection_cache():
+    dirname = tempfile.mkdtemp()
+    try:
+        cmodule.DetectionCache(dirname).set('march_flags', ['-march=test'])
+        # Another process would read the saved value.
+        cache = cmodule.DetectionCache(dirname)
+        assert cache.get('march_flags') == ['-march=test']
+        with change_flags(**{'cmodule.cache_detection': False}):
+            assert cache.get('march_flags') is None
+        if theano.config.cxx:
+            # The results of the successful test compilations are saved
+            # too, but not the failures.
+            saved_dirname = cmodule.detection_cache.dirname
+            cmodule.detection_cache.dirname = dirname
+            try:
+                assert GCC_compiler.try_compile_tmp(
+                    'int main() { return 0; }', try_run=True) == (True, True)
+                assert GCC_compiler.try_compile_tmp(
+                    'int main() { return 1; }', try_run=True) == (True, False)
+                assert not GCC_compiler.try_compile_tmp('syntax error')
+            finally:
+                cmodule.detection_cache.dirname = saved_dirname
+            cache = cmodule.DetectionCache(dirname)
+            cache.load()
+            values = list(cache.values.values())
+            assert (True, True) in values
+            assert (True, False) not in values and False not in values
+    finally:
+        shutil.rmtree(dirname)
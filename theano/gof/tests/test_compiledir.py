@@ -1,4 +1,14 @@
 from __future__ import absolute_import, print_function, division
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from nose.plugins.skip import SkipTest
+
+import theano
+from theano.compat import decode
 from theano.configdefaults import short_platform
 
 
@@ -19,3 +29,70 @@ def test_short_platform():
     ]:
         o = short_platform(r, p)
         assert o == a, (o, a)
+
+
+def test_export_import():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    # The compiledir can't be changed in this process.
+    root = os.path.dirname(os.path.dirname(os.path.abspath(theano.__file__)))
+    script = os.path.join(root, 'bin', 'theano_cache.py')
+    compile = ("import theano; x = theano.tensor.dvector();"
+               "f = theano.function([x], theano.tensor.exp(x) * 5,"
+               " mode=theano.Mode(linker='c'));"
+               "print(theano.gof.cc.get_module_cache().stats[2])")
+    src, dst = tempfile.mkdtemp(), tempfile.mkdtemp()
+    try:
+        bundle = os.path.join(src, 'bundle.tar.gz')
+
+        def run(base_compiledir, *args):
+            env = dict(os.environ)
+            env['THEANO_FLAGS'] = '%s,base_compiledir=%s' % (
+                env.get('THEANO_FLAGS', ''), base_compiledir)
+            env['PYTHONPATH'] = os.pathsep.join(
+                [root] + [p for p in [env.get('PYTHONPATH')] if p])
+            return decode(subprocess.check_output([sys.executable] +
+                                                  list(args), env=env))
+
+        n_compiled = int(run(src, '-c', compile))
+        assert n_compiled > 0
+        run(src, script, 'export', bundle)
+        assert ('Imported %d modules' % n_compiled) in run(
+            dst, script, 'import', bundle)
+        assert int(run(dst, '-c', compile)) == 0
+        # Modules that are already there are skipped.
+        assert 'Imported 0 modules' in run(dst, script, 'import', bundle)
+    finally:
+        shutil.rmtree(src)
+        shutil.rmtree(dst)
+
+
+def test_safe_member_name():
+    from theano.gof.compiledir import _safe_member_name
+    for name in ['mod.cpp', 'sub/mod.so', 'a/../b']:
+        assert _safe_member_name(name), name
+    for name in ['', '.', '..', '../x', 'a/../../x', '/tmp/x']:
+        assert not _safe_member_name(name), name
+
+
+def test_compatible_key():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    from theano.gof.cc import get_module_cache
+    from theano.gof.compiledir import _compatible_key
+    x = theano.tensor.dvector()
+    theano.function([x], theano.tensor.exp(x) * 7,
+                    mode=theano.Mode(linker='c'))
+    key = [k for k_data in get_module_cache().module_hash_to_key_data.values()
+           for k in k_data.keys if k[0]][0]
+
+    def with_args(compile_args):
+        c_link_key = (key[1][0], tuple(compile_args)) + tuple(key[1][2:])
+        return (key[0], c_link_key) + tuple(key[2:])
+    compile_args = list(key[1][1])
+    assert _compatible_key(key)
+    # Ops can remove default arguments that don't select the processor.
+    assert _compatible_key(with_args([a for a in compile_args
+                                      if not a.startswith('-O')]))
+    assert not _compatible_key(with_args(compile_args +
+                                         ['-mno-such-feature']))
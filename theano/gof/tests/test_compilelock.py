@@ -0,0 +1,98 @@
+from __future__ import absolute_import, print_function, division
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from nose.plugins.skip import SkipTest
+
+import theano
+from theano.configparser import change_flags
+from theano.gof import compilelock
+from theano.gof.tests.test_cmodule import AddConstant
+
+
+def lock_name():
+    # A name that no real module hash can have.
+    return 'test_%s' % np.random.randint(2 ** 30)
+
+
+def test_module_lock():
+    a, b, c = lock_name(), lock_name(), lock_name()
+    lock_dir = compilelock.module_lock_dir(a)
+    compilelock.get_module_lock(a)
+    assert os.path.isdir(lock_dir)
+    # The lock is reentrant.
+    compilelock.get_module_lock(a)
+    compilelock.release_module_lock(a)
+    assert os.path.isdir(lock_dir)
+    # Other modules can be locked at the same time.
+    with change_flags(**{'compile.per_module_lock': True}):
+        with compilelock.module_lock_ctx([b, c]):
+            assert os.path.isdir(compilelock.module_lock_dir(b))
+            assert os.path.isdir(compilelock.module_lock_dir(c))
+    assert not os.path.isdir(compilelock.module_lock_dir(b))
+    compilelock.release_module_lock(a)
+    assert not os.path.isdir(lock_dir)
+    # The released locks are forgotten.
+    assert lock_dir not in compilelock._module_locks
+
+
+def test_lock_threads():
+    # Another thread of the process waits for the lock instead of thinking
+    # that it already holds it.
+    got_lock = threading.Event()
+
+    def take_lock():
+        compilelock.get_lock()
+        got_lock.set()
+        compilelock.release_lock()
+    compilelock.get_lock()
+    try:
+        thread = threading.Thread(target=take_lock)
+        thread.start()
+        time.sleep(0.1)
+        assert not got_lock.is_set()
+    finally:
+        compilelock.release_lock()
+    thread.join()
+    assert got_lock.is_set()
+    assert compilelock.get_lock.n_lock == 0
+
+
+def test_module_lock_stale():
+    # A lock left by a dead process of this host is overridden.
+    name = lock_name()
+    lock_dir = compilelock.module_lock_dir(name)
+    os.makedirs(lock_dir)
+    try:
+        # We assume there is no process with that pid.
+        with open(os.path.join(lock_dir, 'lock'), 'w') as f:
+            f.write('%s_0123456789_%s\n' % (2 ** 22 + 1,
+                                            compilelock.hostname))
+        compilelock.get_module_lock(name, min_wait=0.01, max_wait=0.02,
+                                    verbosity=0)
+        with open(os.path.join(lock_dir, 'lock')) as f:
+            owner = f.readlines()[0].strip()
+        assert owner.split('_')[0] == str(os.getpid())
+        compilelock.release_module_lock(name)
+        assert not os.path.isdir(lock_dir)
+    finally:
+        if os.path.isdir(lock_dir):
+            shutil.rmtree(lock_dir)
+
+
+def test_per_module_lock_compilation():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x = theano.tensor.dscalar()
+    cst = float(np.random.rand())
+    mode = theano.Mode(optimizer=None,
+                       linker=theano.gof.vm.VM_Linker(use_cloop=False))
+    with change_flags(**{'compile.per_module_lock': True}):
+        f = theano.function([x], AddConstant(cst)(x), mode=mode)
+    assert hasattr(f.fn.thunks[0], 'cthunk')
+    assert np.allclose(f(1.), 1. + cst)
+    assert getattr(compilelock.get_lock, 'n_lock', 0) == 0
+    assert not compilelock._module_locks
@@ -14,6 +14,8 @@ from theano.gof.toolbox import ReplaceValidate
 
 from copy import copy
 
+from theano.configparser import change_flags
+
 
 def PatternOptimizer(p1, p2, ign=True):
     return OpKeyOptimizer(PatternSub(p1, p2), ignore_newtrees=ign)
@@ -477,3 +479,30 @@ def test_multiple_inplace():
     OpSubOptimizer(multiple_in_place_1, multiple_in_place_0_1, fail).optimize(g)
     consistent(g)
     assert fail.failures == 1
+
+
+@change_flags(cycle_detection='regular')
+def test_regular_cycle_detection():
+    # The tests above use the default incremental cycle detection.
+    test_destroyers_loop()
+    test_long_destroyers_loop()
+    test_usage_loop()
+    test_usage_loop_through_views()
+    test_usage_loop_insert_views()
+    test_repair_destroy_path()
+    test_multiple_inplace()
+
+
+def test_incremental_cycle_detection_order():
+    # The order kept between the validations respects the orderings of
+    # the DestroyHandler.
+    x, y, z = inputs()
+    e1 = add(x, y)
+    e2 = add(e1, y)
+    e3 = add(e1, z)
+    g = Env([x, y, z], [e2, e3])
+    g.toposort()
+    g.replace_validate(e2, add_in_place(e1, y))
+    consistent(g)
+    order = g.toposort()
+    assert order.index(e3.owner) < order.index(g.outputs[0].owner)
@@ -48,3 +48,59 @@ class TFunctionGraph(unittest.TestCase):
                 u = CompatUnpickler(f)
             d = u.load()
         f = theano.function(**d)
+
+
+def check_toposort(fgraph):
+    order = fgraph.toposort()
+    assert set(order) == fgraph.apply_nodes
+    assert len(order) == len(fgraph.apply_nodes)
+    position = dict((node, i) for i, node in enumerate(order))
+    ords = fgraph.orderings()
+    for node in order:
+        prereqs = [inp.owner for inp in node.inputs if inp.owner]
+        prereqs += ords.get(node, [])
+        for prereq in prereqs:
+            assert position[prereq] < position[node], (prereq, node)
+    return order
+
+
+def test_incremental_toposort():
+    x = tt.vector('x')
+    y = tt.vector('y')
+    a = tt.exp(x)
+    b = tt.log(y)
+    c = a * b
+    fg = FunctionGraph([x, y], [c, a * x, b * y], clone=False)
+    order = check_toposort(fg)
+    assert fg.incremental_toposort.labels is not None
+
+    # Make the first of two independent nodes depend on the second one,
+    # so that the order has to be repaired.
+    first, second = [n for n in order if n in (a.owner, b.owner)]
+    fg.change_input(first, 0, second.outputs[0])
+    assert fg.incremental_toposort.labels is not None
+    order = check_toposort(fg)
+    assert order.index(second) < order.index(first)
+
+    # New nodes and pruned nodes.
+    fg.replace(c, tt.sqrt(c) + a)
+    fg.replace(fg.outputs[1], x * y)
+    check_toposort(fg)
+
+    # A cycle drops the order, which is computed again next time.
+    old_input = second.inputs[0]
+    fg.change_input(second, 0, first.outputs[0])
+    assert fg.incremental_toposort.labels is None
+    fg.change_input(second, 0, old_input)
+    check_toposort(fg)
+
+
+def test_incremental_toposort_orderings():
+    # The orderings of the DestroyHandler are respected.
+    x = tt.vector('x')
+    y = x * 2
+    z = tt.exp(y) + y
+    f = theano.function([x], [z, tt.log(y)], mode='FAST_RUN')
+    fg = f.maker.fgraph
+    assert hasattr(fg, 'destroyers')
+    check_toposort(fg)
@@ -1,6 +1,8 @@
 from __future__ import absolute_import, print_function, division
+from collections import deque
 from itertools import count
 import pickle
+import random
 import unittest
 
 from nose.plugins.skip import SkipTest
@@ -11,8 +13,10 @@ from theano import (
     shared, tensor)
 from theano.gof.graph import (
     Apply,
-    as_string, clone, general_toposort, inputs, io_toposort,
-    is_same_graph, Variable)
+    ancestors, as_string, clone, clone_get_equiv, general_toposort, inputs,
+    io_toposort, is_same_graph, ops, stack_search, Variable,
+    variables_and_orphans)
+from theano.gof.fg import FunctionGraph
 from theano.gof.op import Op
 from theano.gof.type import Type
 from theano.sandbox.cuda.var import (
@@ -77,6 +81,29 @@ class TestInputs:
         i = inputs(node2.outputs)
         assert i == [r1, r2, r5], i
 
+    def test_same_as_stack_search(self):
+        # The traversals give the variables in the order of stack_search.
+        rng = random.Random(1)
+        ins = [MyVariable(i) for i in range(3)]
+        variables = list(ins)
+        for i in range(50):
+            variables.append(MyOp(variables[-1], rng.choice(variables)))
+        outs = [variables[-1], variables[30]]
+        i = ins[:2]
+
+        def expand_ancestors(r):
+            if r.owner:
+                return reversed(r.owner.inputs)
+        assert (ancestors(outs) ==
+                stack_search(deque(outs), expand_ancestors, 'dfs'))
+
+        def expand_variables(r):
+            if r.owner and r not in i:
+                return list(reversed(r.owner.outputs + r.owner.inputs))
+        expected = stack_search(deque(outs), expand_variables, 'dfs')
+        assert variables_and_orphans(i, outs) == (expected, [ins[2]])
+        assert ops(i, outs) == set(r.owner for r in expected if r.owner)
+
 
 #############
 # as_string #
@@ -158,6 +185,20 @@ class TestClone(X):
         assert self.str(inputs(new_node.outputs), new_node.outputs) == ["MyOp(R7, R8)"]
         assert self.str(inputs(node.outputs), node.outputs) == ["MyOp(MyOp(R1, R2), R5)"]
 
+    def test_deep(self):
+        # Deep graphs are cloned without recursion.
+        r1, r2 = MyVariable(1), MyVariable(2)
+        out = r1
+        for i in range(5000):
+            out = MyOp.make_node(out, r2).outputs[0]
+        equiv = clone_get_equiv([r1], [out])
+        new_out = equiv[out]
+        for i in range(5000):
+            assert new_out is not out
+            assert new_out.owner.inputs[1] is equiv[r2]
+            out, new_out = out.owner.inputs[0], new_out.owner.inputs[0]
+        assert new_out is equiv[r1] and out is r1
+
 
 ############
 # toposort #
@@ -230,6 +271,29 @@ class TestToposort:
         all = io_toposort([], o0.outputs)
         assert all == [o0]
 
+    def test_clients(self):
+        """Test the clients filled by io_toposort"""
+        r1, r2 = MyVariable(1), MyVariable(2)
+        o0 = MyOp.make_node(r1, r1)
+        o1 = MyOp.make_node(o0.outputs[0], r2)
+        clients = {}
+        all = io_toposort([r1, r2], o1.outputs, clients=clients)
+        assert all == [o0, o1]
+        assert clients[r1] == [o0, o0]
+        assert clients[o0] == [o0.outputs[0]]
+        assert clients[o0.outputs[0]] == [o1]
+
+    def test_cycle(self):
+        """Test that a cycle is detected"""
+        r1, r2 = MyVariable(1), MyVariable(2)
+        o0 = MyOp.make_node(r1, r2)
+        o1 = MyOp.make_node(o0.outputs[0], r2)
+        try:
+            io_toposort([r1, r2], o1.outputs, orderings={o0: [o1]})
+            assert False
+        except ValueError as e:
+            assert str(e) == 'graph contains cycles'
+
 
 #################
 # is_same_graph #
@@ -326,6 +390,48 @@ class TestEval(unittest.TestCase):
                          "temporary functions must not be serialized")
 
 
+class TestSlots(unittest.TestCase):
+
+    def test_no_dict(self):
+        # The attributes of the graph objects, including the ones set by
+        # FunctionGraph, are in their slots.
+        x = tensor.vector('x')
+        y = tensor.exp(x) * x
+        FunctionGraph([x], [y], clone=False)
+        for obj in [x, y, y.owner, y.owner.inputs[0].owner]:
+            self.assertEqual(obj.__dict__, {})
+
+    def test_pickle(self):
+        x = tensor.vector('x')
+        y = tensor.exp(x) * 2
+        y.tag.test = 1
+        y.owner.extra = 2
+        y2 = pickle.loads(pickle.dumps(y))
+        self.assertEqual(y2.owner.op, y.owner.op)
+        self.assertEqual(y2.name, y.name)
+        self.assertEqual(y2.index, 0)
+        self.assertEqual(y2.auto_name, y.auto_name)
+        self.assertEqual(y2.tag.test, 1)
+        self.assertEqual(y2.owner.extra, 2)
+        self.assertTrue(y2.owner.outputs[0] is y2)
+        self.assertEqual(y2.owner.inputs[0].owner.inputs[0].name, 'x')
+        c = pickle.loads(pickle.dumps(tensor.constant([1., 2.])))
+        self.assertEqual(list(c.data), [1., 2.])
+        self.assertTrue(c.owner is None)
+
+    def test_old_state(self):
+        # Nodes pickled before they had slots had all their attributes in
+        # their __dict__.
+        x = tensor.vector('x')
+        y = Variable.__new__(type(x))
+        y.__setstate__({'type': x.type, 'owner': None, 'index': None,
+                        'name': 'y', 'auto_name': 'auto_0',
+                        'tag': x.tag, 'other': 1})
+        self.assertEqual(y.name, 'y')
+        self.assertEqual(y.other, 1)
+        self.assertTrue(y.type is x.type)
+
+
 ################
 # autoname     #
 ################
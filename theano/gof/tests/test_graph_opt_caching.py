@@ -1,41 +1,55 @@
 from __future__ import absolute_import, print_function, division
 import os
+import shutil
 import numpy as np
 import theano
 import theano.tensor as T
+from theano.configparser import change_flags
 
 floatX = 'float32'
 
 
 def test_graph_opt_caching():
-    opt_db_file = theano.config.compiledir + '/optimized_graphs.pkl'
-    os.system('rm %s' % opt_db_file)
+    opt_db_dir = os.path.join(theano.config.compiledir, 'optimized_graphs')
+    if os.path.isdir(opt_db_dir):
+        shutil.rmtree(opt_db_dir)
 
     mode = theano.config.mode
     if mode in ["DEBUG_MODE", "DebugMode"]:
         mode = "FAST_RUN"
-    default = theano.config.cache_optimizations
-    try:
-        theano.config.cache_optimizations = True
+    # Loading the module cache can import modules that register more
+    # optimizations, which changes the key of the graphs.
+    theano.gof.cc.get_module_cache()
+    with change_flags(cache_optimizations=True):
         a = T.fmatrix('a')
         b = T.fmatrix('b')
         c = theano.shared(np.ones((10, 10), dtype=floatX))
         d = theano.shared(np.ones((10, 10), dtype=floatX))
         e = T.sum(T.sum(T.sum(a ** 2 + b) + c) + d)
         f1 = theano.function([a, b], e, mode=mode)
+        assert len(os.listdir(opt_db_dir)) == 1
 
+        # The same graph, with other names and shared values, is found in
+        # the cache.
         m = T.fmatrix('x1')
         n = T.fmatrix('x2')
-        p = theano.shared(np.ones((10, 10), dtype=floatX))
+        p = theano.shared(np.ones((10, 10), dtype=floatX) * 2)
         q = theano.shared(np.ones((10, 10), dtype=floatX))
         j = T.sum(T.sum(T.sum(m ** 2 + n) + p) + q)
         f2 = theano.function([m, n], j, mode=mode)
+        assert len(os.listdir(opt_db_dir)) == 1
+        assert ([str(node.op) for node in f1.maker.fgraph.toposort()] ==
+                [str(node.op) for node in f2.maker.fgraph.toposort()])
 
         in1 = np.ones((10, 10), dtype=floatX)
         in2 = np.ones((10, 10), dtype=floatX)
-        assert f1(in1, in2) == f2(in1, in2)
-    finally:
-        theano.config.cache_optimizations = default
+        assert np.allclose(f1(in1, in2), 2010100)
+        assert np.allclose(f2(in1, in2), 2020100)
+
+        # A different graph is optimized and saved.
+        f3 = theano.function([m, n], T.sum(m ** 3 + n), mode=mode)
+        assert len(os.listdir(opt_db_dir)) == 2
+        assert np.allclose(f3(in1, in2), 200)
 
 if __name__ == '__main__':
     test_graph_opt_caching()
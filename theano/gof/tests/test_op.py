@@ -403,5 +403,49 @@ def test_debug_error_message():
         finally:
             config.compute_test_value = prev_value
 
+
+def test_hash_consing():
+    x = T.matrix('x')
+    y = T.matrix('y')
+    with op.hash_consing():
+        assert T.exp(x) is T.exp(x)
+        assert x + 1 is x + 1
+        assert T.dot(x, y) is T.dot(x, y)
+        assert T.exp(x) is not T.exp(y)
+        assert x + 1 is not x + 2
+        with op.hash_consing():
+            # Nested contexts share the table.
+            e = T.exp(x)
+        assert e is T.exp(x)
+    assert T.exp(x) is not T.exp(x)
+
+
+def test_hash_consing_grad():
+    # The graph of the gradient has fewer nodes, and the same value.
+    x = T.vector('x')
+    W = T.matrix('W')
+
+    def build():
+        h = x
+        for i in range(3):
+            h = T.tanh(T.dot(W, h)) + T.tanh(T.dot(W, h))
+        cost = h.sum()
+        return [cost, T.grad(cost, W)]
+
+    outputs = build()
+    with op.hash_consing():
+        consed_outputs = build()
+    nb_nodes = len(theano.gof.graph.ops([x, W], outputs))
+    nb_consed = len(theano.gof.graph.ops([x, W], consed_outputs))
+    assert nb_consed < nb_nodes, (nb_consed, nb_nodes)
+
+    f = theano.function([x, W], outputs)
+    g = theano.function([x, W], consed_outputs)
+    x_val = np.random.rand(4).astype(config.floatX)
+    W_val = np.random.rand(4, 4).astype(config.floatX)
+    for r1, r2 in zip(f(x_val, W_val), g(x_val, W_val)):
+        assert np.allclose(r1, r2)
+
+
 if __name__ == '__main__':
     unittest.main()
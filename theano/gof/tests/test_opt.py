@@ -1,4 +1,5 @@
 from __future__ import absolute_import, print_function, division
+import json
 
 from theano.gof.type import Type
 from theano.gof.graph import Variable, Apply, Constant
@@ -571,6 +572,30 @@ class TestEquilibrium(object):
         opt.optimize(g)
         assert str(g) == '[Op2(x, y)]'
 
+    def test_profile_to_dict(self):
+        x, y, z = map(MyVariable, 'xyz')
+        e = op3(op4(x, y))
+        g = FunctionGraph([x, y, z], [e])
+        opt = EquilibriumOptimizer(
+            [PatternSub((op1, 'x', 'y'), (op2, 'x', 'y')),
+             PatternSub((op4, 'x', 'y'), (op1, 'x', 'y')),
+             PatternSub((op3, (op2, 'x', 'y')), (op4, 'x', 'y'))
+             ],
+            max_use_ratio=10)
+        prof = opt.profile_to_dict(opt.optimize(g))
+        assert str(g) == '[Op2(x, y)]'
+        # It can be saved in JSON.
+        assert json.loads(json.dumps(prof)) == prof
+        assert prof['class'] == 'EquilibriumOptimizer'
+        assert (prof['nodes_before'], prof['nodes_after']) == (2, 1)
+        stats = list(prof['optimizers'].values())
+        assert len(stats) == 3
+        for s in stats:
+            assert s['kind'] == 'local'
+            assert s['attempts'] >= s['applied'] >= 1
+        assert (sum(s['nodes_created'] for s in stats) -
+                sum(s['nodes_removed'] for s in stats)) == -1
+
     @theano.configparser.change_flags(on_opt_error='ignore')
     def test_low_use_ratio(self):
         x, y, z = map(MyVariable, 'xyz')
@@ -595,6 +620,61 @@ class TestEquilibrium(object):
         # print 'after', g
         assert str(g) == '[Op1(x, y)]'
 
+    def test_incremental(self):
+        for incremental in [False, True]:
+            x, y, z = map(MyVariable, 'xyz')
+            e = op1(op1(op3(x, y)), op3(op4(x, y), z))
+            g = FunctionGraph([x, y, z], [e])
+            opt = EquilibriumOptimizer(
+                [PatternSub((op1, (op2, 'x', 'y')), (op4, 'x', 'y')),
+                 PatternSub((op3, 'x', 'y'), (op4, 'x', 'y')),
+                 PatternSub((op4, 'x', 'y'), (op5, 'x', 'y')),
+                 PatternSub((op5, 'x', 'y'), (op6, 'x', 'y')),
+                 PatternSub((op6, 'x', 'y'), (op2, 'x', 'y'))
+                 ],
+                max_use_ratio=10, incremental=incremental)
+            opt.optimize(g)
+            assert str(g) == '[Op1(Op2(x, y), Op2(Op2(x, y), z))]', str(g)
+            assert not hasattr(g, 'dirty_nodes_tracker')
+
+    def test_incremental_visits(self):
+        # Each rewrite of the bottom of a long chain needs a new iteration.
+        # The incremental ones only visit its neighbourhood.
+        x, y, z = map(MyVariable, 'xyz')
+        e = op3(x, y)
+        for i in range(30):
+            e = op1(e, z)
+        g = FunctionGraph([x, y, z], [e])
+        opt = EquilibriumOptimizer(
+            [PatternSub((op3, 'x', 'y'), (op4, 'x', 'y')),
+             PatternSub((op4, 'x', 'y'), (op5, 'x', 'y')),
+             PatternSub((op5, 'x', 'y'), (op6, 'x', 'y'))],
+            max_use_ratio=10, incremental=True)
+        nb_nodes = opt.optimize(g)[5]
+        assert str(g).startswith('[Op1(Op1('), str(g)
+        assert 'Op6(x, y)' in str(g)
+        # A full iteration, the incremental ones, then a full one.
+        assert nb_nodes[0] == nb_nodes[-1] == 31, nb_nodes
+        assert len(nb_nodes) > 3
+        assert all(n <= 3 for n in nb_nodes[1:-1]), nb_nodes
+
+    def test_incremental_tensor_graph(self):
+        # The incremental mode gives the same graph as the full sweeps.
+        x = T.matrix('x')
+        W = T.matrix('W')
+        h = x
+        for i in range(3):
+            h = T.tanh(T.dot(h, W) * 1 + 0)
+        cost = T.log(T.exp(h)).sum()
+        outputs = [cost] + T.grad(cost, [W])
+        topos = []
+        for incremental in [False, True]:
+            with theano.configparser.change_flags(
+                    **{'optdb.incremental': incremental}):
+                f = theano.function([x, W], outputs, mode='FAST_RUN')
+            topos.append([str(node.op) for node in f.maker.fgraph.toposort()])
+        assert topos[0] == topos[1]
+
 
 def test_pre_constant_merge_slice():
     ms = theano.tensor.type_other.MakeSlice()(1)
@@ -1,7 +1,12 @@
 from __future__ import absolute_import, print_function, division
+import numpy as np
+
 from theano.gof.sched import (make_dependence_cmp, sort_apply_nodes,
-                              reverse_dict, _toposort, posort)
+                              reverse_dict, _toposort, posort,
+                              var_size_fn, memory_peak, min_memory_schedule,
+                              memory_schedule_fn)
 
+import theano
 from theano import tensor
 from theano.gof.graph import io_toposort
 from theano.compat import cmp
@@ -68,3 +73,45 @@ def test_posort():
             lambda a, b: a - b]
     assert (posort(l, *cmps) ==
             [10, 1, 11, 2, 12, 3, 13, 4, 14, 5, 15, 6, 16, 7, 17, 8, 18, 9, 19])
+
+
+def test_min_memory_schedule():
+    x = tensor.vector('x')
+    big = [tensor.exp(x * (i + 2)) for i in range(3)]
+    s = (tensor.tanh(tensor.exp(tensor.sin(x) * 2)) * 3).sum()
+    out = (big[0] + big[1] + big[2]) * s
+    mode = theano.Mode(optimizer=None, linker='py')
+    fgraph = theano.function([x], out, mode=mode).maker.fgraph
+    var_size = var_size_fn(fgraph)
+    topo_peak = memory_peak(fgraph, fgraph.toposort(), var_size)
+    for max_search in [0, 1000]:
+        order = min_memory_schedule(fgraph, var_size, max_search)
+        assert len(order) == len(fgraph.apply_nodes)
+        position = dict((node, i) for i, node in enumerate(order))
+        for node in order:
+            assert all(position[i.owner] < position[node]
+                       for i in node.inputs if i.owner)
+        peak = memory_peak(fgraph, order, var_size)
+        assert peak <= topo_peak
+    # The search computes the scalar s after the big vectors are summed.
+    assert peak < topo_peak
+
+    # Recorded shapes change the sizes.
+    var_size = var_size_fn(fgraph, shapes=dict((v, (10,))
+                                               for v in fgraph.variables))
+    out = fgraph.outputs[0]
+    assert var_size(out) == 10 * np.dtype(out.dtype).itemsize
+
+
+def test_memory_schedule_fn():
+    x = tensor.vector('x')
+    big = [tensor.exp(x * (i + 2)) for i in range(3)]
+    s = (tensor.tanh(tensor.exp(tensor.sin(x) * 2)) * 3).sum()
+    out = (big[0] + big[1] + big[2]) * s
+    schedule = memory_schedule_fn()
+    linker = theano.gof.vm.VM_Linker(use_cloop=False, schedule=schedule)
+    f = theano.function([x], out, mode=theano.Mode(linker=linker))
+    assert list(f.fn.nodes) == schedule(f.maker.fgraph)
+    x_val = np.arange(3).astype(x.dtype)
+    expected = theano.function([x], out)(x_val)
+    assert np.allclose(f(x_val), expected)
@@ -61,3 +61,20 @@ def test_stack_trace():
         assert len(v.tag.trace[0]) == 2
     finally:
         theano.config.traceback.limit = orig
+
+
+def test_stack_trace_shared():
+    # The variables created at the same place share their trace.
+    vs = [theano.tensor.vector() for i in range(2)]
+    assert vs[0].tag.trace is vs[1].tag.trace
+    assert vs[0].tag.trace != theano.tensor.vector().tag.trace
+
+    # traceback.limit=0 disables them.
+    orig = theano.config.traceback.limit
+    try:
+        theano.config.traceback.limit = 0
+        v = theano.tensor.vector()
+        assert not hasattr(v.tag, 'trace')
+        assert not hasattr((v + 1).tag, 'trace')
+    finally:
+        theano.config.traceback.limit = orig
@@ -1,12 +1,13 @@
 from __future__ import absolute_import, print_function, division
 import gc
 import sys
+import threading
 import time
 import unittest
 
 from nose.plugins.skip import SkipTest
 import numpy as np
-from six import itervalues
+from six import iteritems, itervalues
 
 from theano import function
 from theano.gof import vm
@@ -16,6 +17,7 @@ from theano.compile import Mode
 
 from theano import tensor
 from theano.ifelse import ifelse
+from theano.tests import unittest_tools as utt
 import theano
 
 
@@ -274,6 +276,31 @@ def test_allow_gc_cvm():
     assert f.fn.storage_map[n][0] is None
 
 
+def test_cvm_timers():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x = tensor.vector()
+    f = function([x], tensor.exp(x) + 1,
+                 mode=Mode(linker=vm.VM_Linker(use_cloop=True)))
+    assert isinstance(f.fn, vm.CVM)
+    x_val = np.ones(3, dtype=x.dtype)
+    f.fn.time_thunks = True
+    for i in range(3):
+        f(x_val)
+    # The timings stay in the C arrays until they are flushed.
+    assert f.fn.call_counts == [0] * len(f.fn.nodes)
+    f.fn.flush_timers()
+    assert f.fn.call_counts == [3] * len(f.fn.nodes)
+    assert all(t > 0 for t in f.fn.call_times)
+    f.fn.flush_timers()
+    assert f.fn.call_counts == [3] * len(f.fn.nodes)
+
+    profile = theano.compile.profiling.ProfileStats(atexit_print=False)
+    f.fn.update_profile(profile)
+    assert f.fn.call_counts == [0] * len(f.fn.nodes)
+    assert sorted(profile.apply_callcount.values()) == [3] * len(f.fn.nodes)
+
+
 run_memory_usage_tests = False
 if run_memory_usage_tests:
     # these are not normal unit tests, do not run them as part of standard
@@ -453,3 +480,161 @@ def test_reallocation():
         assert check_storage(storage_map)[0]
         assert len(set(id(v) for v in
                        itervalues(storage_map))) < len(storage_map)
+
+
+def test_pack_intervals():
+    intervals = {'a': (0, 1), 'b': (1, 2), 'c': (2, 3), 'd': (0, 3)}
+    sizes = {'a': 64, 'b': 128, 'c': 64, 'd': 32}
+    offsets, total = vm.pack_intervals(intervals, sizes)
+    # 'a' and 'c' can share memory, the others can't.
+    assert offsets['a'] == offsets['c']
+    assert total == 224
+    for k1 in intervals:
+        for k2 in intervals:
+            if k1 < k2 and (intervals[k1][0] <= intervals[k2][1] and
+                            intervals[k2][0] <= intervals[k1][1]):
+                assert (offsets[k1] + sizes[k1] <= offsets[k2] or
+                        offsets[k2] + sizes[k2] <= offsets[k1])
+
+
+def test_memory_plan():
+    x = tensor.matrix('x')
+    w = tensor.matrix('w')
+    h = x
+    for i in range(4):
+        h = tensor.tanh(tensor.dot(h, w) + h.sum(0)) * 2
+    outputs = [h.sum(), theano.grad(h.sum(), w)]
+    rng = np.random.RandomState(1)
+    w_val = rng.rand(20, 20).astype(w.dtype) / 20
+    x_vals = [rng.rand(n, 20).astype(x.dtype) for n in [30, 30, 10, 30]]
+    expected = [theano.function([x, w], outputs)(x_val, w_val)
+                for x_val in x_vals]
+    for allow_gc in [True, False]:
+        linker = vm.VM_Linker(allow_gc=allow_gc, use_cloop=False,
+                              memory_plan=True)
+        f = function([x, w], outputs, mode=Mode(linker=linker))
+        assert f.fn.arena.seeds is None
+        for i, (x_val, exp) in enumerate(zip(x_vals, expected)):
+            for r, e in zip(f(x_val, w_val), exp):
+                utt.assert_allclose(r, e)
+            if allow_gc or i == 0:
+                continue
+            # After the first call, the intermediate results are computed
+            # in the arena, except when the shape changed.
+            arena = f.fn.arena
+            in_arena = [storage[0] is view for storage, view in arena.seeds]
+            assert all(in_arena) == (x_val.shape == x_vals[0].shape)
+        assert f.fn.arena.seeds
+        assert 0 < f.fn.arena.nbytes < f.fn.arena.unpacked_nbytes
+
+
+def test_background_compile():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    from theano.gof.tests.test_cmodule import AddConstant
+    x = tensor.dscalar()
+    for use_cloop in [False, True]:
+        # Random constants make sure the modules are not in the cache.
+        csts = [float(c) for c in np.random.rand(2)]
+        s = theano.shared(np.asarray(0.))
+        out = AddConstant(csts[1])(AddConstant(csts[0])(x))
+        f = function([x], out, updates=[(s, s + out)],
+                     mode=Mode(optimizer=None,
+                               linker=vm.VM_Linker(use_cloop=use_cloop,
+                                                   background_compile=True)))
+        assert isinstance(f.fn, vm.HotSwapVM)
+        first_vm = f.fn.vm
+        expected = 1. + sum(csts)
+        assert np.allclose(f(1.), expected)
+        assert f.fn.wait(60)
+        assert f.fn.status() == dict(python=0, pending=0, done=True)
+        assert all(hasattr(t, 'cthunk')
+                   for t, n in zip(f.fn.thunks, f.fn.nodes)
+                   if isinstance(n.op, AddConstant))
+        assert np.allclose(f(1.), expected)
+        assert np.allclose(f(1.), expected)
+        if use_cloop:
+            # The CVM was rebuilt with the C thunks.
+            assert isinstance(f.fn.vm, vm.CVM)
+            assert f.fn.vm is not first_vm
+        assert np.allclose(s.get_value(), 3 * expected)
+
+
+def test_parallel():
+    x = tensor.matrix('x')
+    c = tensor.scalar('c')
+    w = theano.shared(np.ones((4, 4), dtype=x.dtype), 'w')
+    towers = [tensor.tanh(tensor.dot(x, w) * i) for i in range(6)]
+    # The inplace add must wait for the sum of exp(x).
+    e = tensor.exp(x)
+    outputs = [ifelse(tensor.gt(c, 0), sum(towers), e + 1), e.sum()]
+    updates = [(w, w + 1)]
+    rng = np.random.RandomState(1)
+    x_val = rng.rand(3, 4).astype(x.dtype)
+    f_ref = function([x, c], outputs, updates=updates)
+    expected = [f_ref(x_val, c_val) for c_val in [1, -1, 1]]
+    for allow_gc in [True, False]:
+        w.set_value(np.ones((4, 4), dtype=x.dtype))
+        linker = vm.VM_Linker(allow_gc=allow_gc, parallel_workers=4)
+        f = function([x, c], outputs, updates=updates,
+                     mode=Mode(linker=linker))
+        assert isinstance(f.fn, vm.Parallel)
+        for c_val, exp in zip([1, -1, 1], expected):
+            for r, e in zip(f(x_val, c_val), exp):
+                utt.assert_allclose(r, e)
+        if allow_gc:
+            assert all(s[0] is None for v, s in iteritems(f.fn.storage_map)
+                       if v.owner and v not in f.maker.fgraph.outputs)
+
+    f = function([x], tensor.dot(x, x), mode=Mode(linker=linker))
+    try:
+        f(x_val)
+        assert False
+    except ValueError as e:
+        assert 'Apply node that caused the error' in str(e)
+
+
+def test_release_gil():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    from theano.tensor.signal.pool import pool_2d
+    from theano.tensor.nnet import conv2d
+
+    def max_pause(f, *args):
+        # The longest time another thread could not run during a call.
+        f(*args)
+        stamps = []
+        running = [True]
+
+        def count():
+            while running[0]:
+                stamps.append(time.time())
+        thread = threading.Thread(target=count)
+        thread.start()
+        time.sleep(0.01)
+        t0 = time.time()
+        f(*args)
+        t1 = time.time()
+        running[0] = False
+        thread.join()
+        stamps = [t0] + [t for t in stamps if t0 < t < t1] + [t1]
+        return (max(b - a for a, b in zip(stamps[:-1], stamps[1:])),
+                t1 - t0)
+
+    x = tensor.tensor4('x')
+    rng = np.random.RandomState(1)
+    f = function([x], pool_2d(x, (8, 8), ignore_border=True, stride=(1, 1)),
+                 mode='FAST_RUN')
+    pause, duration = max_pause(
+        f, rng.rand(16, 8, 128, 128).astype(x.dtype))
+    assert pause < duration / 2, (pause, duration)
+
+    if theano.config.blas.ldflags:
+        w = tensor.tensor4('w')
+        f = function([x, w], conv2d(x, w), mode='FAST_RUN')
+        assert any(isinstance(node.op, tensor.nnet.corr.CorrMM)
+                   for node in f.maker.fgraph.toposort())
+        pause, duration = max_pause(
+            f, rng.rand(8, 64, 64, 64).astype(x.dtype),
+            rng.rand(32, 64, 3, 3).astype(x.dtype))
+        assert pause < duration / 2, (pause, duration)
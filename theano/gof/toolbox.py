@@ -2,10 +2,13 @@ from __future__ import absolute_import, print_function, division
 from functools import partial
 from collections import OrderedDict
 
+import bisect
 import sys
 import time
 import inspect
 
+from six import iteritems
+
 import theano
 from theano import config
 from theano.gof import graph
@@ -483,6 +486,217 @@ class NodeFinder(Bookkeeper):
         return all
 
 
+class IncrementalToposort(Feature):
+    """
+    Maintain a topological order of the nodes of the graph as they are
+    imported, pruned and rewired, so that FunctionGraph.toposort() does not
+    sort the whole graph each time it is called.
+
+    Each node has a label and the order is given by the labels. A new node
+    gets a label between the one of its last input and the next one, as it
+    has no client yet. When a node starts depending on a node with a larger
+    label, through a change of input or an ordering asked by another
+    feature, only the labels of the nodes between the two are exchanged
+    (Pearce and Kelly, "A dynamic topological sort algorithm for directed
+    acyclic graphs", 2006). If the change makes a cycle, as can happen
+    while a replacement is being validated, the labels are dropped and the
+    next call to toposort() sorts the whole graph.
+
+    """
+
+    def __init__(self):
+        self.fgraph = None
+        # node -> label. None when the order must be recomputed.
+        self.labels = None
+        # All the labels, sorted.
+        self.sorted_labels = None
+        # The nodes sorted by label, or None when not computed yet.
+        self.order = None
+
+    def on_attach(self, fgraph):
+        if hasattr(fgraph, 'incremental_toposort'):
+            raise AlreadyThere("IncrementalToposort is already present")
+        if self.fgraph is not None:
+            raise Exception("An IncrementalToposort instance can only serve"
+                            " one FunctionGraph.")
+        self.fgraph = fgraph
+        self.reset()
+        fgraph.incremental_toposort = self
+
+    def on_detach(self, fgraph):
+        self.fgraph = None
+        self.reset()
+        del fgraph.incremental_toposort
+
+    def reset(self):
+        """
+        Forget the order, the next call to toposort() sorts the whole graph.
+
+        """
+        self.labels = None
+        self.sorted_labels = None
+        self.order = None
+
+    def set_order(self, order):
+        self.labels = dict((node, float(i)) for i, node in enumerate(order))
+        self.sorted_labels = [float(i) for i in range(len(order))]
+        self.order = list(order)
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d['labels'] = None
+        d['sorted_labels'] = None
+        d['order'] = None
+        return d
+
+    def on_import(self, fgraph, node, reason):
+        if self.labels is None:
+            return
+        labels = self.labels
+        sorted_labels = self.sorted_labels
+        preds = [labels[inp.owner] for inp in node.inputs
+                 if inp.owner is not None]
+        if preds:
+            after = max(preds)
+            idx = bisect.bisect_right(sorted_labels, after)
+        else:
+            idx = 0
+            after = sorted_labels[0] - 2 if sorted_labels else -1.
+        if idx < len(sorted_labels):
+            label = (after + sorted_labels[idx]) / 2
+            if not after < label < sorted_labels[idx]:
+                # No float left between the two labels.
+                self.set_order(sorted(labels, key=labels.__getitem__))
+                return self.on_import(fgraph, node, reason)
+        else:
+            label = after + 1
+        labels[node] = label
+        sorted_labels.insert(idx, label)
+        self.order = None
+
+    def on_prune(self, fgraph, node, reason):
+        if self.labels is None:
+            return
+        label = self.labels.pop(node)
+        del self.sorted_labels[bisect.bisect_left(self.sorted_labels, label)]
+        self.order = None
+
+    def on_change_input(self, fgraph, node, i, r, new_r, reason=None):
+        if (self.labels is None or node == 'output' or
+                new_r.owner is None):
+            return
+        if not self.add_edge(new_r.owner, node):
+            self.reset()
+
+    def add_edge(self, before, after, orderings=None, clients=None):
+        """
+        Update the labels so that `before` comes before `after`.
+
+        `orderings` and `clients` are the extra dependencies asked by the
+        features, in both directions. Return False if `after` is a
+        predecessor of `before`, in which case the labels are left
+        unchanged.
+
+        """
+        labels = self.labels
+        lower = labels[after]
+        upper = labels[before]
+        if upper < lower:
+            return True
+        if before is after:
+            return False
+
+        # The nodes that must move after `before`: `after` and the nodes
+        # that depend on it, with a label between the two. Restricting the
+        # search to these labels keeps the other dependencies satisfied,
+        # even the ones that are not yet when several orderings are added.
+        forward = [after]
+        seen = set(forward)
+        i = 0
+        while i < len(forward):
+            node = forward[i]
+            i += 1
+            succs = [c for out in node.outputs for c, _ in out.clients
+                     if c != 'output']
+            if clients:
+                succs.extend(clients.get(node, ()))
+            for succ in succs:
+                if succ is before:
+                    return False
+                if succ not in seen and lower < labels[succ] < upper:
+                    seen.add(succ)
+                    forward.append(succ)
+
+        # The nodes that must move before `after`: `before` and the nodes
+        # it depends on, with a label between the two.
+        backward = [before]
+        seen = set(backward)
+        i = 0
+        while i < len(backward):
+            node = backward[i]
+            i += 1
+            preds = [inp.owner for inp in node.inputs
+                     if inp.owner is not None]
+            if orderings:
+                preds.extend(orderings.get(node, ()))
+            for pred in preds:
+                if pred not in seen and lower < labels[pred] < upper:
+                    seen.add(pred)
+                    backward.append(pred)
+
+        forward.sort(key=labels.__getitem__)
+        backward.sort(key=labels.__getitem__)
+        nodes = backward + forward
+        for node, label in zip(nodes, sorted(labels[n] for n in nodes)):
+            labels[node] = label
+        self.order = None
+        return True
+
+    def add_orderings(self, fgraph, orderings):
+        """
+        Update the order so that it also respects `orderings`.
+
+        The orderings that the order already respects only cost a lookup.
+        Return False if the orderings make a cycle.
+
+        """
+        if self.labels is None:
+            try:
+                order = graph.io_toposort(fgraph.inputs, fgraph.outputs,
+                                          orderings)
+            except ValueError:
+                return False
+            self.set_order(order)
+            return True
+
+        labels = self.labels
+        clients = None
+        for node, prereqs in iteritems(orderings):
+            for prereq in prereqs:
+                if labels[prereq] < labels[node]:
+                    continue
+                if clients is None:
+                    clients = OrderedDict()
+                    for n, p in iteritems(orderings):
+                        for prereq_ in p:
+                            clients.setdefault(prereq_, []).append(n)
+                if not self.add_edge(prereq, node, orderings, clients):
+                    return False
+        return True
+
+    def toposort(self, fgraph, orderings):
+        """
+        Return the nodes of the graph in an order that respects their
+        inputs and `orderings`, as FunctionGraph.toposort().
+
+        """
+        if not self.add_orderings(fgraph, orderings):
+            raise ValueError('graph contains cycles')
+        if self.order is None:
+            self.order = sorted(self.labels, key=self.labels.__getitem__)
+        return list(self.order)
+
+
 class PrintListener(Feature):
 
     def __init__(self, active=True):
@@ -69,6 +69,10 @@ def simple_extract_stack(f=None, limit=None, skips=[]):
     return trace
 
 
+# Tuple of stack levels -> the list stored in tag.trace.
+_interned_traces = {}
+
+
 def add_tag_trace(thing, user_line=None):
     """
     Add tag.trace to an node or variable.
@@ -85,7 +89,10 @@ def add_tag_trace(thing, user_line=None):
     Notes
     -----
     We alse use config.traceback.limit for the maximum number of stack level
-    we look.
+    we look. Setting it to 0, for example with
+    ``change_flags(**{'traceback.limit': 0})`` while building a very large
+    graph, disables the traces. Identical traces are shared by the
+    variables and nodes that have them.
 
     """
     if user_line is None:
@@ -105,13 +112,27 @@ def add_tag_trace(thing, user_line=None):
     if config.traceback.compile_limit > 0:
         skips = []
 
+    if user_line == 0:
+        # The traces are disabled: don't look at the stack, and don't add
+        # an empty list to each variable. The users of tag.trace handle
+        # its absence.
+        return thing
+
     tr = simple_extract_stack(limit=user_line, skips=skips)
     # Different python version use different sementic for
     # limit. python 2.7 include the call to extrack_stack. The -1 get
     # rid of it.
 
     if tr:
-        thing.tag.trace = [tr]
+        # Graphs built in a loop have many identical traces: share them.
+        # The traces are never modified inplace.
+        key = tuple(tr)
+        trace = _interned_traces.get(key)
+        if trace is None:
+            if len(_interned_traces) >= 100000:
+                _interned_traces.clear()
+            trace = _interned_traces[key] = [tr]
+        thing.tag.trace = trace
     else:
         thing.tag.trace = tr
     return thing
@@ -226,6 +247,13 @@ class scratchpad(object):
         self.__dict__.update(other.__dict__)
         return self
 
+    def __copy__(self):
+        # The same as the default copy, without the __reduce_ex__ protocol.
+        # Each Variable and Apply node copies its tag when it is cloned.
+        cp = self.__class__.__new__(self.__class__)
+        cp.__dict__.update(self.__dict__)
+        return cp
+
     def __str__(self):
         return "scratchpad" + str(self.__dict__)
 
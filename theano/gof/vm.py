@@ -11,15 +11,19 @@ from . import link
 from collections import defaultdict
 import logging
 import sys
+import threading
 import time
 import warnings
 
+import numpy as np
+
 from theano.configparser import (config, _config_var_list)
+from theano.compat import get_unbound_function
 
 import theano.gof.cmodule
 
 from six import iteritems, itervalues
-from six.moves import xrange
+from six.moves import queue, xrange
 
 logger = logging.getLogger(__name__)
 
@@ -113,6 +117,222 @@ def calculate_reallocate_info(order, fgraph, storage_map, compute_map_re,
     return reallocated_info
 
 
+def calculate_memory_plan(order, fgraph, no_recycling):
+    """
+    Return the live interval of the intermediate results of a graph
+    executed in a given order, for the variables whose storage can be placed
+    in a MemoryArena.
+
+    Parameters
+    ----------
+    order
+        The list of nodes of `fgraph`, in execution order.
+    fgraph
+        The FunctionGraph.
+    no_recycling
+        Variables whose storage is cleared before each call.
+
+    Returns
+    -------
+    dict
+        A map from variable to (start, end), the positions in `order` of the
+        node that computes it and of its last user.  A variable viewed or
+        destroyed by other variables stays alive until their last user.
+        Only tensors computed by a node whose memory doesn't end up in an
+        output of the graph or in no_recycling are kept.
+
+    """
+    roots_of = {}
+    intervals = {}
+    for idx, node in enumerate(order):
+        for i in node.inputs:
+            for root in roots_of.get(i, [i]):
+                if root in intervals:
+                    intervals[root][1] = idx
+        dmap = getattr(node.op, 'destroy_map', {})
+        vmap = getattr(node.op, 'view_map', {})
+        for idx_o, out in enumerate(node.outputs):
+            aliased = dmap.get(idx_o, []) + vmap.get(idx_o, [])
+            if aliased:
+                roots_of[out] = []
+                for ins in aliased:
+                    roots_of[out].extend(roots_of.get(node.inputs[ins],
+                                                      [node.inputs[ins]]))
+            elif isinstance(out.type, theano.tensor.TensorType):
+                intervals[out] = [idx, idx]
+
+    for var in list(fgraph.outputs) + list(no_recycling):
+        for root in roots_of.get(var, [var]):
+            intervals.pop(root, None)
+    return dict((var, tuple(interval))
+                for var, interval in iteritems(intervals))
+
+
+def pack_intervals(intervals, sizes, order=None):
+    """
+    Place blocks of memory with a live interval in one buffer, so that the
+    blocks that are alive at the same time don't overlap.
+
+    The blocks are placed by decreasing size, each in the smallest gap left
+    between the blocks already placed whose live intervals intersect its
+    own, or after them if none is big enough.
+
+    Parameters
+    ----------
+    intervals
+        A dict from key to (start, end).  The bounds are inclusive.
+    sizes
+        A dict from key to size.
+    order
+        The keys to place, in the order used to break ties of size.  By
+        default, the keys of `sizes` sorted by interval.
+
+    Returns
+    -------
+    (dict, int)
+        The offset of each key and the size of the buffer.
+
+    """
+    if order is None:
+        order = sorted(sizes, key=lambda k: intervals[k])
+    rank = dict((k, i) for i, k in enumerate(order))
+    placed = []
+    offsets = {}
+    for key in sorted(order, key=lambda k: (-sizes[k], rank[k])):
+        start, end = intervals[key]
+        size = sizes[key]
+        best = None
+        prev_end = 0
+        for offset, other_size in sorted(
+                (o, sz) for o, sz, st, en in placed
+                if st <= end and start <= en):
+            gap = offset - prev_end
+            if gap >= size and (best is None or gap < best[1]):
+                best = (prev_end, gap)
+            prev_end = max(prev_end, offset + other_size)
+        if best is None:
+            offsets[key] = prev_end
+        else:
+            offsets[key] = best[0]
+        placed.append((offsets[key], size, start, end))
+    total = max([o + sz for o, sz, st, en in placed] + [0])
+    return offsets, total
+
+
+class MemoryArena(object):
+    """
+    Storage of the intermediate results of a Loop or LoopGC VM in one buffer.
+
+    On the first call, the VM runs through `first_call`, which records the
+    shape and dtype of each planned variable just after it is computed.
+    The variables are then packed in one buffer according to their live
+    intervals (see `pack_intervals`), and before each following call `seed`
+    puts in the storage of each variable a view of its part of the buffer.
+    The ops that reuse their output storage when it has the right shape then
+    write directly into the buffer, instead of allocating new memory.  If a
+    variable changes shape later, its op allocates a new array as usual.
+
+    Parameters
+    ----------
+    nodes
+        The nodes of the VM, in execution order.
+    intervals
+        The live intervals returned by `calculate_memory_plan`.
+    storage_map
+        The storage map of the VM.
+
+    Attributes
+    ----------
+    nbytes
+        The size of the buffer, None before the first call.
+    unpacked_nbytes
+        The sum of the sizes of the variables in the buffer, that is the
+        memory they would use without the plan and without garbage
+        collection.
+
+    """
+    alignment = 64
+
+    def __init__(self, nodes, intervals, storage_map):
+        self.intervals = intervals
+        self.outputs_of_node = [[(var, storage_map[var])
+                                 for var in node.outputs if var in intervals]
+                                for node in nodes]
+        self.seeds = None
+        self.buffer = None
+        self.nbytes = None
+        self.unpacked_nbytes = None
+
+    def first_call(self, vm):
+        """
+        Run `vm` while recording the shape of the planned variables, then
+        allocate the buffer.
+
+        """
+        post_thunk_clear = getattr(vm, 'post_thunk_clear', None)
+        if post_thunk_clear is None:
+            post_thunk_clear = [[]] * len(vm.nodes)
+        shapes = {}
+        for cont in vm.pre_call_clear:
+            cont[0] = None
+        try:
+            for i, (thunk, node, old_storage, outputs) in enumerate(zip(
+                    vm.thunks, vm.nodes, post_thunk_clear,
+                    self.outputs_of_node)):
+                t0 = time.time()
+                thunk()
+                t1 = time.time()
+                if vm.time_thunks:
+                    vm.call_counts[i] += 1
+                    vm.call_times[i] += t1 - t0
+                for var, storage in outputs:
+                    if isinstance(storage[0], np.ndarray):
+                        shapes[var] = (storage[0].shape, storage[0].dtype)
+                for old_s in old_storage:
+                    old_s[0] = None
+        except:
+            link.raise_with_op(node, thunk)
+        self.allocate(shapes)
+
+    def allocate(self, shapes):
+        """
+        Allocate the buffer for variables of the given shapes and dtypes.
+
+        """
+        order = []
+        sizes = {}
+        storage = {}
+        for outputs in self.outputs_of_node:
+            for var, s in outputs:
+                if var in shapes:
+                    shape, dtype = shapes[var]
+                    nbytes = int(np.prod(shape)) * dtype.itemsize
+                    if nbytes > 0:
+                        order.append(var)
+                        storage[var] = s
+                        sizes[var] = -(-nbytes // self.alignment) * \
+                            self.alignment
+        offsets, total = pack_intervals(self.intervals, sizes, order)
+        self.buffer = np.empty(total, dtype='uint8')
+        self.seeds = []
+        for var in order:
+            shape, dtype = shapes[var]
+            offset = offsets[var]
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            view = self.buffer[offset:offset + nbytes].view(dtype)
+            self.seeds.append((storage[var], view.reshape(shape)))
+        self.nbytes = total
+        self.unpacked_nbytes = sum(sizes.values())
+
+    def seed(self):
+        """
+        Put in the storage of each planned variable its view of the buffer.
+
+        """
+        for storage, view in self.seeds:
+            storage[0] = view
+
+
 class VM(object):
     """
     A VM object's __call__ method evaluates a Theano program.
@@ -150,8 +370,12 @@ class VM(object):
         True indicates that Function.__call__ must implement the feedback from
         output storage to input storage. False means it *must not* repeat that
         feedback.
+    arena
+        A MemoryArena for the intermediate results, or None.  Only used by
+        Loop and LoopGC.
 
     """
+    arena = None
 
     def __init__(self, nodes, thunks, pre_call_clear):
 
@@ -233,6 +457,10 @@ class Loop(VM):
     allow_gc = False
 
     def __call__(self):
+        if self.arena is not None:
+            if self.arena.seeds is None:
+                return self.arena.first_call(self)
+            self.arena.seed()
         if self.time_thunks:
             for cont in self.pre_call_clear:
                 cont[0] = None
@@ -272,6 +500,10 @@ class LoopGC(VM):
             raise ValueError()
 
     def __call__(self):
+        if self.arena is not None:
+            if self.arena.seeds is None:
+                return self.arena.first_call(self)
+            self.arena.seed()
         if self.time_thunks:
             for cont in self.pre_call_clear:
                 cont[0] = None
@@ -411,6 +643,8 @@ class Stack(VM):
         self.node_executed_order = []
         self.node_cleared_order = []
 
+        for cont in self.pre_call_clear:
+            cont[0] = None
         for k in self.storage_map:
             compute_map[k][0] = (k.owner is None)
             if self.callback_input and compute_map[k][0]:
@@ -654,6 +888,202 @@ class Stack(VM):
         self.node_cleared_order.append(final_index)
 
 
+def _parallel_worker(tasks, done):
+    """
+    Run the thunks put in `tasks` until it gets None.
+
+    The index of each thunk, its return value, the exception info if it
+    failed and its run time are put in `done`.
+
+    """
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        idx, thunk = task
+        t0 = time.time()
+        try:
+            rval = thunk()
+            exc_info = None
+        except Exception:
+            rval = None
+            exc_info = sys.exc_info()
+        done.put((idx, rval, exc_info, time.time() - t0))
+
+
+class Parallel(VM):
+    """
+    Execution of the thunks of independent nodes on a pool of threads.
+
+    Like the Stack, this VM starts from the outputs and only runs the nodes
+    they need. A node is run as soon as the variables it needs have been
+    computed: its inputs and the outputs of the nodes that must run before
+    it according to fgraph.orderings(), for instance the nodes that read an
+    input that it destroys. A lazy node is first run when those orderings
+    are satisfied, then run again each time the inputs it requires have
+    been computed.
+
+    The scheduling happens in the calling thread, which gives the ready
+    thunks to `n_workers` worker threads. The threads only run at the same
+    time while the thunks release the GIL. NumPy does it in most of its
+    functions. The C code of Gemm, Dot22, CorrMM and Corr3dMM does it
+    around its loops when Theano is linked to a BLAS library, and the C
+    code of the pooling Ops around its loops. The C code of the other Ops,
+    like Elemwise, keeps the GIL, so graphs dominated by them are not
+    faster. The CVM runs its thunks in one thread, so it is not used with
+    several workers. The Ops of the graph must not modify shared state in
+    their thunks.
+
+    Parameters
+    ----------
+    n_workers
+        The number of worker threads. They are started on the first call.
+
+    """
+
+    def __init__(self, nodes, thunks, pre_call_clear,
+                 storage_map, compute_map, fgraph, allow_gc,
+                 n_workers, dependencies=None):
+        super(Parallel, self).__init__(nodes, thunks, pre_call_clear)
+        self.allow_gc = allow_gc
+        self.storage_map = storage_map
+        self.compute_map = compute_map
+        self.outputs = fgraph.outputs
+        self.output_set = set(fgraph.outputs)
+        self.n_workers = n_workers
+        self.node_idx = dict((node, i) for i, node in enumerate(nodes))
+        self.dependencies = dependencies
+        if self.allow_gc and self.dependencies is None:
+            raise ValueError("Must set dependencies when using GC")
+
+        # prereqs[i] are the variables that nodes[i] needs besides its
+        # inputs.
+        ords = fgraph.orderings()
+        self.prereqs = []
+        for node in nodes:
+            prereqs = []
+            for prereq in ords.get(node, []):
+                prereqs.extend(prereq.outputs)
+            self.prereqs.append(prereqs)
+        self.tasks = None
+        self.done = None
+
+    def start_workers(self):
+        self.tasks = queue.Queue()
+        self.done = queue.Queue()
+        for i in xrange(self.n_workers):
+            # The workers only reference the queues, so that the VM can be
+            # freed, which stops them.
+            worker = threading.Thread(target=_parallel_worker,
+                                      args=(self.tasks, self.done))
+            worker.daemon = True
+            worker.start()
+
+    def __del__(self):
+        if self.tasks is not None:
+            for i in xrange(self.n_workers):
+                self.tasks.put(None)
+
+    def __call__(self):
+        if self.tasks is None:
+            self.start_workers()
+        storage_map = self.storage_map
+        compute_map = self.compute_map
+        thunks = self.thunks
+        node_idx = self.node_idx
+        for cont in self.pre_call_clear:
+            cont[0] = None
+        for k in storage_map:
+            compute_map[k][0] = (k.owner is None)
+
+        # waiters[var] are the indices of the nodes waiting for var.
+        waiters = defaultdict(list)
+        # n_missing[i] is the number of variables nodes[i] waits for.
+        n_missing = {}
+        ready = []
+
+        def wait_for(idx, variables, stack):
+            # Make nodes[idx] wait for the missing variables, and put
+            # their owners on stack.
+            missing = set(v for v in variables if not compute_map[v][0])
+            n_missing[idx] = len(missing)
+            if not missing:
+                ready.append(idx)
+            for v in missing:
+                waiters[v].append(idx)
+                stack.append(v.owner)
+
+        def demand(stack):
+            # Iterative, the graph can be deeper than the recursion limit.
+            while stack:
+                idx = node_idx[stack.pop()]
+                if idx in n_missing:
+                    continue
+                variables = self.prereqs[idx]
+                if not thunks[idx].lazy:
+                    variables = variables + self.nodes[idx].inputs
+                wait_for(idx, variables, stack)
+
+        demand([o.owner for o in self.outputs if o.owner is not None])
+
+        n_running = 0
+        failed = None
+        while ready or n_running:
+            if failed is None:
+                for idx in ready:
+                    self.tasks.put((idx, thunks[idx]))
+                n_running += len(ready)
+            del ready[:]
+            idx, requires, exc_info, dt = self.done.get()
+            n_running -= 1
+            if exc_info is not None:
+                # Wait for the running thunks before raising.
+                if failed is None:
+                    failed = idx, exc_info
+                continue
+            if failed is not None:
+                continue
+            if self.time_thunks:
+                self.call_counts[idx] += 1
+                self.call_times[idx] += dt
+            node = self.nodes[idx]
+            if requires:
+                # A lazy node needs more of its inputs.
+                stack = []
+                wait_for(idx, [node.inputs[r] for r in requires], stack)
+                demand(stack)
+                continue
+            for o in node.outputs:
+                compute_map[o][0] = 1
+                for waiter in waiters.pop(o, ()):
+                    n_missing[waiter] -= 1
+                    if n_missing[waiter] == 0:
+                        ready.append(waiter)
+            if self.allow_gc:
+                for i in node.inputs:
+                    if (self.dependencies[i] and i.owner and
+                            i not in self.output_set and
+                            compute_map[i][0] == 1 and
+                            all(compute_map[v][0]
+                                for v in self.dependencies[i])):
+                        storage_map[i][0] = None
+                        # Like in the Stack, 2 means computed then freed.
+                        compute_map[i][0] = 2
+
+        if failed is not None:
+            idx, exc_info = failed
+            link.raise_with_op(self.nodes[idx], thunks[idx], exc_info,
+                               storage_map=storage_map)
+
+        if self.allow_gc:
+            # The intermediate results that were not freed, like the
+            # inputs of the lazy nodes that were not needed.
+            for v in storage_map:
+                if v.owner and v not in self.output_set:
+                    storage_map[v][0] = None
+                    compute_map[v][0] = 2
+
+
 try:
     # If cxx is explicitely set to an empty string, we do not want to import neither lazylinker C code
     # nor lazylinker compiled C code from cache.
@@ -666,6 +1096,12 @@ try:
         def __init__(self, *args, **kwargs):
             lazylinker_c.CLazyLinker.__init__(self, *args, **kwargs)
             # skip VM.__init__
+
+        def update_profile(self, profile):
+            # The C code accumulates the thunk timings in its own arrays,
+            # they are only added to call_times and call_counts here.
+            self.flush_timers()
+            VM.update_profile(self, profile)
 except ImportError:
     pass
 except (OSError, theano.gof.cmodule.MissingGXX) as e:
@@ -678,6 +1114,85 @@ except (OSError, theano.gof.cmodule.MissingGXX) as e:
     pass
 
 
+class HotSwapVM(object):
+    """
+    A VM whose Python thunks are replaced by C thunks as their C modules are
+    compiled in a background thread.
+
+    See the `background_compile` parameter of VM_Linker. Each C thunk
+    replaces the Python one in the thunk list of the wrapped VM, that all
+    the VMs read at each call. But the CVM only calls directly the C
+    thunks it had when it was built, so when all the thunks are compiled, a
+    new CVM is built and used from the next call on.
+
+    The other attributes are those of the wrapped VM.
+
+    Parameters
+    ----------
+    vm
+        The VM to wrap.
+    pending
+        The indices of the thunks of `vm` that will be compiled.
+
+    """
+
+    def __init__(self, vm, pending):
+        self.__dict__.update(vm=vm, pending=set(pending), failed=set(),
+                             new_vm=None, thread=None, old_vms=[])
+
+    def __call__(self, *args, **kwargs):
+        if self.new_vm is not None:
+            # Only swap VMs between calls, as Function looks at the VM
+            # after the call.
+            self.new_vm.time_thunks = self.vm.time_thunks
+            # Keep the old VM until the profile reads its timings.
+            self.old_vms.append(self.vm)
+            self.__dict__.update(vm=self.new_vm, new_vm=None)
+        return self.vm(*args, **kwargs)
+
+    def update_profile(self, profile):
+        for vm in self.old_vms:
+            vm.update_profile(profile)
+        del self.old_vms[:]
+        self.vm.update_profile(profile)
+
+    def __getattr__(self, name):
+        return getattr(self.vm, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.vm, name, value)
+
+    def status(self):
+        """
+        Return the state of the background compilation.
+
+        Returns
+        -------
+        dict
+            'python' is the number of nodes that still run their Python
+            implementation, 'pending' the number of them still waiting for
+            their C thunk (the others failed to compile) and 'done' is True
+            once the compilation thread finished.
+
+        """
+        return dict(python=len(self.pending) + len(self.failed),
+                    pending=len(self.pending),
+                    done=not self.thread.is_alive())
+
+    def wait(self, timeout=None):
+        """
+        Wait until the compilation thread finished, or `timeout` seconds.
+
+        Returns
+        -------
+        bool
+            True if the compilation thread finished.
+
+        """
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+
 class VM_Linker(link.LocalLinker):
     """
     Class that satisfies the Linker interface by acting as a VM factory.
@@ -712,12 +1227,38 @@ class VM_Linker(link.LocalLinker):
     allow_partial_eval
         If True, enforces usage of Stack or CVM, to allow for partial
         evaluation of functions (calculating a subset of outputs).
+    background_compile
+        If True, the nodes whose C module is not in the cache start with
+        their Python implementation, and their C modules are compiled in a
+        background thread. The VM is then a HotSwapVM, whose status() tells
+        how many nodes still run in Python. If None, use the Theano flag
+        vm.background_compile.
+    memory_plan
+        If True, the intermediate results are placed in one buffer whose
+        layout is planned from their live intervals and the shapes seen on
+        the first call (see MemoryArena). Only used by the Loop and LoopGC
+        VMs, that is without use_cloop, lazy evaluation, callbacks or memory
+        profiling. If None, use the Theano flag vm.memory_plan.
+    parallel_workers
+        If larger than 1, use the Parallel VM, which runs the thunks of
+        independent nodes on that many threads, unless callbacks, memory
+        profiling or partial evaluation need the Stack VM. If None, use the
+        Theano flag vm.parallel_workers.
+    reuse_outputs
+        If True, the thunks may write the outputs of the graph into the
+        arrays already in their storage, so that Function.__call__ computes
+        them directly into the arrays of its output_storage argument.
+        Otherwise they are copied into those arrays after the call. The C
+        code of the nodes that compute outputs differs, so they are compiled
+        again. If None, use the Theano flag vm.reuse_outputs.
 
     """
 
     def __init__(self, allow_gc=None, use_cloop=False, callback=None,
                  callback_input=None, lazy=None, schedule=None,
-                 c_thunks=None, allow_partial_eval=None):
+                 c_thunks=None, allow_partial_eval=None,
+                 background_compile=None, memory_plan=None,
+                 parallel_workers=None, reuse_outputs=None):
         # Note: if more parameters are added to __init__, make sure to forward
         # them in the "type(self)(...)" call in the "accept" method below.
         if allow_gc is None:
@@ -732,6 +1273,18 @@ class VM_Linker(link.LocalLinker):
             c_thunks = bool(theano.config.cxx)
         self.c_thunks = c_thunks
         self.allow_partial_eval = allow_partial_eval
+        if background_compile is None:
+            background_compile = config.vm.background_compile
+        self.background_compile = background_compile
+        if memory_plan is None:
+            memory_plan = config.vm.memory_plan
+        self.memory_plan = memory_plan
+        if parallel_workers is None:
+            parallel_workers = config.vm.parallel_workers
+        self.parallel_workers = parallel_workers
+        if reuse_outputs is None:
+            reuse_outputs = config.vm.reuse_outputs
+        self.reuse_outputs = reuse_outputs
         self.updated_vars = {}
         if schedule:
             self.schedule = schedule
@@ -770,14 +1323,35 @@ class VM_Linker(link.LocalLinker):
                 lazy=self.lazy,
                 schedule=self.schedule,
                 c_thunks=self.c_thunks,
-                allow_partial_eval=self.allow_partial_eval
+                allow_partial_eval=self.allow_partial_eval,
+                background_compile=self.background_compile,
+                memory_plan=self.memory_plan,
+                parallel_workers=self.parallel_workers,
+                reuse_outputs=self.reuse_outputs
             ).accept(fgraph, no_recycling, profile)
         self.fgraph = fgraph
         self.no_recycling = no_recycling
         self.profile = profile
+        # node -> thunk made by the first call to make_all
+        self.linked_thunks = {}
 
         return self
 
+    def thunk_no_recycling(self):
+        """
+        Return the variables whose storage the thunks must not reuse.
+
+        With reuse_outputs, the outputs of the graph are left out: the VMs
+        empty their storage before each call anyway (see pre_call_clear),
+        unless Function.__call__ puts there for one call the arrays given in
+        its output_storage argument, which the thunks can then write into.
+
+        """
+        if not self.reuse_outputs:
+            return self.no_recycling
+        outputs = set(self.fgraph.outputs)
+        return set(v for v in self.no_recycling if v not in outputs)
+
     def accept_var_updates(self, updated_vars):
         self.updated_vars = updated_vars
         # This method simply records in the linker which variables have update
@@ -863,6 +1437,16 @@ class VM_Linker(link.LocalLinker):
                 dependencies=deps,
                 callback=self.callback,
                 callback_input=self.callback_input)
+        elif self.parallel_workers > 1:
+            deps = None
+            if self.allow_gc:
+                deps = self.compute_gc_dependencies(storage_map)
+            vm = Parallel(
+                nodes, thunks, pre_call_clear,
+                storage_map, compute_map,
+                self.fgraph, self.allow_gc,
+                self.parallel_workers,
+                dependencies=deps)
         elif self.use_cloop:
             # create a map from nodes to ints and vars to ints
             nodes_idx = {}
@@ -1005,12 +1589,131 @@ class VM_Linker(link.LocalLinker):
                 )
         return vm
 
+    def precompile_c_modules(self, order, storage_map, compute_map):
+        """
+        Compile at the same time the C modules of `order` missing from the
+        cache.
+
+        Up to config.cmodule.compile_workers compilations run concurrently.
+        The thunks made afterwards find their module in the cache. Nodes
+        whose Op overrides make_thunk or has no C code are skipped, and so
+        are the modules whose compilation fails: the error will be raised
+        when the thunk of that node is made.
+
+        """
+        key_lnk_pairs = []
+        for node in order:
+            key_lnk = self.c_module_key(node, storage_map, compute_map)
+            if key_lnk is not None:
+                key_lnk_pairs.append(key_lnk)
+        theano.gof.cc.get_module_cache().modules_from_keys(key_lnk_pairs)
+
+    def c_module_key(self, node, storage_map, compute_map):
+        """
+        Return the (key, CLinker) pair of the C module of `node`, or None if
+        the node does not use the CLinker of Op.make_c_thunk.
+
+        """
+        op = node.op
+        default_make_thunk = get_unbound_function(theano.gof.Op.make_thunk)
+        if (not isinstance(op, theano.gof.Op) or
+                get_unbound_function(op.make_thunk) is not
+                default_make_thunk):
+            return None
+        # make_c_thunk refuses to run unprepared float16 C code.
+        if (not getattr(op, '_f16_ok', False) and
+                any(getattr(v.type, 'dtype', '') == 'float16'
+                    for v in node.inputs + node.outputs)):
+            return None
+        try:
+            op.prepare_node(node, storage_map=storage_map,
+                            compute_map=compute_map, impl='c')
+            cl = op.make_c_linker(node, self.thunk_no_recycling())
+            # As in CLinker.cthunk_factory
+            for n in cl.node_order:
+                n.op.prepare_node(n, None, None, 'c')
+            key = cl.cmodule_key()
+            cl.get_src_code()
+        except Exception as e:
+            logger.debug('No C module for %s: %s', node, e)
+            return None
+        return key, cl
+
+    def uncompiled_nodes(self, order, storage_map, compute_map):
+        """
+        Return the indices of the nodes of `order` whose C module is not in
+        the cache, and that have a Python implementation.
+
+        """
+        cache = theano.gof.cc.get_module_cache()
+        default_perform = get_unbound_function(theano.gof.Op.perform)
+        idxs = []
+        for i, node in enumerate(order):
+            if get_unbound_function(node.op.perform) is default_perform:
+                continue
+            key_lnk = self.c_module_key(node, storage_map, compute_map)
+            if key_lnk is not None and cache.cached_module(*key_lnk) is None:
+                idxs.append(i)
+        return idxs
+
+    def compile_in_background(self, vm, order, thunks, storage_map,
+                              compute_map, make_vm_args):
+        """
+        Start the thread that replaces the Python thunks of the HotSwapVM
+        `vm` by C thunks.
+
+        """
+        no_recycling = self.thunk_no_recycling()
+        rebuild = self.use_cloop and isinstance(vm.vm, CVM)
+
+        # Each compilation runs under the lock that serializes the threads
+        # that compile, so that the main thread can compile other functions
+        # between them.
+        thread_lock = theano.gof.compilelock.thread_lock
+
+        def run():
+            idxs = sorted(vm.pending)
+            if config.cmodule.compile_workers > 1:
+                with thread_lock:
+                    self.precompile_c_modules([order[i] for i in idxs],
+                                              storage_map, compute_map)
+            for i in idxs:
+                node = order[i]
+                try:
+                    with thread_lock:
+                        thunk = node.op.make_thunk(node, storage_map,
+                                                   compute_map, no_recycling,
+                                                   impl='c')
+                except Exception as e:
+                    logger.warning('Could not compile %s, it will keep its '
+                                   'Python implementation: %s', node, e)
+                    vm.failed.add(i)
+                else:
+                    thunk.inputs = [storage_map[v] for v in node.inputs]
+                    thunk.outputs = [storage_map[v] for v in node.outputs]
+                    if not hasattr(thunk, 'lazy'):
+                        thunk.lazy = False
+                    # Replacing an element of a list is atomic.
+                    thunks[i] = thunk
+                vm.pending.discard(i)
+            if rebuild:
+                new_vm = self.make_vm(*make_vm_args)
+                new_vm.storage_map = storage_map
+                new_vm.compute_map = compute_map
+                vm.__dict__['new_vm'] = new_vm
+
+        thread = threading.Thread(target=run, name='theano-compile')
+        thread.daemon = True
+        vm.__dict__['thread'] = thread
+        thread.start()
+
     def make_all(self, profiler=None, input_storage=None,
                  output_storage=None, storage_map=None,
                  ):
         fgraph = self.fgraph
         order = self.schedule(fgraph)
         no_recycling = self.no_recycling
+        thunk_no_recycling = self.thunk_no_recycling()
 
         input_storage, output_storage, storage_map = link.map_storage(
             fgraph, order, input_storage, output_storage, storage_map)
@@ -1037,14 +1740,27 @@ class VM_Linker(link.LocalLinker):
         impl = None
         if self.c_thunks is False:
             impl = 'py'
-        for node in order:
+        pending = []
+        if (impl is None and theano.config.cxx and
+                self.background_compile):
+            pending = set(self.uncompiled_nodes(order, storage_map,
+                                                compute_map))
+        elif (impl is None and theano.config.cxx and
+                config.cmodule.compile_workers > 1):
+            self.precompile_c_modules(order, storage_map, compute_map)
+        linked_thunks = getattr(self, 'linked_thunks', {})
+        for i, node in enumerate(order):
             try:
                 thunk_start = time.time()
-                thunks.append(node.op.make_thunk(node,
-                                                 storage_map,
-                                                 compute_map,
-                                                 no_recycling,
-                                                 impl=impl))
+                rebind = getattr(linked_thunks.get(node), 'rebind', None)
+                if rebind is not None:
+                    # Run the code compiled for a previous call on the new
+                    # storage, as FunctionMaker.create does for each copy.
+                    thunks.append(rebind(storage_map, compute_map))
+                else:
+                    thunks.append(node.op.make_thunk(
+                        node, storage_map, compute_map, thunk_no_recycling,
+                        impl=('py' if i in pending else impl)))
                 linker_make_thunk_time[node] = time.time() - thunk_start
                 if not hasattr(thunks[-1], 'lazy'):
                     # We don't want all ops maker to think about lazy Ops.
@@ -1057,6 +1773,9 @@ class VM_Linker(link.LocalLinker):
                 raise
         t1 = time.time()
 
+        if not linked_thunks:
+            self.linked_thunks = dict(zip(order, thunks))
+
         if self.profile:
             self.profile.linker_node_make_thunks += t1 - t0
             self.profile.linker_make_thunk_time = linker_make_thunk_time
@@ -1070,8 +1789,15 @@ class VM_Linker(link.LocalLinker):
             lazy = config.vm.lazy
         if lazy is None:
             lazy = not all([(not th.lazy) for th in thunks])
+        memory_plan = None
         if not (lazy or ((config.profile or config.print_global_stats) and config.profile_memory) or
-                self.use_cloop or self.callback or self.callback_input):
+                self.use_cloop or self.callback or self.callback_input or
+                self.parallel_workers > 1):
+            if self.memory_plan and not self.allow_partial_eval:
+                # The arena replaces the reuse of the storage of scalars.
+                memory_plan = calculate_memory_plan(order, fgraph,
+                                                    no_recycling)
+                reallocated_info = {}
             for pair in itervalues(reallocated_info):
                 storage_map[pair[1]] = storage_map[pair[0]]
 
@@ -1090,16 +1816,24 @@ class VM_Linker(link.LocalLinker):
         else:
             post_thunk_clear = None
 
-        vm = self.make_vm(order, thunks,
-                          input_storage, output_storage, storage_map,
-                          post_thunk_clear,
-                          computed,
-                          compute_map,
-                          self.updated_vars,
-                          )
+        make_vm_args = (order, thunks,
+                        input_storage, output_storage, storage_map,
+                        post_thunk_clear,
+                        computed,
+                        compute_map,
+                        self.updated_vars,
+                        )
+        vm = self.make_vm(*make_vm_args)
 
         vm.storage_map = storage_map
         vm.compute_map = compute_map
+        if memory_plan:
+            vm.arena = MemoryArena(order, memory_plan, storage_map)
+
+        if pending:
+            vm = HotSwapVM(vm, pending)
+            self.compile_in_background(vm, order, thunks, storage_map,
+                                       compute_map, make_vm_args)
 
         return (vm,
                 [link.Container(input, storage)
@@ -1117,3 +1851,11 @@ class VM_Linker(link.LocalLinker):
             self.allow_partial_eval = None
         if not hasattr(self, 'callback_input'):
             self.callback_input = None
+        if not hasattr(self, 'background_compile'):
+            self.background_compile = False
+        if not hasattr(self, 'memory_plan'):
+            self.memory_plan = False
+        if not hasattr(self, 'parallel_workers'):
+            self.parallel_workers = 1
+        if not hasattr(self, 'reuse_outputs'):
+            self.reuse_outputs = False
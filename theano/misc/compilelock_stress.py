@@ -0,0 +1,79 @@
+"""
+Measure the wall time needed by N processes that start at the same time
+and all compile C modules in the same, initially empty, compilation
+directory.
+
+Each process compiles different modules, so with the flag
+compile.per_module_lock=True they should not wait for each other.
+
+Usage: python compilelock_stress.py -N 8 -K 4
+
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+import theano
+from theano.gof.tests.test_cmodule import AddConstant
+
+parser = OptionParser(usage='%prog <options>\n Compute the time needed by'
+                      ' concurrent processes to compile their C modules')
+parser.add_option('-N', '--N', action='store', dest='N', default=4,
+                  type="int", help="Number of concurrent processes")
+parser.add_option('-K', '--K', action='store', dest='K', default=4,
+                  type="int", help="Number of modules compiled by each"
+                  " process")
+parser.add_option('--worker', action='store', dest='worker', default=None,
+                  type="int", help=("Internal: run as the worker with this"
+                                    " index"))
+
+
+def worker(idx, n_modules):
+    x = theano.tensor.dscalar()
+    out = x
+    for i in range(n_modules):
+        out = AddConstant(float(idx * n_modules + i))(out)
+    mode = theano.Mode(optimizer=None,
+                       linker=theano.gof.vm.VM_Linker(use_cloop=False))
+    theano.function([x], out, mode=mode)
+
+
+def run(n_processes, n_modules, per_module_lock):
+    compiledir = tempfile.mkdtemp(prefix='compilelock_stress_')
+    env = dict(os.environ)
+    env['THEANO_FLAGS'] = '%s,base_compiledir=%s,compile.per_module_lock=%s' % (
+        env.get('THEANO_FLAGS', ''), compiledir, per_module_lock)
+    try:
+        # Import theano once, so that the base modules (lazylinker, cutils,
+        # ...) are compiled outside of the timed part.
+        subprocess.check_call([sys.executable, '-c', 'import theano'],
+                              env=env)
+        t0 = time.time()
+        procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                   '--worker', str(i), '-K', str(n_modules)],
+                                  env=env)
+                 for i in range(n_processes)]
+        for p in procs:
+            if p.wait() != 0:
+                raise Exception('A worker failed')
+        return time.time() - t0
+    finally:
+        shutil.rmtree(compiledir)
+
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args(sys.argv)
+    if options.worker is not None:
+        worker(options.worker, options.K)
+        sys.exit(0)
+    global_time = run(options.N, options.K, False)
+    module_time = run(options.N, options.K, True)
+    print("%d processes compiling %d modules each" % (options.N, options.K))
+    print("Lock of the whole compiledir: %fs" % global_time)
+    print("Lock per module: %fs" % module_time)
+    print("Speedup: %2.2f" % (global_time / module_time))
@@ -0,0 +1,85 @@
+"""
+Compare the compilation time of big graphs with the two ways the
+DestroyHandler has to check that inplace operations do not make a cycle
+(flag cycle_detection).
+
+The graphs are a deep chain of Elemwise (compiled without the fusion
+optimization, so that each Elemwise is a candidate for the inplace
+optimization) and a scan whose inner graph is a deep recurrent net.
+
+Usage: python cycle_detection_speedup.py -N 200 --scan-layers 30
+
+"""
+from __future__ import absolute_import, print_function, division
+import time
+from optparse import OptionParser
+
+import theano
+import theano.tensor as T
+from theano.configparser import change_flags
+
+parser = OptionParser(usage='%prog <options>\n Compute the compilation time'
+                      ' of big graphs with the regular and the incremental'
+                      ' cycle detection')
+parser.add_option('-N', '--N', action='store', dest='N', default=200,
+                  type="int", help="The depth of the Elemwise chain")
+parser.add_option('--scan-layers', action='store', dest='scan_layers',
+                  default=30, type="int",
+                  help="The number of layers in the inner graph of scan")
+parser.add_option('-r', '--repeat', action='store', dest='repeat',
+                  default=3, type="int",
+                  help="Report the best time of that many compilations")
+
+
+def elemwise_chain(depth):
+    x = T.vector('x')
+    y = T.vector('y')
+    h = x
+    for i in range(depth):
+        h = T.tanh(h) * y + h
+    return [x, y], [h, h.sum()]
+
+
+def scan_graph(n_layers):
+    x = T.matrix('x')
+    W = T.matrix('W')
+    b = T.vector('b')
+
+    def step(x_t, h):
+        for i in range(n_layers):
+            h = T.nnet.sigmoid(T.dot(h, W) + x_t + b) * h + x_t
+        return h
+
+    h, _ = theano.scan(step, sequences=x, outputs_info=[T.zeros_like(b)])
+    cost = h[-1].sum()
+    return [x, W, b], [cost] + T.grad(cost, [W, b])
+
+
+def compile_time(inputs, outputs, mode):
+    t0 = time.time()
+    f = theano.function(inputs, outputs, mode=mode)
+    return (time.time() - t0,
+            [str(node.op) for node in f.maker.fgraph.toposort()])
+
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    graphs = [
+        ('Elemwise chain (%d)' % options.N, elemwise_chain(options.N),
+         theano.compile.get_mode('FAST_RUN').excluding('fusion')),
+        ('scan (%d layers)' % options.scan_layers,
+         scan_graph(options.scan_layers), 'FAST_RUN')]
+    print("%-24s %12s %16s %8s" % ('graph', 'regular(s)', 'incremental(s)',
+                                   'speedup'))
+    for name, (inputs, outputs), mode in graphs:
+        # Compile the C code once, so that it is not timed.
+        compile_time(inputs, outputs, mode)
+        results = []
+        for cycle_detection in ['regular', 'incremental']:
+            with change_flags(cycle_detection=cycle_detection):
+                results.append(min(compile_time(inputs, outputs, mode)
+                                   for i in range(options.repeat)))
+        (regular, topo), (incremental, inc_topo) = results
+        print("%-24s %12.3f %16.3f %8.2f%s" % (
+            name, regular, incremental, regular / incremental,
+            '' if topo == inc_topo else '  (different graphs)'))
@@ -0,0 +1,73 @@
+"""
+Measure the overhead of calling small compiled functions.
+
+For graphs of one to a few Elemwise nodes on tiny inputs, the time of a
+call is dominated by the work done in Python around the computation.
+This script prints the time per call of a Python loop over
+``Function.__call__``, of the same loop with ``trust_input=True`` and of
+``Function.map``.
+
+Usage: python function_call_overhead.py -n 100000 --size 10
+
+"""
+from __future__ import absolute_import, print_function, division
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+import theano
+import theano.tensor as T
+
+parser = OptionParser(usage='%prog <options>\n Measure the time per call of'
+                      ' small compiled functions')
+parser.add_option('-n', '--n', action='store', dest='n', default=100000,
+                  type="int", help="The number of calls")
+parser.add_option('--size', action='store', dest='size', default=10,
+                  type="int", help="The size of the input vectors")
+parser.add_option('--linker', action='store', dest='linker', default=None,
+                  help="The linker to use, default to config.linker")
+
+
+def graphs():
+    x = T.vector('x')
+    y = T.vector('y')
+    yield 'x + y', [x, y], x + y
+    yield 'tanh(x * y + 1)', [x, y], T.tanh(x * y + 1)
+    yield '(x + y).sum(), x * y', [x, y], [(x + y).sum(), x * y]
+
+
+def time_per_call(f, args, n):
+    t0 = time.time()
+    for i in range(n):
+        f(*args)
+    return (time.time() - t0) / n
+
+
+def time_per_call_map(f, args, n):
+    all_args = [args] * n
+    t0 = time.time()
+    f.map(all_args)
+    return (time.time() - t0) / n
+
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    mode = theano.compile.get_default_mode()
+    if options.linker:
+        mode = mode.clone(linker=options.linker)
+    rng = np.random.RandomState(1)
+    print("Time per call in microseconds, %d calls, inputs of size %d" % (
+        options.n, options.size))
+    print("%-24s %10s %12s %10s" % ('graph', '__call__', 'trust_input',
+                                    'map'))
+    for name, inputs, outputs in graphs():
+        f = theano.function(inputs, outputs, mode=mode)
+        args = [rng.rand(options.size).astype(i.dtype) for i in inputs]
+        t_call = time_per_call(f, args, options.n)
+        f.trust_input = True
+        t_trust = time_per_call(f, args, options.n)
+        f.trust_input = False
+        t_map = time_per_call_map(f, args, options.n)
+        print("%-24s %10.2f %12.2f %10.2f" % (
+            name, t_call * 1e6, t_trust * 1e6, t_map * 1e6))
@@ -0,0 +1,92 @@
+"""
+Report the memory used by a large graph: to build it, to clone it and to
+put it in a FunctionGraph.
+
+The graph is a recurrent net unrolled for N steps.
+
+This needs Python 3.4, for the tracemalloc module.
+
+Usage: python graph_memory.py -N 5000 [--no-trace]
+
+"""
+from __future__ import absolute_import, print_function, division
+import gc
+import sys
+import time
+from optparse import OptionParser
+
+parser = OptionParser(usage='%prog <options>\n Report the memory used to'
+                      ' build, clone and put in a FunctionGraph a large'
+                      ' graph')
+parser.add_option('-N', '--N', action='store', dest='N', default=5000,
+                  type="int", help="The number of unrolled steps")
+parser.add_option('--no-trace', action='store_true', dest='no_trace',
+                  default=False,
+                  help="Build the graph without the traces of the variables"
+                  " (traceback.limit=0)")
+
+
+def unrolled_rnn(n_steps):
+    import theano.tensor as T
+    x = T.matrix('x')
+    h0 = T.vector('h0')
+    W = T.matrix('W')
+    U = T.matrix('U')
+    b = T.vector('b')
+    h = h0
+    cost = 0
+    for t in range(n_steps):
+        h = T.tanh(T.dot(x[t], W) + T.dot(h, U) + b)
+        cost = cost + (h ** 2).sum()
+    return [x, h0, W, U, b], [cost, h]
+
+
+def measure(f):
+    """
+    Call `f` and return its result, the memory it allocated that is still
+    in use, in bytes, and the time it took.
+
+    """
+    import tracemalloc
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    t0 = time.time()
+    rval = f()
+    t = time.time() - t0
+    gc.collect()
+    return rval, tracemalloc.get_traced_memory()[0] - before, t
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 4):
+        print("Python 3.4 or later is needed to measure the memory.",
+              file=sys.stderr)
+        sys.exit(1)
+    import tracemalloc
+    # Import everything before measuring.
+    import theano
+    from theano.configparser import change_flags
+    from theano.gof import graph
+    options, arguments = parser.parse_args()
+    unrolled_rnn(1)
+
+    tracemalloc.start()
+    with change_flags(**{'traceback.limit':
+                         0 if options.no_trace else
+                         theano.config.traceback.limit}):
+        (inputs, outputs), mem, t = measure(
+            lambda: unrolled_rnn(options.N))
+    nb_nodes = len(graph.ops(inputs, outputs))
+    nb_vars = len(graph.variables(inputs, outputs))
+    print("%d Apply nodes and %d variables" % (nb_nodes, nb_vars))
+    print("%-16s %10s %14s %8s" % ('', 'MB', 'bytes/node', 'time(s)'))
+    print("%-16s %10.1f %14d %8.2f" % ('build', mem / 2. ** 20,
+                                       mem / nb_nodes, t))
+    cloned, mem, t = measure(lambda: graph.clone(inputs, outputs))
+    print("%-16s %10.1f %14d %8.2f" % ('clone', mem / 2. ** 20,
+                                       mem / nb_nodes, t))
+    del cloned
+    fgraph, mem, t = measure(lambda: theano.gof.FunctionGraph(inputs,
+                                                              outputs))
+    print("%-16s %10.1f %14d %8.2f" % ('FunctionGraph', mem / 2. ** 20,
+                                       mem / nb_nodes, t))
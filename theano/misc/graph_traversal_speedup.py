@@ -0,0 +1,68 @@
+"""
+Time the functions of theano.gof.graph that walk or copy a whole graph,
+on graphs of different sizes.
+
+The graphs are random DAGs of Elemwise nodes: each node combines the
+previous node with a random earlier one, so that variables have many
+clients.
+
+Usage: python graph_traversal_speedup.py -N 10000,100000 -r 3
+
+"""
+from __future__ import absolute_import, print_function, division
+import random
+import time
+from optparse import OptionParser
+
+import theano.tensor as T
+from theano.gof import graph
+
+parser = OptionParser(usage='%prog <options>\n Time the traversal and the'
+                      ' cloning of graphs of different sizes')
+parser.add_option('-N', '--N', action='store', dest='N',
+                  default='10000,100000',
+                  help="Comma separated numbers of Apply nodes")
+parser.add_option('-r', '--repeat', action='store', dest='repeat',
+                  default=3, type="int",
+                  help="Report the best time of that many calls")
+
+
+def random_graph(n_nodes, seed=1):
+    rng = random.Random(seed)
+    inputs = [T.vector('x%d' % i) for i in range(10)]
+    variables = list(inputs)
+    ops = [T.add, T.mul, T.sub, T.maximum]
+    for i in range(n_nodes):
+        op = ops[i % len(ops)]
+        variables.append(op(variables[-1], rng.choice(variables)))
+    return inputs, [variables[-1], variables[len(variables) // 2]]
+
+
+def best_time(f, repeat):
+    times = []
+    for i in range(repeat):
+        t0 = time.time()
+        f()
+        times.append(time.time() - t0)
+    return min(times)
+
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    functions = [
+        ('ancestors', lambda i, o: graph.ancestors(o)),
+        ('inputs', lambda i, o: graph.inputs(o)),
+        ('variables', lambda i, o: graph.variables(i, o)),
+        ('ops', lambda i, o: graph.ops(i, o)),
+        ('io_toposort', lambda i, o: graph.io_toposort(i, o)),
+        ('io_toposort(clients)',
+         lambda i, o: graph.io_toposort(i, o, clients={})),
+        ('clone_get_equiv', lambda i, o: graph.clone_get_equiv(i, o)),
+    ]
+    print("%-22s %10s %10s" % ('', 'nodes', 'time(s)'))
+    for n_nodes in [int(n) for n in options.N.split(',')]:
+        inputs, outputs = random_graph(n_nodes)
+        for name, f in functions:
+            print("%-22s %10d %10.3f" % (
+                name, n_nodes,
+                best_time(lambda: f(inputs, outputs), options.repeat)))
@@ -0,0 +1,99 @@
+"""
+Report the time spent importing each module, in the same format as
+`python -X importtime` (that option only exists since Python 3.7).
+
+This must be run as a script, not with `python -m`, as importing any
+theano module would import theano before the measure starts.
+
+Usage: python importtime.py [-n 20] [module]
+
+"""
+from __future__ import absolute_import, print_function, division
+import sys
+import time
+from optparse import OptionParser
+
+parser = OptionParser(usage='%prog <options> [module]\n Report the time'
+                      ' needed to import a module (theano by default) and'
+                      ' all the modules it imports')
+parser.add_option('-n', '--n', action='store', dest='n', default=None,
+                  type="int", help="Only print the N slowest modules")
+
+
+def import_times(module_name):
+    """
+    Import `module_name` and return the modules imported by it.
+
+    Returns
+    -------
+    list of tuples
+        (name, self time, cumulative time, depth) for each module that got
+        imported, in the order their import finished. Times are in seconds.
+
+    """
+    import importlib
+    import importlib.abc
+    records = []
+    # Cumulative time of the children of the modules being imported.
+    stack = []
+
+    class Finder(importlib.abc.MetaPathFinder):
+        def find_spec(self, name, path, target=None):
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is None:
+                    continue
+                loader = spec.loader
+                if loader is not None and hasattr(loader, 'exec_module'):
+                    exec_module = loader.exec_module
+
+                    def timed_exec_module(module, exec_module=exec_module):
+                        stack.append(0.)
+                        t0 = time.time()
+                        try:
+                            exec_module(module)
+                        finally:
+                            cumulative = time.time() - t0
+                            children = stack.pop()
+                            records.append((name, cumulative - children,
+                                            cumulative, len(stack)))
+                            if stack:
+                                stack[-1] += cumulative
+                    loader.exec_module = timed_exec_module
+                return spec
+            return None
+
+    finder = Finder()
+    sys.meta_path.insert(0, finder)
+    try:
+        importlib.import_module(module_name)
+    finally:
+        sys.meta_path.remove(finder)
+    return records
+
+
+def print_import_times(records, n=None, file=sys.stderr):
+    if n is not None:
+        records = sorted(records, key=lambda r: -r[1])[:n]
+    print("import time: self [us] | cumulative | imported package",
+          file=file)
+    for name, self_time, cumulative, depth in records:
+        print("import time: %9d | %10d | %s%s" % (
+            self_time * 1e6, cumulative * 1e6, '  ' * depth, name),
+            file=file)
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 4):
+        print("Python 3.4 or later is needed to measure the import time.",
+              file=sys.stderr)
+        sys.exit(1)
+    options, arguments = parser.parse_args(sys.argv)
+    module_name = arguments[1] if len(arguments) > 1 else 'theano'
+    records = import_times(module_name)
+    print_import_times(records, options.n)
+    total = sum(r[2] for r in records if r[3] == 0)
+    print("Total time to import %s: %.3fs" % (module_name, total),
+          file=sys.stderr)
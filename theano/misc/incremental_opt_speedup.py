@@ -0,0 +1,105 @@
+"""
+Compare the time needed to optimize graphs of different sizes, with and
+without the incremental mode of the EquilibriumOptimizers (flag
+optdb.incremental).
+
+The graphs are a recurrent net unrolled for N steps, with its gradient.
+
+Besides the total optimization time, it reports the time spent in the
+EquilibriumOptimizers themselves and the number of nodes their iterations
+visited. Most of the total is spent by the MergeOptimizer and the
+MergeFeature, which the incremental mode doesn't change. With FAST_RUN,
+the EquilibriumOptimizers converge in at most 3 iterations that each
+change a large part of these graphs, so both modes visit the same nodes
+and take the same time.
+
+Usage: python incremental_opt_speedup.py -N 5,10,20,40
+
+"""
+from __future__ import absolute_import, print_function, division
+import time
+from optparse import OptionParser
+
+import theano
+import theano.tensor as T
+from theano.configparser import change_flags
+
+parser = OptionParser(usage='%prog <options>\n Compute the time needed to'
+                      ' optimize graphs of different sizes with and without'
+                      ' the incremental mode of the EquilibriumOptimizers')
+parser.add_option('-N', '--N', action='store', dest='N',
+                  default='5,10,20,40',
+                  help="Comma separated numbers of unrolled steps")
+parser.add_option('--mode', action='store', dest='mode', default='FAST_RUN',
+                  help="The mode whose optimizer is used")
+
+
+def unrolled_rnn(n_steps):
+    x = T.matrix('x')
+    h0 = T.vector('h0')
+    W = T.matrix('W')
+    U = T.matrix('U')
+    b = T.vector('b')
+    h = h0
+    cost = 0
+    for t in range(n_steps):
+        # Some terms that the optimizer simplifies.
+        h = T.tanh(T.dot(x[t], W) * 1 + T.dot(h, U) + b + 0)
+        cost = cost + T.log(T.exp(h)).sum() + (h * h / h).mean()
+    return [x, h0, W, U, b], [cost] + T.grad(cost, [W, U, b])
+
+
+equilibrium_stats = [0., 0]
+EquilibriumOptimizer = theano.gof.opt.EquilibriumOptimizer
+equilibrium_apply = EquilibriumOptimizer.apply
+
+
+def timed_apply(self, fgraph, start_from=None):
+    t0 = time.time()
+    prof = equilibrium_apply(self, fgraph, start_from)
+    equilibrium_stats[0] += time.time() - t0
+    equilibrium_stats[1] += sum(prof[5])
+    return prof
+EquilibriumOptimizer.apply = timed_apply
+
+
+def optimize(inputs, outputs, mode):
+    """
+    Return the time needed to optimize the graph, the time spent in the
+    EquilibriumOptimizers and the number of nodes they visited, the
+    number of nodes before and after optimization, and the sorted ops of
+    the optimized graph.
+
+    """
+    fgraph = theano.gof.FunctionGraph(inputs, outputs)
+    nb_nodes = len(fgraph.apply_nodes)
+    optimizer = theano.compile.get_mode(mode).optimizer
+    equilibrium_stats[:] = [0., 0]
+    t0 = time.time()
+    optimizer(fgraph)
+    opt_time = time.time() - t0
+    topo = [str(node.op) for node in fgraph.toposort()]
+    return (opt_time, equilibrium_stats[0], equilibrium_stats[1], nb_nodes,
+            len(topo), sorted(topo))
+
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    # The first optimization loads the module cache and compiles the C
+    # code needed by constant folding, do it before timing anything.
+    optimize(*unrolled_rnn(1), mode=options.mode)
+    print("%6s %6s %9s %9s %9s %9s %9s %9s %9s" % (
+        'steps', 'nodes', 'opt nodes', 'full(s)', 'incr(s)', 'eq full(s)',
+        'eq incr(s)', 'visited', 'visited'))
+    for n_steps in [int(n) for n in options.N.split(',')]:
+        inputs, outputs = unrolled_rnn(n_steps)
+        results = []
+        for incremental in [False, True]:
+            with change_flags(**{'optdb.incremental': incremental}):
+                results.append(optimize(inputs, outputs, options.mode))
+        ((full_time, full_eq, full_visited, nb_nodes, nb_opt, topo),
+         (inc_time, inc_eq, inc_visited, _, _, inc_topo)) = results
+        print("%6d %6d %9d %9.3f %9.3f %9.3f %9.3f %9d %9d%s" % (
+            n_steps, nb_nodes, nb_opt, full_time, inc_time, full_eq, inc_eq,
+            full_visited, inc_visited,
+            '' if topo == inc_topo else '  (different graphs)'))
@@ -0,0 +1,98 @@
+"""
+Compare two optimizer profiles saved in JSON with the flag
+profiling.optimizer_json or with
+theano.compile.profiling.OptimizerProfileCollector.
+
+Print, for the optimizers whose time changed the most, their time,
+number of attempts and successes, and the number of nodes they created
+and removed, in the old and the new profile.
+
+Usage: python optimizer_profile_diff.py old.json new.json [-n 30]
+
+"""
+from __future__ import absolute_import, print_function, division
+import json
+import sys
+from optparse import OptionParser
+
+parser = OptionParser(usage='%prog <options> old.json new.json\n Compare two'
+                      ' optimizer profiles saved in JSON')
+parser.add_option('-n', '--n', action='store', dest='n', default=30,
+                  type="int", help="The number of optimizers to print")
+parser.add_option('--sort', action='store', dest='sort', default='time',
+                  help="Sort the optimizers by the change of this field:"
+                  " time, attempts, applied, nodes_created or"
+                  " nodes_removed")
+
+FIELDS = ['time', 'attempts', 'applied', 'nodes_created', 'nodes_removed']
+
+
+def flatten(prof, path='', rval=None):
+    """
+    Return a dict from the path of each optimizer in `prof`, an optimizer
+    profile as a dict, to the dict of its statistics.
+
+    """
+    if rval is None:
+        rval = {}
+    if prof is None:
+        return rval
+    for stage in prof.get('stages', []):
+        stage_path = path + stage['name']
+        rval[stage_path] = dict((k, stage.get(k)) for k in FIELDS)
+        flatten(stage['profile'], stage_path + '/', rval)
+    for name, stats in prof.get('optimizers', {}).items():
+        rval[path + name] = stats
+    return rval
+
+
+def diff(old, new, sort='time'):
+    """
+    Return the list of (path, old stats, new stats) of the optimizers of
+    `old` and `new`, two profiles saved by OptimizerProfileCollector,
+    sorted by decreasing absolute change of `sort`.
+
+    The stats of an optimizer that is only in one profile are None in the
+    other.
+
+    """
+    old = flatten(old['profile'])
+    new = flatten(new['profile'])
+    rval = [(path, old.get(path), new.get(path))
+            for path in set(old) | set(new)]
+
+    def change(row):
+        path, o, n = row
+        return -abs(((n or {}).get(sort) or 0) - ((o or {}).get(sort) or 0))
+    rval.sort(key=lambda row: (change(row), row[0]))
+    return rval
+
+
+def format_value(stats, field):
+    if stats is None or stats.get(field) is None:
+        return '-'
+    if field == 'time':
+        return '%.3f' % stats[field]
+    return '%d' % stats[field]
+
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    if len(arguments) != 2 or options.sort not in FIELDS:
+        parser.print_help()
+        sys.exit(1)
+    with open(arguments[0]) as f:
+        old = json.load(f)
+    with open(arguments[1]) as f:
+        new = json.load(f)
+    print("%d functions in the old profile, %d in the new one" % (
+        old['nb_functions'], new['nb_functions']))
+    print("Total time: %s old, %s new" % (
+        format_value(old['profile'], 'time'),
+        format_value(new['profile'], 'time')))
+    print(' '.join(['%21s' % f for f in FIELDS]), ' optimizer')
+    print(' '.join(['%10s %10s' % ('old', 'new') for f in FIELDS]))
+    for path, o, n in diff(old, new, options.sort)[:options.n]:
+        print(' '.join(['%10s %10s' % (format_value(o, f),
+                                       format_value(n, f))
+                        for f in FIELDS]), '', path)
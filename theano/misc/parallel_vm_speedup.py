@@ -0,0 +1,76 @@
+"""
+Time a wide graph with the Parallel VM and different numbers of worker
+threads.
+
+The graph has independent towers of dot products and tanh, like the
+branches of an inception module, whose results are summed. The threads
+only run at the same time during the BLAS calls and the NumPy functions
+that release the GIL, so compare with a BLAS library limited to one
+thread (OMP_NUM_THREADS=1 for OpenBLAS).
+
+Usage: OMP_NUM_THREADS=1 python parallel_vm_speedup.py -w 1,2,4 --towers 8
+
+On a machine with one core, it measured 0.0995s per call with 1 worker,
+0.1020s with 2 and 0.1022s with 4 (8 towers of 3 layers of 512x512
+matrices), so only the overhead of the threads.
+
+"""
+from __future__ import absolute_import, print_function, division
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+import theano
+import theano.tensor as T
+from theano.gof.vm import VM_Linker
+
+parser = OptionParser(usage='%prog <options>\n Time a wide graph with'
+                      ' different numbers of worker threads')
+parser.add_option('-w', '--workers', action='store', dest='workers',
+                  default='1,2,4',
+                  help="Comma separated numbers of worker threads")
+parser.add_option('--towers', action='store', dest='towers', default=8,
+                  type="int", help="The number of independent towers")
+parser.add_option('--depth', action='store', dest='depth', default=3,
+                  type="int", help="The number of layers of each tower")
+parser.add_option('--size', action='store', dest='size', default=512,
+                  type="int", help="The size of the square matrices")
+parser.add_option('-n', '--n', action='store', dest='n', default=10,
+                  type="int", help="The number of calls")
+
+
+def wide_graph(towers, depth, size):
+    rng = np.random.RandomState(1)
+    x = T.matrix('x')
+    out = 0
+    for i in range(towers):
+        h = x
+        for j in range(depth):
+            w = theano.shared(
+                (rng.rand(size, size) / size).astype(x.dtype))
+            h = T.tanh(T.dot(h, w))
+        out = out + h
+    return x, out
+
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    x, out = wide_graph(options.towers, options.depth, options.size)
+    x_val = np.random.rand(options.size, options.size).astype(x.dtype)
+    print("%d towers of %d layers, matrices of size %d" % (
+        options.towers, options.depth, options.size))
+    print("%8s %12s %8s" % ('workers', 'time(s)', 'speedup'))
+    t_ref = None
+    for workers in [int(w) for w in options.workers.split(',')]:
+        linker = VM_Linker(use_cloop=workers == 1,
+                           parallel_workers=workers)
+        f = theano.function([x], out, mode=theano.Mode(linker=linker))
+        f(x_val)
+        t0 = time.time()
+        for i in range(options.n):
+            f(x_val)
+        t = (time.time() - t0) / options.n
+        if t_ref is None:
+            t_ref = t
+        print("%8d %12.4f %8.2f" % (workers, t, t_ref / t))
@@ -0,0 +1,108 @@
+"""
+Compare the time needed to compile, with an empty compilation directory,
+the C modules of a MLP and of a CNN, with and without precompiled headers
+(flag cmodule.precompiled_headers).
+
+Usage: python pch_speedup.py --graph mlp
+
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+import theano
+import theano.tensor as T
+from theano.tensor.nnet import conv2d
+from theano.tensor.signal.pool import pool_2d
+
+parser = OptionParser(usage='%prog <options>\n Compute the time needed to'
+                      ' compile a graph with and without precompiled headers')
+parser.add_option('--graph', action='store', dest='graph', default='all',
+                  type="choice", choices=['mlp', 'cnn', 'all'],
+                  help="The graph to compile: mlp, cnn or all")
+parser.add_option('--worker', action='store', dest='worker', default=None,
+                  help="Internal: compile this graph")
+
+numpy_rng = np.random.RandomState(1234)
+
+
+def mlp():
+    x = T.matrix('x')
+    y = T.ivector('y')
+    params = []
+    h = x
+    for n_in, n_out in [(784, 500), (500, 500), (500, 10)]:
+        W = theano.shared(
+            theano._asarray(0.01 * (numpy_rng.rand(n_in, n_out) - .5),
+                            dtype=theano.config.floatX))
+        b = theano.shared(
+            theano._asarray(numpy_rng.rand(n_out),
+                            dtype=theano.config.floatX))
+        params += [W, b]
+        h = T.tanh(T.dot(h, W) + b)
+    p_y = T.nnet.softmax(h)
+    cost = -T.mean(T.log(p_y)[T.arange(y.shape[0]), y])
+    return [x, y], cost, params
+
+
+def cnn():
+    x = T.tensor4('x')
+    y = T.ivector('y')
+    W = theano.shared(theano._asarray(numpy_rng.rand(20, 1, 5, 5),
+                                      dtype=theano.config.floatX))
+    b = theano.shared(theano._asarray(numpy_rng.rand(20),
+                                      dtype=theano.config.floatX))
+    h = T.nnet.relu(pool_2d(conv2d(x, W), (2, 2), ignore_border=True) +
+                    b.dimshuffle('x', 0, 'x', 'x'))
+    V = theano.shared(theano._asarray(numpy_rng.rand(20 * 12 * 12, 10),
+                                      dtype=theano.config.floatX))
+    p_y = T.nnet.softmax(T.dot(h.flatten(2), V))
+    cost = -T.mean(T.log(p_y)[T.arange(y.shape[0]), y])
+    return [x, y], cost, [W, b, V]
+
+
+def worker(graph):
+    inputs, cost, params = globals()[graph]()
+    updates = [(p, p - 0.01 * g) for p, g in zip(params, T.grad(cost, params))]
+    theano.function(inputs, cost, updates=updates)
+
+
+def run(graph, precompiled_headers):
+    compiledir = tempfile.mkdtemp(prefix='pch_speedup_')
+    env = dict(os.environ)
+    env['THEANO_FLAGS'] = ('%s,base_compiledir=%s,'
+                           'cmodule.precompiled_headers=%s' % (
+                               env.get('THEANO_FLAGS', ''), compiledir,
+                               precompiled_headers))
+    # Import theano once, so that the base modules (lazylinker, cutils, ...)
+    # are compiled outside of the timed part.
+    subprocess.check_call([sys.executable, '-c', 'import theano'], env=env)
+    try:
+        t0 = time.time()
+        subprocess.check_call([sys.executable, os.path.abspath(__file__),
+                               '--worker', graph], env=env)
+        return time.time() - t0
+    finally:
+        shutil.rmtree(compiledir)
+
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args(sys.argv)
+    if options.worker is not None:
+        worker(options.worker)
+        sys.exit(0)
+    graphs = ['mlp', 'cnn'] if options.graph == 'all' else [options.graph]
+    for graph in graphs:
+        without_pch = run(graph, False)
+        with_pch = run(graph, True)
+        print("Cold compilation of the %s graph" % graph)
+        print("Without precompiled headers: %fs" % without_pch)
+        print("With precompiled headers: %fs" % with_pch)
+        print("Speedup: %2.2f" % (without_pch / with_pch))
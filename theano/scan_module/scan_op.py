@@ -1611,7 +1611,7 @@ class Scan(PureOp):
             profile.call_time += t_call
             profile.vm_call_time += t_fn
             if hasattr(self.fn.fn, 'update_profile'):
-                self.fn.fn.update_profile(profile)
+                profile.add_function(self.fn)
 
         self.t_call = t_call
         self.t_fn = t_fn
@@ -482,7 +482,20 @@ class GemmRelated(Op):
             return (double) tv.tv_sec + (double) tv.tv_usec / 1000000.0;
         }
         """
-        return blas_header_text() + mod_str
+        if config.blas.ldflags:
+            # The BLAS library does not use the Python C API, so other
+            # threads can run during the call to [sd]gemm_.
+            gil_str = """
+            #define GEMM_BEGIN_ALLOW_THREADS Py_BEGIN_ALLOW_THREADS
+            #define GEMM_END_ALLOW_THREADS Py_END_ALLOW_THREADS
+            """
+        else:
+            # The NumPy implementation of [sd]gemm_ needs the GIL.
+            gil_str = """
+            #define GEMM_BEGIN_ALLOW_THREADS {
+            #define GEMM_END_ALLOW_THREADS }
+            """
+        return blas_header_text() + mod_str + gil_str
 
     def c_headers(self):
         # std.cout doesn't require the '%' symbol to print stuff...
@@ -683,6 +696,8 @@ class GemmRelated(Op):
                 int Nz0 = Nz[0], Nz1 = Nz[1], Nx1 = Nx[1];
                 //std::cerr << (unit/256) MOD 16 << (unit / 16) MOD 16 << unit MOD 16<< '\\n';
                 //double t0 = time_time();
+                int unit_ok = 1;
+                GEMM_BEGIN_ALLOW_THREADS
                 switch(unit)
                 {
                     case 0x000: sgemm_(&N, &N, &Nz1, &Nz0, &Nx1, &a, y, &sy_0, x, &sx_0, &b, z, &sz_0); break;
@@ -693,8 +708,15 @@ class GemmRelated(Op):
                     case 0x101: sgemm_(&N, &T, &Nz0, &Nz1, &Nx1, &a, x, &sx_1, y, &sy_0, &b, z, &sz_1); break;
                     case 0x011: sgemm_(&T, &N, &Nz0, &Nz1, &Nx1, &a, x, &sx_0, y, &sy_1, &b, z, &sz_1); break;
                     case 0x111: sgemm_(&N, &N, &Nz0, &Nz1, &Nx1, &a, x, &sx_1, y, &sy_1, &b, z, &sz_1); break;
-                    default: PyErr_SetString(PyExc_ValueError, "some matrix has no unit stride"); %(fail)s;
+                    default: unit_ok = 0;
                 };
+                GEMM_END_ALLOW_THREADS
+                if (!unit_ok)
+                {
+                    PyErr_SetString(PyExc_ValueError,
+                                    "some matrix has no unit stride");
+                    %(fail)s;
+                }
                 //fprintf(stderr, "Calling sgemm %%i %%i %%i %%i took %%f\\n", unit, Nz1, Nz0, Nx1, time_time() - t0);
         """
 
@@ -722,6 +744,8 @@ class GemmRelated(Op):
                 //sx_0, sx_1,
                 //sz_0, sz_1
                 //);
+                int unit_ok = 1;
+                GEMM_BEGIN_ALLOW_THREADS
                 switch(unit)
                 {
                     case 0x000: dgemm_(&N, &N, &Nz1, &Nz0, &Nx1, &a, y,
@@ -740,10 +764,15 @@ class GemmRelated(Op):
                                        &sx_0, y, &sy_1, &b, z, &sz_1); break;
                     case 0x111: dgemm_(&N, &N, &Nz0, &Nz1, &Nx1, &a, x,
                                        &sx_1, y, &sy_1, &b, z, &sz_1); break;
-                    default: PyErr_SetString(PyExc_ValueError,
-                                             "some matrix has no unit stride");
-                             %(fail)s;
+                    default: unit_ok = 0;
                 };
+                GEMM_END_ALLOW_THREADS
+                if (!unit_ok)
+                {
+                    PyErr_SetString(PyExc_ValueError,
+                                    "some matrix has no unit stride");
+                    %(fail)s;
+                }
                 //fprintf(stderr, "Calling dgemm %%i %%i %%i %%i took %%f\\n",
                 //        unit, Nz1, Nz0, Nx1, time_time()- t0);
         """
@@ -776,7 +805,7 @@ class GemmRelated(Op):
             self.end_switch_typenum), '')
 
     def build_gemm_version(self):
-        return (13, blas_header_version())
+        return (14, blas_header_version())
 
 
 class Gemm(GemmRelated):
@@ -4,6 +4,7 @@ Abstract conv interface
 from __future__ import absolute_import, print_function, division
 
 import logging
+import pkgutil
 from six import reraise, integer_types
 import sys
 
@@ -20,10 +21,10 @@ import warnings
 import numpy
 import numpy as np
 
+# scipy.signal is slow to import (it imports scipy.stats), so it is only
+# imported by the python implementations that use it.
 try:
-    from scipy.signal.signaltools import _valfrommode, _bvalfromboundary, convolve
-    from scipy.signal.sigtools import _convolve2d
-    imported_scipy_signal = True
+    imported_scipy_signal = pkgutil.find_loader('scipy.signal') is not None
 except ImportError:
     imported_scipy_signal = False
 
@@ -1494,6 +1495,9 @@ class BaseAbstractConv(Op):
             raise NotImplementedError(
                 "AbstractConv perform requires the python package"
                 " for scipy.signal to be installed.")
+        from scipy.signal.signaltools import (_valfrommode, _bvalfromboundary,
+                                              convolve)
+        from scipy.signal.sigtools import _convolve2d
         if not (mode in ('valid', 'full')):
             raise ValueError(
                 'invalid mode {}, which must be either '
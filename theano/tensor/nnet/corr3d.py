@@ -123,13 +123,13 @@ class BaseCorr3dMM(gof.OpenMPOp):
 
     def c_code_cache_version(self):
         # raise this whenever modifying any of the support_code_files
-        return (5, self.openmp, blas_header_version())
+        return (6, self.openmp, blas_header_version())
 
     def c_support_code_apply(self, node, nodename):
         # REMEMBER TO RAISE c_code_cache_version when changing any of
         # these files
         sub = {}
-        dtype = str(node.__dict__['inputs'][0].dtype)
+        dtype = str(node.inputs[0].dtype)
         assert dtype in ('float32', 'float64')
         if dtype == 'float32':
             sub['gemm'] = 'sgemm_'
@@ -165,6 +165,16 @@ class BaseCorr3dMM(gof.OpenMPOp):
             sub['blas_set_num_threads'] = ''
             sub['blas_get_num_threads'] = '0'
 
+        if theano.config.blas.ldflags:
+            # The BLAS library does not use the Python C API, so the GIL is
+            # released around the loops over the batch.
+            sub['begin_allow_threads'] = 'Py_BEGIN_ALLOW_THREADS'
+            sub['end_allow_threads'] = 'Py_END_ALLOW_THREADS'
+        else:
+            # The NumPy implementation of [sd]gemm_ needs the GIL.
+            sub['begin_allow_threads'] = ''
+            sub['end_allow_threads'] = ''
+
         files = ['corr3d_gemm.c']
         codes = [open(os.path.join(os.path.split(__file__)[0], f)).read()
                  for f in files]
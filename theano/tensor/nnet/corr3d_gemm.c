@@ -273,6 +273,8 @@ PyArrayObject* corr3dMM(PyArrayObject* bottom,
         output = top;
         // valid correlation: im3d2col, then gemm
         // Iterate over batch
+        // The loop does not use the Python C API: let other threads run.
+        %(begin_allow_threads)s
         int blas_threads_saved = %(blas_get_num_threads)s;
         // Always forcing gemm to one thread when OpenMP is enalbed for best and stable performance.
         %(blas_set_num_threads)s(1);
@@ -295,6 +297,7 @@ PyArrayObject* corr3dMM(PyArrayObject* bottom,
         }
         // Restore to previous blas threads
         %(blas_set_num_threads)s(blas_threads_saved);
+        %(end_allow_threads)s
     }
     else if (direction == 1) {  // backprop wrt. weights
         output = weight;
@@ -314,6 +317,8 @@ PyArrayObject* corr3dMM(PyArrayObject* bottom,
         
         // valid convolution: im2col, then gemm
         // Iterate over batch
+        // The loop does not use the Python C API: let other threads run.
+        %(begin_allow_threads)s
         int blas_threads_saved = %(blas_get_num_threads)s;
         // Always forcing gemm to one thread when OpenMP is enalbed for best and stable performance.
         %(blas_set_num_threads)s(1);
@@ -341,6 +346,7 @@ PyArrayObject* corr3dMM(PyArrayObject* bottom,
         }
         // Restore to previous blas threads
         %(blas_set_num_threads)s(blas_threads_saved);
+        %(end_allow_threads)s
 
         //aggregate weights
         memset((%(float_type)s*)PyArray_DATA(weight), 0, M_ * K_*sizeof(%(float_type)s));
@@ -365,6 +371,8 @@ PyArrayObject* corr3dMM(PyArrayObject* bottom,
         // full convolution: gemm, then col2im3d
         // Iterate over batch
 
+        // The loop does not use the Python C API: let other threads run.
+        %(begin_allow_threads)s
         int blas_threads_saved = %(blas_get_num_threads)s;
         // Always forcing gemm to one thread when OpenMP is enalbed for best and stable performance.
         %(blas_set_num_threads)s(1);
@@ -387,6 +395,7 @@ PyArrayObject* corr3dMM(PyArrayObject* bottom,
         }
         // Restore to previous blas threads
         %(blas_set_num_threads)s(blas_threads_saved);
+        %(end_allow_threads)s
     }
     // Free temporary columns
     Py_DECREF(col);
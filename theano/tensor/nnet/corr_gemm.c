@@ -246,6 +246,8 @@ PyArrayObject* corrMM(PyArrayObject* bottom,
         output = top;
         // valid correlation: im2col, then gemm
         // Iterate over batch
+        // The loop does not use the Python C API: let other threads run.
+        %(begin_allow_threads)s
         int blas_threads_saved = %(blas_get_num_threads)s;
         // Always forcing gemm to one thread when OpenMP is enalbed for best and stable performance.
         %(blas_set_num_threads)s(1);
@@ -267,6 +269,7 @@ PyArrayObject* corrMM(PyArrayObject* bottom,
         }
         // Restore to previous blas threads
         %(blas_set_num_threads)s(blas_threads_saved);
+        %(end_allow_threads)s
 
         /*
         // Original caffe code for comparison
@@ -318,6 +321,8 @@ PyArrayObject* corrMM(PyArrayObject* bottom,
         
         // valid convolution: im2col, then gemm
         // Iterate over batch
+        // The loop does not use the Python C API: let other threads run.
+        %(begin_allow_threads)s
         int blas_threads_saved = %(blas_get_num_threads)s;
         // Always forcing gemm to one thread when OpenMP is enalbed for best and stable performance.
         %(blas_set_num_threads)s(1);
@@ -344,6 +349,7 @@ PyArrayObject* corrMM(PyArrayObject* bottom,
         }
         // Restore to previous blas threads
         %(blas_set_num_threads)s(blas_threads_saved);
+        %(end_allow_threads)s
 
         //aggregate weights
         memset((%(float_type)s*)PyArray_DATA(weight), 0, M_ * K_*sizeof(%(float_type)s));
@@ -396,6 +402,8 @@ PyArrayObject* corrMM(PyArrayObject* bottom,
         // full convolution: gemm, then col2im
         // Iterate over batch
 
+        // The loop does not use the Python C API: let other threads run.
+        %(begin_allow_threads)s
         int blas_threads_saved = %(blas_get_num_threads)s;
         // Always forcing gemm to one thread when OpenMP is enalbed for best and stable performance.
         %(blas_set_num_threads)s(1);
@@ -417,6 +425,7 @@ PyArrayObject* corrMM(PyArrayObject* bottom,
         }
         // Restore to previous blas threads
         %(blas_set_num_threads)s(blas_threads_saved);
+        %(end_allow_threads)s
         /*
         // Original caffe code for comparison
         // Note that this code was translated from the Theano GPU code,
@@ -764,6 +764,8 @@ class Pool(OpenMPOp):
             {
                 non_pooling_prod *= PyArray_DIMS(%(x)s)[i];
             }
+            // The loops do not use the Python C API: let other threads run.
+            Py_BEGIN_ALLOW_THREADS
             %(omp_parallel)s
             // first loop over non-pooling dimensions
             for (int t=0; t<non_pooling_prod; t++)
@@ -898,12 +900,13 @@ class Pool(OpenMPOp):
 
         ccode += """
           } // for loop over non-pooling dimensions
+          Py_END_ALLOW_THREADS
         } // if z_prod
         """
         return ccode % locals()
 
     def c_code_cache_version(self):
-        return (0, 6, 8, 7, self.openmp)
+        return (0, 6, 8, 8, self.openmp)
 
 
 class PoolGrad(OpenMPOp):
@@ -1300,6 +1303,8 @@ class MaxPoolGrad(PoolGrad):
             {
                 non_pooling_prod *= PyArray_DIMS(%(x)s)[i];
             }
+            // The loops do not use the Python C API: let other threads run.
+            Py_BEGIN_ALLOW_THREADS
             %(omp_parallel)s
             // first loop over non-pooling dimensions
             for (int t=0; t<non_pooling_prod; t++)
@@ -1388,12 +1393,13 @@ class MaxPoolGrad(PoolGrad):
 
         ccode += """
             } // for loop over non-pooling dimensions
+            Py_END_ALLOW_THREADS
         } // if z_prod
         """
         return ccode % locals()
 
     def c_code_cache_version(self):
-        return (0, 10, self.openmp)
+        return (0, 11, self.openmp)
 
 
 class AveragePoolGrad(PoolGrad):
@@ -1627,6 +1633,8 @@ class AveragePoolGrad(PoolGrad):
             {
                 non_pooling_prod *= PyArray_DIMS(%(x)s)[i];
             }
+            // The loops do not use the Python C API: let other threads run.
+            Py_BEGIN_ALLOW_THREADS
             %(omp_parallel)s
             // first loop over non-pooling dimensions
             for (int t=0; t<non_pooling_prod; t++)
@@ -1721,12 +1729,13 @@ class AveragePoolGrad(PoolGrad):
 
         ccode += """
             } // for loop over non-pooling dimensions
+            Py_END_ALLOW_THREADS
         } // if z_prod
         """
         return ccode % locals()
 
     def c_code_cache_version(self):
-        return (0, 3, self.openmp)
+        return (0, 4, self.openmp)
 
 
 class DownsampleFactorMaxGradGrad(OpenMPOp):
@@ -1932,6 +1941,8 @@ class DownsampleFactorMaxGradGrad(OpenMPOp):
         {
             non_pooling_prod *= PyArray_DIMS(%(x)s)[i];
         }
+        // The loops do not use the Python C API: let other threads run.
+        Py_BEGIN_ALLOW_THREADS
         %(omp_parallel)s
         // first loop over non-pooling dimensions
         for (int t=0; t<non_pooling_prod; t++)
@@ -2020,11 +2031,12 @@ class DownsampleFactorMaxGradGrad(OpenMPOp):
 
         ccode += """
           } // for loop over non-pooling dimensions
+          Py_END_ALLOW_THREADS
         """
         return ccode % locals()
 
     def c_code_cache_version(self):
-        return (0, 4, self.openmp)
+        return (0, 5, self.openmp)
 
 
 class MaxPoolRop(OpenMPOp):
@@ -2329,6 +2341,8 @@ class MaxPoolRop(OpenMPOp):
             {
                 non_pooling_prod *= PyArray_DIMS(%(x)s)[i];
             }
+            // The loops do not use the Python C API: let other threads run.
+            Py_BEGIN_ALLOW_THREADS
             %(omp_parallel)s
             // first loop over non-pooling dimensions
             for (int t=0; t<non_pooling_prod; t++)
@@ -2432,9 +2446,10 @@ class MaxPoolRop(OpenMPOp):
 
         ccode += """
           } // for loop over non-pooling dimensions
+          Py_END_ALLOW_THREADS
         } // if z_prod
         """
         return ccode % locals()
 
     def c_code_cache_version(self):
-        return (0, self.openmp)
+        return (1, self.openmp)
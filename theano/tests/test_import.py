@@ -0,0 +1,59 @@
+from __future__ import absolute_import, print_function, division
+import os
+import subprocess
+import sys
+
+from nose.plugins.skip import SkipTest
+
+import theano
+
+
+def run_python(*args):
+    root = os.path.dirname(os.path.dirname(theano.__file__))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p])
+    out = subprocess.check_output([sys.executable] + list(args), env=env,
+                                  stderr=subprocess.STDOUT)
+    return out.decode()
+
+
+def test_lazy_import():
+    if sys.version_info < (3, 5):
+        raise SkipTest("Lazy attributes of theano need Python 3.5")
+    out = run_python('-c', """
+import sys
+import theano
+lazy = ['theano.scan_module', 'theano.sparse', 'scipy.stats', 'scipy.signal']
+print(' '.join(m for m in lazy if m in sys.modules))
+x = theano.tensor.vector()
+theano.scan(lambda v: v * 2, sequences=x)
+print(theano.sparse.csr_matrix().type)
+print('theano.scan_module' in sys.modules and 'theano.sparse' in sys.modules)
+""")
+    loaded, sparse_type, after = out.splitlines()[-3:]
+    assert loaded == '', loaded
+    assert sparse_type.startswith('Sparse'), sparse_type
+    assert after == 'True'
+    assert 'scan' in dir(theano)
+    from theano import scan
+    assert scan is theano.scan_module.scan
+
+
+def test_import_time():
+    # Catch modules that get slow to import, or that get imported by
+    # theano while they are only needed by some graphs.
+    if sys.version_info < (3, 4):
+        raise SkipTest("The import time is only measured on Python 3.4")
+    script = os.path.join(os.path.dirname(theano.__file__), 'misc',
+                          'importtime.py')
+    out = run_python(script, 'theano')
+    lines = out.splitlines()
+    modules = [l.split('|')[2].strip() for l in lines
+               if l.startswith('import time:')][1:]
+    assert 'theano' in modules
+    for m in ['theano.scan_module', 'theano.sparse', 'scipy.stats']:
+        assert m not in modules, m
+    total = float(lines[-1].split(':')[1].strip()[:-1])
+    # Very large, so that it does not fail on slow test machines.
+    assert total < 30, total